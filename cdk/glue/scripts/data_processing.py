@@ -74,6 +74,10 @@ try:
     RDS_PROXY_ENDPOINT = args['rds_proxy_endpoint']
     EMBEDDING_MODEL_ID = args['embedding_model_id']
     JOB_ID = args['job_id']  # Job ID from jobProcessor
+    # Optional: practice material pool job to start once the textbook is indexed
+    PRACTICE_POOL_JOB_NAME = None
+    if '--practice_pool_job_name' in sys.argv:
+        PRACTICE_POOL_JOB_NAME = getResolvedOptions(sys.argv, ['practice_pool_job_name'])['practice_pool_job_name'] or None
         
     # Parse the SQS message body
     sqs_data = json.loads(args['sqs_message_body'])
@@ -1279,6 +1283,155 @@ def process_image_embeddings(image_data_list, vector_store, textbook_id, book_ti
     
     logger.info(f"Image embedding complete! Successfully processed: {successful_count}, Failed: {failed_count}")
 
+# Vector index maintenance
+# Collections with at least this many chunks get their own partial HNSW index;
+# smaller ones are served by the collection_id btree (see migration 018).
+HNSW_MIN_CHUNKS = 1000
+EMBEDDING_DIMENSIONS = 1536  # Cohere Embed v4 default output dimension
+
+
+def _execute_autocommit(query, params=None):
+    """Run a statement outside a transaction (required for CREATE INDEX CONCURRENTLY)."""
+    conn = connect_to_db()
+    previous_autocommit = conn.autocommit
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(query, params)
+    finally:
+        conn.autocommit = previous_autocommit
+
+
+def _drop_invalid_index(index_name):
+    """
+    Drop index_name if an interrupted CREATE INDEX CONCURRENTLY left it INVALID.
+    
+    IF NOT EXISTS treats an invalid index as present, so it would never be
+    rebuilt. Indexes another session is still building are left alone.
+    """
+    invalid = execute_query(
+        """
+        SELECT 1
+        FROM pg_index x
+        JOIN pg_class c ON c.oid = x.indexrelid
+        WHERE c.relname = %s
+            AND NOT x.indisvalid
+            AND NOT EXISTS (
+                SELECT 1 FROM pg_stat_progress_create_index p
+                WHERE p.index_relid = x.indexrelid
+            )
+        """,
+        (index_name,),
+        fetch_one=True
+    )
+    if invalid:
+        logger.warning(f"Index {index_name} is INVALID (interrupted build), dropping it to rebuild")
+        _execute_autocommit(f'DROP INDEX CONCURRENTLY IF EXISTS "{index_name}"')
+
+
+def maintain_vector_indexes(textbook_id):
+    """
+    Build and maintain the pgvector indexes used by chat retrieval.
+    
+    Runs after a textbook's chunks and images are embedded:
+    - ensures the collection_id btree exists
+    - builds a partial HNSW index for this textbook's collection once it is
+      large enough to benefit from one
+    - drops partial HNSW indexes left behind by deleted or re-ingested collections
+    - refreshes planner statistics
+    
+    Indexes are built CONCURRENTLY so chat retrieval and other ingestion jobs
+    are not blocked while the graph is built.
+    """
+    try:
+        logger.info(f"Maintaining vector indexes for textbook {textbook_id}...")
+        
+        _drop_invalid_index("idx_langchain_pg_embedding_collection_id")
+        _execute_autocommit(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_langchain_pg_embedding_collection_id "
+            "ON langchain_pg_embedding (collection_id)"
+        )
+        
+        result = execute_query(
+            """
+            SELECT c.uuid, COUNT(e.id)
+            FROM langchain_pg_collection c
+            LEFT JOIN langchain_pg_embedding e ON e.collection_id = c.uuid
+            WHERE c.name = %s
+            GROUP BY c.uuid
+            """,
+            (str(textbook_id),),
+            fetch_one=True
+        )
+        
+        if result:
+            collection_uuid, chunk_count = str(result[0]), result[1]
+            index_name = f"idx_lpe_hnsw_{collection_uuid.replace('-', '')}"
+            
+            if chunk_count >= HNSW_MIN_CHUNKS:
+                logger.info(f"Building HNSW index {index_name} for {chunk_count} chunks...")
+                start = time.time()
+                _drop_invalid_index(index_name)
+                # Session setting on the shared connection; reset once the build is done
+                _execute_autocommit("SET maintenance_work_mem = '512MB'")
+                try:
+                    # The collection UUID comes from the database, not user input
+                    _execute_autocommit(
+                        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name} "
+                        f"ON langchain_pg_embedding "
+                        f"USING hnsw ((embedding::vector({EMBEDDING_DIMENSIONS})) vector_cosine_ops) "
+                        f"WITH (m = 16, ef_construction = 64) "
+                        f"WHERE collection_id = '{collection_uuid}'"
+                    )
+                finally:
+                    _execute_autocommit("RESET maintenance_work_mem")
+                logger.info(f"HNSW index {index_name} ready in {time.time() - start:.1f}s")
+            else:
+                logger.info(f"Collection has {chunk_count} chunks (< {HNSW_MIN_CHUNKS}), btree index is sufficient")
+        
+        # Drop partial indexes whose collection no longer exists
+        orphaned = execute_query(
+            """
+            SELECT i.indexname
+            FROM pg_indexes i
+            WHERE i.tablename = 'langchain_pg_embedding'
+                AND i.indexname LIKE 'idx_lpe_hnsw_%'
+                AND NOT EXISTS (
+                    SELECT 1 FROM langchain_pg_collection c
+                    WHERE 'idx_lpe_hnsw_' || replace(c.uuid::text, '-', '') = i.indexname
+                )
+            """
+        ) or []
+        for (orphan_index,) in orphaned:
+            logger.info(f"Dropping orphaned HNSW index {orphan_index}")
+            _execute_autocommit(f'DROP INDEX CONCURRENTLY IF EXISTS "{orphan_index}"')
+        
+        execute_query("ANALYZE langchain_pg_embedding")
+        logger.info("Vector index maintenance complete")
+        
+    except Exception as e:
+        # Retrieval still works (more slowly) without the indexes
+        logger.error(f"Error maintaining vector indexes: {e}")
+
+
+def start_practice_pool_job(textbook_id):
+    """
+    Start the practice material pool job for this textbook so its sections get
+    pre-generated items. The nightly pool run catches up if this fails.
+    """
+    if not PRACTICE_POOL_JOB_NAME:
+        return
+    try:
+        glue_client = boto3.client("glue", region_name=args['region_name'])
+        response = glue_client.start_job_run(
+            JobName=PRACTICE_POOL_JOB_NAME,
+            Arguments={'--textbook_id': str(textbook_id)}
+        )
+        logger.info(f"Started practice pool job run {response['JobRunId']} for textbook {textbook_id}")
+    except Exception as e:
+        logger.error(f"Error starting practice pool job: {e}")
+
+
 def process_chapter(chapter_url, base_url, book_metadata):
     """Process a single chapter and return text content and metadata"""
     try:
@@ -1618,6 +1771,11 @@ def main():
                 logger.error(f"Error processing image embeddings: {e}")
                 # Continue to show results even if image processing fails
         
+        # Build/refresh ANN indexes now that the collection is fully loaded
+        if vector_store and extracted_chapters:
+            maintain_vector_indexes(textbook_id)
+            start_practice_pool_job(textbook_id)
+        
         if not extracted_chapters:
             logger.warning("No chapters were successfully processed")
             return
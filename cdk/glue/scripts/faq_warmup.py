@@ -0,0 +1,381 @@
+"""
+FAQ Warm-up Job for OER Textbook Chat
+Preloads faq_cache from clusters of frequently asked questions in user_interactions
+"""
+
+import boto3
+import json
+import psycopg2
+import re
+import sys
+import logging
+import numpy as np
+from collections import defaultdict
+from datetime import datetime
+from psycopg2.extras import execute_values
+from langchain_aws import BedrockEmbeddings
+from awsglue.utils import getResolvedOptions
+from awsglue.context import GlueContext
+from pyspark.context import SparkContext
+from typing import List, Dict, Optional
+
+# Global variables
+connection = None
+db_secret = None
+embeddings = None
+
+# Database configuration
+DB_SECRET_NAME = None
+RDS_PROXY_ENDPOINT = None
+EMBEDDING_MODEL_ID = None
+
+# Must match the textGeneration FAQ cache (helpers/faq_cache.py)
+SIMILARITY_THRESHOLD = 0.85
+MAX_CACHE_SIZE = 100
+# Same rule generate_and_cache_response uses before caching an answer
+MIN_ANSWER_CHARS = 50
+# Cohere Embed v4 accepts at most 96 texts per request
+EMBED_BATCH_SIZE = 96
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+print("=== FAQ WARM-UP JOB START ===")
+
+# Get job parameters
+try:
+    args = getResolvedOptions(sys.argv, [
+        'region_name',
+        'GLUE_BUCKET',
+        'rds_secret',
+        'rds_proxy_endpoint',
+        'embedding_model_id',
+        'lookback_days',
+        'min_cluster_size',
+        'max_questions_per_textbook',
+        'textbook_id',
+        'dry_run'
+    ])
+    sc = SparkContext()
+    glueContext = GlueContext(sc)
+    print("=== JOB PARAMETERS ===")
+    for key, value in args.items():
+        print(f"{key}: {value}")
+
+    # Initialize database configuration
+    DB_SECRET_NAME = args['rds_secret']
+    RDS_PROXY_ENDPOINT = args['rds_proxy_endpoint']
+    EMBEDDING_MODEL_ID = args['embedding_model_id']
+
+    LOOKBACK_DAYS = int(args['lookback_days'])
+    MIN_CLUSTER_SIZE = int(args['min_cluster_size'])
+    MAX_QUESTIONS_PER_TEXTBOOK = int(args['max_questions_per_textbook'])
+    # "all" (or empty) warms every textbook with recent interactions
+    TEXTBOOK_ID = args['textbook_id'] if args['textbook_id'] not in ("", "all") else None
+    DRY_RUN = args['dry_run'].lower() == "true"
+
+except Exception as e:
+    print(f"Error parsing arguments: {e}")
+    sys.exit(1)
+
+
+# Initialize AWS clients
+secrets_manager = boto3.client("secretsmanager", region_name=args['region_name'])
+s3_client = boto3.client("s3", region_name=args['region_name'])
+
+def get_secret(secret_name, expect_json=True):
+    global db_secret
+    if db_secret is None:
+        try:
+            response = secrets_manager.get_secret_value(SecretId=secret_name)["SecretString"]
+            db_secret = json.loads(response) if expect_json else response
+        except Exception as e:
+            logger.error(f"Error fetching secret: {e}")
+            raise
+    return db_secret
+
+def connect_to_db():
+    global connection
+    if connection is None or connection.closed:
+        try:
+            secret = get_secret(DB_SECRET_NAME)
+            connection = psycopg2.connect(
+                dbname=secret["dbname"],
+                user=secret["username"],
+                password=secret["password"],
+                host=RDS_PROXY_ENDPOINT,
+                port=int(secret["port"])
+            )
+            logger.info("Connected to the database!")
+        except Exception as e:
+            logger.error(f"Failed to connect to database: {e}")
+            raise
+    return connection
+
+def get_embeddings():
+    """
+    Bedrock embeddings configured exactly like the textGeneration Lambda, so
+    preloaded FAQ vectors are comparable with the ones it computes at runtime.
+    """
+    global embeddings
+    if embeddings is None:
+        logger.info(f"Initializing Bedrock embeddings with model: {EMBEDDING_MODEL_ID}")
+        embeddings = BedrockEmbeddings(
+            model_id=EMBEDDING_MODEL_ID,
+            region_name='us-east-1',  # Cohere Embed v4 only available in us-east-1
+            model_kwargs={"input_type": "search_document"}
+        )
+    return embeddings
+
+def normalize_question(question: str) -> str:
+    """Same normalization as the exact-match tiers of the FAQ cache"""
+    if not question:
+        return ""
+    normalized = question.lower().strip()
+    normalized = re.sub(r'[^\w\s-]', '', normalized)
+    normalized = re.sub(r'\s+', ' ', normalized)
+    return normalized.strip()
+
+def embed_batch(texts: List[str]) -> np.ndarray:
+    """Embed texts in batches and return unit-length rows (dot product = cosine similarity)"""
+    vectors = []
+    for start in range(0, len(texts), EMBED_BATCH_SIZE):
+        vectors.extend(get_embeddings().embed_documents(texts[start:start + EMBED_BATCH_SIZE]))
+    return unit_rows(np.array(vectors, dtype=np.float32))
+
+def unit_rows(matrix: np.ndarray) -> np.ndarray:
+    if matrix.size == 0:
+        return matrix
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def fetch_questions() -> Dict[str, List[Dict]]:
+    """
+    Group recent interactions by textbook and normalized question.
+
+    Returns:
+        textbook_id -> list of {"question", "asks", "answer", "sources"}, most
+        asked first. The answer is the most recent one that would have been
+        cached at runtime (long enough and grounded in sources), if any.
+    """
+    query = """
+        SELECT cs.textbook_id, ui.query_text, ui.response_text, ui.source_chunks
+        FROM user_interactions ui
+        JOIN chat_sessions cs ON cs.id = ui.chat_session_id
+        WHERE ui.created_at >= NOW() - make_interval(days => %s)
+            AND ui.sender_role = 'User'
+            AND ui.query_text IS NOT NULL
+            AND cs.textbook_id IS NOT NULL
+    """
+    params = [LOOKBACK_DAYS]
+    if TEXTBOOK_ID:
+        query += " AND cs.textbook_id = %s"
+        params.append(TEXTBOOK_ID)
+    query += " ORDER BY ui.created_at DESC"
+
+    conn = connect_to_db()
+    grouped = defaultdict(dict)
+    with conn.cursor(name="faq_warmup_interactions") as cur:
+        cur.itersize = 5000
+        cur.execute(query, params)
+        for textbook_id, query_text, response_text, source_chunks in cur:
+            key = normalize_question(query_text)
+            if not key:
+                continue
+            entry = grouped[str(textbook_id)].setdefault(
+                key, {"question": query_text.strip(), "asks": 0, "answer": None, "sources": []}
+            )
+            entry["asks"] += 1
+            # Rows are newest first, so the first eligible answer is the most recent
+            sources = source_chunks if isinstance(source_chunks, list) else json.loads(source_chunks or "[]")
+            if entry["answer"] is None and response_text and len(response_text) > MIN_ANSWER_CHARS and sources:
+                entry["answer"] = response_text
+                entry["sources"] = sources
+    conn.commit()
+
+    result = {}
+    for textbook_id, questions in grouped.items():
+        ranked = sorted(questions.values(), key=lambda q: q["asks"], reverse=True)
+        result[textbook_id] = ranked[:MAX_QUESTIONS_PER_TEXTBOOK]
+    return result
+
+def fetch_existing_faqs(textbook_id: str) -> np.ndarray:
+    """Return the unit-length embeddings already cached for a textbook"""
+    conn = connect_to_db()
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT embedding::text FROM faq_cache WHERE textbook_id = %s AND embedding IS NOT NULL",
+            (textbook_id,)
+        )
+        rows = cur.fetchall()
+    conn.commit()
+    return unit_rows(np.array([json.loads(row[0]) for row in rows], dtype=np.float32))
+
+def cluster_questions(vectors: np.ndarray) -> List[List[int]]:
+    """
+    Greedy leader clustering. Questions arrive most asked first; each joins the
+    first cluster whose leader it matches at the FAQ cache threshold, or starts
+    a new one. The leader is therefore the most asked phrasing of the cluster.
+    """
+    clusters: List[List[int]] = []
+    leaders: List[np.ndarray] = []
+    for index, vector in enumerate(vectors):
+        if leaders:
+            similarities = np.stack(leaders) @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] >= SIMILARITY_THRESHOLD:
+                clusters[best].append(index)
+                continue
+        clusters.append([index])
+        leaders.append(vector)
+    return clusters
+
+def covered(vectors: np.ndarray, faq_vectors: np.ndarray) -> np.ndarray:
+    """Boolean mask of questions a semantic lookup against faq_vectors would answer"""
+    if faq_vectors.size == 0 or vectors.size == 0:
+        return np.zeros(len(vectors), dtype=bool)
+    return (vectors @ faq_vectors.T).max(axis=1) >= SIMILARITY_THRESHOLD
+
+def warm_textbook(textbook_id: str, questions: List[Dict]) -> Optional[Dict]:
+    """Cluster one textbook's questions, preload new FAQs and return its report"""
+    total_asks = sum(q["asks"] for q in questions)
+    if total_asks == 0:
+        return None
+
+    vectors = embed_batch([q["question"] for q in questions])
+    existing = fetch_existing_faqs(textbook_id)
+    covered_now = covered(vectors, existing)
+
+    # Candidate FAQs: frequent clusters the cache does not answer yet, with a
+    # cacheable answer from one of their members (the leader's if it has one)
+    candidates = []
+    for members in cluster_questions(vectors):
+        leader = members[0]
+        asks = sum(questions[i]["asks"] for i in members)
+        if asks < MIN_CLUSTER_SIZE or covered_now[leader]:
+            continue
+        answered = next((i for i in members if questions[i]["answer"]), None)
+        if answered is None:
+            continue
+        candidates.append({"leader": leader, "answered": answered, "asks": asks, "size": len(members)})
+
+    capacity = max(MAX_CACHE_SIZE - len(existing), 0)
+    candidates.sort(key=lambda c: c["asks"], reverse=True)
+    selected = candidates[:capacity]
+
+    new_vectors = vectors[[c["leader"] for c in selected]] if selected else np.zeros((0, vectors.shape[1]))
+    covered_after = covered_now | covered(vectors, new_vectors)
+    asks = np.array([q["asks"] for q in questions])
+    current_hit_rate = float(asks[covered_now].sum()) / total_asks
+    projected_hit_rate = float(asks[covered_after].sum()) / total_asks
+
+    if selected and not DRY_RUN:
+        rows = []
+        for candidate in selected:
+            leader = questions[candidate["leader"]]
+            answered = questions[candidate["answered"]]
+            rows.append((
+                textbook_id,
+                leader["question"],
+                answered["answer"],
+                "[" + ",".join(map(str, vectors[candidate["leader"]])) + "]",
+                json.dumps(answered["sources"]),
+                # Observed demand, so eviction treats warmed FAQs like organic ones
+                candidate["asks"],
+                json.dumps({"source": "warmup", "cluster_size": candidate["size"], "asks": candidate["asks"]}),
+            ))
+        conn = connect_to_db()
+        try:
+            with conn.cursor() as cur:
+                execute_values(
+                    cur,
+                    """
+                    INSERT INTO faq_cache
+                    (textbook_id, question_text, answer_text, embedding, sources, usage_count, metadata)
+                    VALUES %s
+                    """,
+                    rows,
+                    template="(%s, %s, %s, %s::vector, %s::json, %s, %s::json)"
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    report = {
+        "textbook_id": textbook_id,
+        "asks": total_asks,
+        "distinct_questions": len(questions),
+        "existing_faqs": len(existing),
+        "candidate_faqs": len(candidates),
+        "preloaded_faqs": 0 if DRY_RUN else len(selected),
+        "current_hit_rate": round(current_hit_rate, 4),
+        "projected_hit_rate": round(projected_hit_rate, 4),
+        "projected_uplift": round(projected_hit_rate - current_hit_rate, 4),
+    }
+    logger.info(f"FAQ warm-up for textbook {textbook_id}: {json.dumps(report)}")
+    return report
+
+def write_report(reports: List[Dict]) -> Dict:
+    """Summarize per-textbook results and store the report in the Glue bucket"""
+    total_asks = sum(r["asks"] for r in reports)
+    summary = {
+        "run_at": datetime.utcnow().isoformat(),
+        "lookback_days": LOOKBACK_DAYS,
+        "dry_run": DRY_RUN,
+        "textbooks": len(reports),
+        "preloaded_faqs": sum(r["preloaded_faqs"] for r in reports),
+        # Hit rates weighted by asks across all textbooks
+        "current_hit_rate": round(sum(r["current_hit_rate"] * r["asks"] for r in reports) / total_asks, 4) if total_asks else 0,
+        "projected_hit_rate": round(sum(r["projected_hit_rate"] * r["asks"] for r in reports) / total_asks, 4) if total_asks else 0,
+        "per_textbook": reports,
+    }
+    summary["projected_uplift"] = round(summary["projected_hit_rate"] - summary["current_hit_rate"], 4)
+
+    key = f"reports/faq_warmup/{datetime.utcnow().strftime('%Y-%m-%dT%H-%M-%S')}.json"
+    try:
+        s3_client.put_object(Bucket=args['GLUE_BUCKET'], Key=key, Body=json.dumps(summary, indent=2))
+        logger.info(f"Report written to s3://{args['GLUE_BUCKET']}/{key}")
+    except Exception as e:
+        logger.error(f"Error writing report: {e}")
+    return summary
+
+# Main execution
+try:
+    logger.info("Starting FAQ warm-up...")
+
+    questions_by_textbook = fetch_questions()
+    logger.info(f"Found questions for {len(questions_by_textbook)} textbook(s)")
+
+    reports = []
+    for textbook_id, questions in questions_by_textbook.items():
+        try:
+            report = warm_textbook(textbook_id, questions)
+            if report:
+                reports.append(report)
+        except Exception as e:
+            # One failing textbook should not stop the rest
+            logger.error(f"FAQ warm-up failed for textbook {textbook_id}: {e}")
+
+    summary = write_report(reports)
+    print(
+        f"FAQ warm-up completed: {summary['preloaded_faqs']} FAQ(s) preloaded, "
+        f"projected hit rate {summary['current_hit_rate']:.1%} -> {summary['projected_hit_rate']:.1%}"
+    )
+
+except Exception as e:
+    logger.error(f"FAQ warm-up failed: {e}")
+    import traceback
+    traceback.print_exc()
+    sys.exit(1)
+finally:
+    if connection and not connection.closed:
+        connection.close()
+        logger.info("Database connection closed")
+    if sc:
+        sc.stop()
+        logger.info("Spark context stopped")
+
+print("=== FAQ WARM-UP JOB END ===")
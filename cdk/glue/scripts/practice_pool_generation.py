@@ -0,0 +1,479 @@
+"""
+Practice Material Pool Job for OER Textbook Chat
+Pre-generates validated MCQs, flashcards and short-answer items per section
+into practice_material_pool, so common practice requests are served without
+retrieval or a live LLM call
+"""
+
+import boto3
+import json
+import psycopg2
+import re
+import sys
+import logging
+from datetime import datetime
+from psycopg2.extras import execute_values
+from langchain_aws import BedrockEmbeddings, ChatBedrock
+from awsglue.utils import getResolvedOptions
+from awsglue.context import GlueContext
+from pyspark.context import SparkContext
+from typing import Any, Dict, List
+
+# Prompt builders and item validators of the practiceMaterial Lambda, shipped
+# with --extra-py-files so pool items are generated and checked exactly like
+# live ones (the Lambda re-validates pool sets with the same rules)
+from mcq import build_mcq_prompt, validate_mcq_item
+from flashcard import build_flashcard_prompt, validate_flashcard_item
+from short_answer import build_short_answer_prompt, validate_short_answer_item
+
+# Global variables
+connection = None
+db_secret = None
+embeddings = None
+llm = None
+
+# Database configuration
+DB_SECRET_NAME = None
+RDS_PROXY_ENDPOINT = None
+EMBEDDING_MODEL_ID = None
+LLM_MODEL_ID = None
+
+# Must match the practiceMaterial Lambda (model parameters and the
+# extra_params of its cache keys: numOptions for mcq, cardType for flashcards)
+LLM_MODEL_KWARGS = {"temperature": 0.6, "max_tokens": 4096, "top_p": 0.9}
+MCQ_NUM_OPTIONS = 4
+FLASHCARD_CARD_TYPE = "definition"
+# Section text given to the model: first chunks of the section, trimmed
+MAX_CONTEXT_CHUNKS = 6
+MAX_CHUNK_CHARS = 500
+# Cohere Embed v4 accepts at most 96 texts per request
+EMBED_BATCH_SIZE = 96
+# Scheduled runs (all textbooks) leave out sections attempted more recently
+# than this, e.g. sections without indexed chunks or with no valid items
+RETRY_AFTER_DAYS = 7
+# A section claimed by a run that has not recorded an outcome after this long
+# (the job timeout) is treated as abandoned and can be claimed again
+CLAIM_TIMEOUT_HOURS = 8
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+print("=== PRACTICE MATERIAL POOL JOB START ===")
+
+# Get job parameters
+try:
+    args = getResolvedOptions(sys.argv, [
+        'region_name',
+        'GLUE_BUCKET',
+        'rds_secret',
+        'rds_proxy_endpoint',
+        'embedding_model_id',
+        'llm_model_id',
+        'bedrock_region',
+        'textbook_id',
+        'difficulties',
+        'items_per_type',
+        'max_sections_per_run',
+        'refresh',
+        'dry_run'
+    ])
+    sc = SparkContext()
+    glueContext = GlueContext(sc)
+    print("=== JOB PARAMETERS ===")
+    for key, value in args.items():
+        print(f"{key}: {value}")
+
+    # Initialize database configuration
+    DB_SECRET_NAME = args['rds_secret']
+    RDS_PROXY_ENDPOINT = args['rds_proxy_endpoint']
+    EMBEDDING_MODEL_ID = args['embedding_model_id']
+    LLM_MODEL_ID = args['llm_model_id']
+
+    # "all" (or empty) fills the pool for every textbook
+    TEXTBOOK_ID = args['textbook_id'] if args['textbook_id'] not in ("", "all") else None
+    DIFFICULTIES = [d.strip().lower() for d in args['difficulties'].split(",") if d.strip()]
+    ITEMS_PER_TYPE = int(args['items_per_type'])
+    MAX_SECTIONS_PER_RUN = int(args['max_sections_per_run'])
+    # Without refresh, sections that already have pool items are skipped
+    REFRESH = args['refresh'].lower() == "true"
+    DRY_RUN = args['dry_run'].lower() == "true"
+
+except Exception as e:
+    print(f"Error parsing arguments: {e}")
+    sys.exit(1)
+
+
+# Initialize AWS clients
+secrets_manager = boto3.client("secretsmanager", region_name=args['region_name'])
+s3_client = boto3.client("s3", region_name=args['region_name'])
+
+def get_secret(secret_name, expect_json=True):
+    global db_secret
+    if db_secret is None:
+        try:
+            response = secrets_manager.get_secret_value(SecretId=secret_name)["SecretString"]
+            db_secret = json.loads(response) if expect_json else response
+        except Exception as e:
+            logger.error(f"Error fetching secret: {e}")
+            raise
+    return db_secret
+
+def connect_to_db():
+    global connection
+    if connection is None or connection.closed:
+        try:
+            secret = get_secret(DB_SECRET_NAME)
+            connection = psycopg2.connect(
+                dbname=secret["dbname"],
+                user=secret["username"],
+                password=secret["password"],
+                host=RDS_PROXY_ENDPOINT,
+                port=int(secret["port"])
+            )
+            logger.info("Connected to the database!")
+        except Exception as e:
+            logger.error(f"Failed to connect to database: {e}")
+            raise
+    return connection
+
+def get_embeddings():
+    """
+    Document embeddings for pool items; the Lambda embeds the requested topic
+    as a search query against them.
+    """
+    global embeddings
+    if embeddings is None:
+        logger.info(f"Initializing Bedrock embeddings with model: {EMBEDDING_MODEL_ID}")
+        embeddings = BedrockEmbeddings(
+            model_id=EMBEDDING_MODEL_ID,
+            region_name='us-east-1',  # Cohere Embed v4 only available in us-east-1
+            model_kwargs={"input_type": "search_document"}
+        )
+    return embeddings
+
+def get_llm():
+    global llm
+    if llm is None:
+        logger.info(f"Initializing ChatBedrock with model: {LLM_MODEL_ID}")
+        llm = ChatBedrock(
+            model_id=LLM_MODEL_ID,
+            region_name=args['bedrock_region'],
+            model_kwargs=LLM_MODEL_KWARGS
+        )
+    return llm
+
+def embed_batch(texts: List[str]) -> List[List[float]]:
+    vectors = []
+    for start in range(0, len(texts), EMBED_BATCH_SIZE):
+        vectors.extend(get_embeddings().embed_documents(texts[start:start + EMBED_BATCH_SIZE]))
+    return vectors
+
+def fetch_sections() -> List[Dict]:
+    """Sections to generate items for: never attempted first, then least recently attempted"""
+    query = """
+        SELECT s.id, s.textbook_id, s.title, s.source_url
+        FROM sections s
+        JOIN textbooks t ON t.id = s.textbook_id
+        LEFT JOIN practice_pool_section_attempts a ON a.section_id = s.id
+        WHERE s.title IS NOT NULL
+    """
+    params = []
+    if TEXTBOOK_ID:
+        # Started after ingestion: sections skipped before may have chunks now
+        query += " AND s.textbook_id = %s"
+        params.append(TEXTBOOK_ID)
+    else:
+        query += " AND (a.attempted_at IS NULL OR a.attempted_at < now() - make_interval(days => %s))"
+        params.append(RETRY_AFTER_DAYS)
+    if not REFRESH:
+        query += " AND NOT EXISTS (SELECT 1 FROM practice_material_pool p WHERE p.section_id = s.id)"
+    query += " ORDER BY a.attempted_at NULLS FIRST, s.textbook_id, s.order_index LIMIT %s"
+    params.append(MAX_SECTIONS_PER_RUN)
+
+    conn = connect_to_db()
+    with conn.cursor() as cur:
+        cur.execute(query, params)
+        rows = cur.fetchall()
+    conn.commit()
+    return [
+        {"id": str(row[0]), "textbook_id": str(row[1]), "title": row[2], "source_url": row[3]}
+        for row in rows
+    ]
+
+def fetch_section_context(section: Dict) -> List[str]:
+    """First chunks of the section from the textbook's vector collection"""
+    conn = connect_to_db()
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT e.document
+            FROM langchain_pg_embedding e
+            JOIN langchain_pg_collection c ON c.uuid = e.collection_id
+            WHERE c.name = %s AND e.cmetadata->>'section_id' = %s
+            LIMIT %s
+            """,
+            (section["textbook_id"], section["id"], MAX_CONTEXT_CHUNKS)
+        )
+        rows = cur.fetchall()
+    conn.commit()
+    return [row[0].strip()[:MAX_CHUNK_CHARS] for row in rows if row[0] and row[0].strip()]
+
+# ---------------------------------------------------------------------------
+# Prompts and item validation (same item shapes as the practiceMaterial
+# generators, so pool items can be served in place of live generation)
+# ---------------------------------------------------------------------------
+
+def build_prompt(material_type: str, topic: str, difficulty: str, count: int, snippets: List[str]) -> str:
+    """Same prompt as live generation with the pool's type-specific parameters"""
+    if material_type == "mcq":
+        return build_mcq_prompt(topic, difficulty, count, MCQ_NUM_OPTIONS, snippets)
+    if material_type == "flashcard":
+        return build_flashcard_prompt(topic, difficulty, count, FLASHCARD_CARD_TYPE, snippets)
+    return build_short_answer_prompt(topic, difficulty, count, snippets)
+
+def validate_item(material_type: str, item: Any, idx: int) -> bool:
+    """Check one item with the generator's item validator"""
+    try:
+        if material_type == "mcq":
+            validate_mcq_item(item, idx, MCQ_NUM_OPTIONS)
+        elif material_type == "flashcard":
+            validate_flashcard_item(item, idx)
+        else:
+            validate_short_answer_item(item, idx)
+    except ValueError as e:
+        logger.info(f"Rejected {material_type} item: {e}")
+        return False
+    return True
+
+def item_text(item: Dict) -> str:
+    return item.get("questionText") or item.get("front") or ""
+
+def parse_items(output_text: str, material_type: str) -> List[Dict]:
+    """Valid, distinct items from the model output (invalid ones are dropped)"""
+    start, end = output_text.find("{"), output_text.rfind("}")
+    if start == -1 or end <= start:
+        return []
+    try:
+        obj = json.loads(re.sub(r",\s*([}\]])", r"\1", output_text[start:end + 1]))
+    except json.JSONDecodeError as e:
+        logger.warning(f"Unparseable {material_type} output: {e}")
+        return []
+    raw_items = obj.get("cards" if material_type == "flashcard" else "questions") if isinstance(obj, dict) else None
+
+    items, seen = [], set()
+    for idx, item in enumerate(raw_items if isinstance(raw_items, list) else []):
+        if not validate_item(material_type, item, idx):
+            continue
+        key = re.sub(r"\W+", " ", item_text(item).lower()).strip()
+        if key in seen:
+            continue
+        seen.add(key)
+        items.append(item)
+    return items
+
+def extra_params_for(material_type: str) -> str:
+    if material_type == "mcq":
+        return str(MCQ_NUM_OPTIONS)
+    if material_type == "flashcard":
+        return FLASHCARD_CARD_TYPE
+    return ""
+
+def generate_section_pool(section: Dict) -> Dict:
+    """Generate, embed and store the pool for one section; returns its report"""
+    report = {"section_id": section["id"], "title": section["title"], "items": 0, "rejected": 0, "skipped": None}
+    snippets = fetch_section_context(section)
+    if not snippets:
+        report["skipped"] = "no indexed chunks"
+        return report
+
+    rows = []
+    for material_type in ("mcq", "flashcard", "short_answer"):
+        for difficulty in DIFFICULTIES:
+            prompt = build_prompt(material_type, section["title"], difficulty, ITEMS_PER_TYPE, snippets)
+            try:
+                items = parse_items(get_llm().invoke(prompt).content, material_type)
+            except Exception as e:
+                logger.error(f"Generation failed for section {section['id']} ({material_type}, {difficulty}): {e}")
+                items = []
+            report["rejected"] += max(ITEMS_PER_TYPE - len(items), 0)
+            for item in items[:ITEMS_PER_TYPE]:
+                rows.append((material_type, difficulty, item))
+
+    if not rows:
+        return report
+
+    # Section title gives short or generic questions their topical context
+    vectors = embed_batch([f"{section['title']}\n{item_text(item)}" for _, _, item in rows])
+    report["items"] = len(rows)
+    if DRY_RUN:
+        return report
+
+    conn = connect_to_db()
+    try:
+        with conn.cursor() as cur:
+            if REFRESH:
+                cur.execute("DELETE FROM practice_material_pool WHERE section_id = %s", (section["id"],))
+            execute_values(
+                cur,
+                """
+                INSERT INTO practice_material_pool
+                (textbook_id, section_id, material_type, difficulty, extra_params, item, item_text, item_embedding, source_url)
+                VALUES %s
+                """,
+                [
+                    (
+                        section["textbook_id"],
+                        section["id"],
+                        material_type,
+                        difficulty,
+                        extra_params_for(material_type),
+                        json.dumps(item),
+                        item_text(item),
+                        "[" + ",".join(map(str, vector)) + "]",
+                        section["source_url"],
+                    )
+                    for (material_type, difficulty, item), vector in zip(rows, vectors)
+                ],
+                template="(%s, %s, %s, %s, %s, %s::jsonb, %s, %s::vector, %s)"
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return report
+
+def claim_section(section_id: str) -> bool:
+    """
+    Claim a section for this run so overlapping runs (per-textbook runs started
+    after ingestion and the nightly run) don't generate its pool twice.
+
+    Returns:
+        False if another run is working on the section or, without refresh,
+        it got pool items since fetch_sections
+    """
+    if DRY_RUN:
+        return True
+    conn = connect_to_db()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO practice_pool_section_attempts (section_id, status, attempted_at)
+                VALUES (%s, 'running', now())
+                ON CONFLICT (section_id) DO UPDATE
+                SET status = 'running', items = 0, detail = NULL, attempted_at = now()
+                WHERE practice_pool_section_attempts.status <> 'running'
+                    OR practice_pool_section_attempts.attempted_at < now() - make_interval(hours => %s)
+                RETURNING section_id
+                """,
+                (section_id, CLAIM_TIMEOUT_HOURS)
+            )
+            claimed = cur.fetchone() is not None
+            if claimed and not REFRESH:
+                # A run that finished after fetch_sections may have filled it
+                cur.execute("SELECT 1 FROM practice_material_pool WHERE section_id = %s LIMIT 1", (section_id,))
+                if cur.fetchone():
+                    conn.rollback()
+                    return False
+        conn.commit()
+        return claimed
+    except Exception:
+        conn.rollback()
+        raise
+
+def record_attempt(section_id: str, status: str, items: int = 0, detail: str = None):
+    """Record the outcome of this run for a section (ordering and skipping of later runs)"""
+    if DRY_RUN:
+        return
+    conn = connect_to_db()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO practice_pool_section_attempts (section_id, status, items, detail, attempted_at)
+                VALUES (%s, %s, %s, %s, now())
+                ON CONFLICT (section_id) DO UPDATE
+                SET status = EXCLUDED.status,
+                    items = EXCLUDED.items,
+                    detail = EXCLUDED.detail,
+                    attempted_at = EXCLUDED.attempted_at
+                """,
+                (section_id, status, items, detail)
+            )
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Error recording attempt for section {section_id}: {e}")
+
+def write_report(reports: List[Dict]) -> Dict:
+    """Summarize the run and store the report in the Glue bucket"""
+    summary = {
+        "run_at": datetime.utcnow().isoformat(),
+        "textbook_id": TEXTBOOK_ID or "all",
+        "dry_run": DRY_RUN,
+        "refresh": REFRESH,
+        "difficulties": DIFFICULTIES,
+        "items_per_type": ITEMS_PER_TYPE,
+        "sections": len(reports),
+        "sections_skipped": sum(1 for r in reports if r["skipped"]),
+        "items": sum(r["items"] for r in reports),
+        "rejected": sum(r["rejected"] for r in reports),
+        "per_section": reports,
+    }
+
+    key = f"reports/practice_pool/{datetime.utcnow().strftime('%Y-%m-%dT%H-%M-%S')}.json"
+    try:
+        s3_client.put_object(Bucket=args['GLUE_BUCKET'], Key=key, Body=json.dumps(summary, indent=2))
+        logger.info(f"Report written to s3://{args['GLUE_BUCKET']}/{key}")
+    except Exception as e:
+        logger.error(f"Error writing report: {e}")
+    return summary
+
+# Main execution
+try:
+    logger.info("Starting practice material pool generation...")
+
+    sections = fetch_sections()
+    logger.info(f"Found {len(sections)} section(s) to fill")
+
+    reports = []
+    for index, section in enumerate(sections, 1):
+        try:
+            if not claim_section(section["id"]):
+                logger.info(f"Section {index}/{len(sections)}: {section['id']} handled by another run, skipping")
+                continue
+            report = generate_section_pool(section)
+            reports.append(report)
+            logger.info(f"Section {index}/{len(sections)}: {json.dumps(report)}")
+            if report["skipped"]:
+                record_attempt(section["id"], "skipped", detail=report["skipped"])
+            elif report["items"]:
+                record_attempt(section["id"], "filled", items=report["items"])
+            else:
+                record_attempt(section["id"], "failed", detail="no valid items generated")
+        except Exception as e:
+            # One failing section should not stop the rest
+            logger.error(f"Pool generation failed for section {section['id']}: {e}")
+            record_attempt(section["id"], "failed", detail=str(e)[:500])
+
+    summary = write_report(reports)
+    print(
+        f"Practice material pool completed: {summary['items']} item(s) for "
+        f"{summary['sections'] - summary['sections_skipped']} section(s), {summary['rejected']} rejected"
+    )
+
+except Exception as e:
+    logger.error(f"Practice material pool generation failed: {e}")
+    import traceback
+    traceback.print_exc()
+    sys.exit(1)
+finally:
+    if connection and not connection.closed:
+        connection.close()
+        logger.info("Database connection closed")
+    if sc:
+        sc.stop()
+        logger.info("Spark context stopped")
+
+print("=== PRACTICE MATERIAL POOL JOB END ===")
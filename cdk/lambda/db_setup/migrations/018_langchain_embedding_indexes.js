@@ -0,0 +1,76 @@
+/**
+ * Migration: Vector search indexes for langchain_pg_embedding
+ *
+ * The langchain_pg_embedding / langchain_pg_collection tables are created by
+ * PGVector during the first textbook ingestion, so this migration is a no-op on
+ * a fresh database; the ingestion Glue job (data_processing.py) creates the
+ * same indexes after each textbook is embedded.
+ *
+ * - A btree on collection_id so a textbook's chunks are found without scanning
+ *   the whole table.
+ * - A partial HNSW index per large collection (>= 1000 chunks). The embedding
+ *   column is untyped, so the index is built on a vector(1536) cast (Cohere
+ *   Embed v4 dimension). A partial index keeps every textbook's search exact
+ *   within its own graph instead of post-filtering a global one, and smaller
+ *   textbooks are served by the btree alone.
+ */
+
+exports.up = (pgm) => {
+  pgm.sql(`
+    DO $$
+    DECLARE
+      col RECORD;
+    BEGIN
+      IF to_regclass('public.langchain_pg_embedding') IS NULL THEN
+        RAISE NOTICE 'langchain_pg_embedding does not exist yet, skipping vector indexes';
+        RETURN;
+      END IF;
+
+      CREATE INDEX IF NOT EXISTS idx_langchain_pg_embedding_collection_id
+        ON langchain_pg_embedding (collection_id);
+
+      FOR col IN
+        SELECT collection_id, COUNT(*) AS chunk_count
+        FROM langchain_pg_embedding
+        WHERE collection_id IS NOT NULL
+        GROUP BY collection_id
+        HAVING COUNT(*) >= 1000
+      LOOP
+        BEGIN
+          EXECUTE format(
+            'CREATE INDEX IF NOT EXISTS %I ON langchain_pg_embedding '
+            'USING hnsw ((embedding::vector(1536)) vector_cosine_ops) '
+            'WITH (m = 16, ef_construction = 64) WHERE collection_id = %L',
+            'idx_lpe_hnsw_' || replace(col.collection_id::text, '-', ''),
+            col.collection_id
+          );
+        EXCEPTION WHEN others THEN
+          -- e.g. a collection with embeddings of another dimension; the
+          -- btree still serves it
+          RAISE NOTICE 'Skipping HNSW index for collection %: %', col.collection_id, SQLERRM;
+        END;
+      END LOOP;
+
+      ANALYZE langchain_pg_embedding;
+    END$$;
+  `);
+};
+
+exports.down = (pgm) => {
+  pgm.sql(`
+    DO $$
+    DECLARE
+      idx RECORD;
+    BEGIN
+      FOR idx IN
+        SELECT indexname FROM pg_indexes
+        WHERE tablename = 'langchain_pg_embedding'
+          AND indexname LIKE 'idx_lpe_hnsw_%'
+      LOOP
+        EXECUTE format('DROP INDEX IF EXISTS %I', idx.indexname);
+      END LOOP;
+    END$$;
+
+    DROP INDEX IF EXISTS idx_langchain_pg_embedding_collection_id;
+  `);
+};
@@ -0,0 +1,39 @@
+/**
+ * Migration: Typed embedding column and ANN indexes for faq_cache
+ *
+ * 008_vector_faq added an untyped `vector` column, which cannot be indexed.
+ * This fixes the column to the Cohere Embed v4 dimension (1536) and adds:
+ * - an HNSW index (cosine) used by `ORDER BY embedding <=> q LIMIT k` lookups
+ * - a btree on textbook_id for the textbook-scoped filter
+ *
+ * Cached answers with an embedding of a different dimension cannot be matched
+ * by the current model anyway, so they are removed before the type change.
+ */
+
+exports.up = (pgm) => {
+  pgm.sql(`
+    DELETE FROM faq_cache
+    WHERE embedding IS NOT NULL
+      AND vector_dims(embedding) <> 1536;
+
+    ALTER TABLE faq_cache
+    ALTER COLUMN embedding TYPE vector(1536) USING embedding::vector(1536);
+
+    CREATE INDEX IF NOT EXISTS idx_faq_cache_embedding_hnsw
+      ON faq_cache USING hnsw (embedding vector_cosine_ops)
+      WITH (m = 16, ef_construction = 64);
+
+    CREATE INDEX IF NOT EXISTS idx_faq_cache_textbook_id
+      ON faq_cache (textbook_id);
+  `);
+};
+
+exports.down = (pgm) => {
+  pgm.sql(`
+    DROP INDEX IF EXISTS idx_faq_cache_textbook_id;
+    DROP INDEX IF EXISTS idx_faq_cache_embedding_hnsw;
+
+    ALTER TABLE faq_cache
+    ALTER COLUMN embedding TYPE vector;
+  `);
+};
@@ -0,0 +1,54 @@
+/**
+ * Migration: Semantic cache for generated practice material
+ *
+ * The DynamoDB practice material cache is keyed on an MD5 of the normalized
+ * topic, so paraphrased topics ("cell respiration" / "cellular respiration")
+ * always miss. This table stores each generated set with its topic embedding
+ * (Cohere Embed v4, 1536 dimensions) so the closest cached topic for the same
+ * textbook, material type and difficulty can be served instead.
+ */
+
+exports.up = (pgm) => {
+  pgm.sql(`
+    CREATE TABLE IF NOT EXISTS practice_material_cache (
+      id uuid PRIMARY KEY DEFAULT uuid_generate_v4(),
+      textbook_id uuid NOT NULL,
+      material_type varchar(50) NOT NULL,
+      difficulty varchar(20) NOT NULL,
+      extra_params varchar(50) NOT NULL DEFAULT '',
+      topic text NOT NULL,
+      topic_embedding vector(1536) NOT NULL,
+      num_items int NOT NULL,
+      result jsonb NOT NULL,
+      sources jsonb,
+      hit_count int NOT NULL DEFAULT 0,
+      created_at timestamptz DEFAULT now(),
+      expires_at timestamptz NOT NULL
+    );
+
+    ALTER TABLE practice_material_cache
+      ADD CONSTRAINT fk_practice_material_cache_textbook_id
+      FOREIGN KEY (textbook_id)
+      REFERENCES textbooks(id)
+      ON DELETE CASCADE;
+
+    -- Nearest-topic lookups (ORDER BY topic_embedding <=> q LIMIT k)
+    CREATE INDEX IF NOT EXISTS idx_practice_material_cache_embedding_hnsw
+      ON practice_material_cache USING hnsw (topic_embedding vector_cosine_ops)
+      WITH (m = 16, ef_construction = 64);
+
+    -- Scope filter applied to the nearest-topic candidates
+    CREATE INDEX IF NOT EXISTS idx_practice_material_cache_scope
+      ON practice_material_cache (textbook_id, material_type, difficulty);
+
+    COMMENT ON TABLE practice_material_cache IS 'Generated practice material sets, matched by topic embedding similarity';
+    COMMENT ON COLUMN practice_material_cache.extra_params IS 'Type-specific parameters that must match exactly (numOptions for mcq, cardType for flashcards)';
+    COMMENT ON COLUMN practice_material_cache.num_items IS 'Number of questions or cards in result; smaller requests are served a subset';
+  `);
+};
+
+exports.down = (pgm) => {
+  pgm.sql(`
+    DROP TABLE IF EXISTS practice_material_cache CASCADE;
+  `);
+};
@@ -0,0 +1,63 @@
+/**
+ * Migration: Pre-generated practice material pool
+ *
+ * The practice_pool_generation Glue job fills this table with validated
+ * MCQs, flashcards and short-answer items per section. The practiceMaterial
+ * Lambda samples items whose embedding (section title + question/front,
+ * Cohere Embed v4, 1536 dimensions) is close to the requested topic and only
+ * generates live on a pool miss.
+ */
+
+exports.up = (pgm) => {
+  pgm.sql(`
+    CREATE TABLE IF NOT EXISTS practice_material_pool (
+      id uuid PRIMARY KEY DEFAULT uuid_generate_v4(),
+      textbook_id uuid NOT NULL,
+      section_id uuid NOT NULL,
+      material_type varchar(50) NOT NULL,
+      difficulty varchar(20) NOT NULL,
+      extra_params varchar(50) NOT NULL DEFAULT '',
+      item jsonb NOT NULL,
+      item_text text NOT NULL,
+      item_embedding vector(1536) NOT NULL,
+      source_url text,
+      serve_count int NOT NULL DEFAULT 0,
+      created_at timestamptz DEFAULT now()
+    );
+
+    ALTER TABLE practice_material_pool
+      ADD CONSTRAINT fk_practice_material_pool_textbook_id
+      FOREIGN KEY (textbook_id)
+      REFERENCES textbooks(id)
+      ON DELETE CASCADE;
+
+    ALTER TABLE practice_material_pool
+      ADD CONSTRAINT fk_practice_material_pool_section_id
+      FOREIGN KEY (section_id)
+      REFERENCES sections(id)
+      ON DELETE CASCADE;
+
+    -- Nearest-item lookups (ORDER BY item_embedding <=> q LIMIT k)
+    CREATE INDEX IF NOT EXISTS idx_practice_material_pool_embedding_hnsw
+      ON practice_material_pool USING hnsw (item_embedding vector_cosine_ops)
+      WITH (m = 16, ef_construction = 64);
+
+    -- Scope filter applied to the nearest-item candidates
+    CREATE INDEX IF NOT EXISTS idx_practice_material_pool_scope
+      ON practice_material_pool (textbook_id, material_type, difficulty);
+
+    -- Incremental pool generation skips sections that already have items
+    CREATE INDEX IF NOT EXISTS idx_practice_material_pool_section
+      ON practice_material_pool (section_id);
+
+    COMMENT ON TABLE practice_material_pool IS 'Pre-generated, validated practice material items per section';
+    COMMENT ON COLUMN practice_material_pool.item IS 'One question or card in the same shape as live generation';
+    COMMENT ON COLUMN practice_material_pool.extra_params IS 'Type-specific parameters (numOptions for mcq, cardType for flashcards)';
+  `);
+};
+
+exports.down = (pgm) => {
+  pgm.sql(`
+    DROP TABLE IF EXISTS practice_material_pool CASCADE;
+  `);
+};
@@ -0,0 +1,37 @@
+/**
+ * Migration: Practice material pool section attempts
+ *
+ * The practice_pool_generation Glue job records every section it processes,
+ * including sections it skipped (no indexed chunks) or could not generate
+ * items for. Scheduled runs leave recently attempted sections out and pick
+ * the least recently attempted ones first, so those sections don't fill the
+ * per-run section limit every night. A run claims each section here before
+ * generating, so overlapping runs never generate the same section twice.
+ */
+
+exports.up = (pgm) => {
+  pgm.sql(`
+    CREATE TABLE IF NOT EXISTS practice_pool_section_attempts (
+      section_id uuid PRIMARY KEY,
+      status varchar(20) NOT NULL,
+      items int NOT NULL DEFAULT 0,
+      detail text,
+      attempted_at timestamptz NOT NULL DEFAULT now()
+    );
+
+    ALTER TABLE practice_pool_section_attempts
+      ADD CONSTRAINT fk_practice_pool_section_attempts_section_id
+      FOREIGN KEY (section_id)
+      REFERENCES sections(id)
+      ON DELETE CASCADE;
+
+    COMMENT ON TABLE practice_pool_section_attempts IS 'Last practice pool generation attempt per section';
+    COMMENT ON COLUMN practice_pool_section_attempts.status IS 'running (claimed by a run), filled, skipped (no indexed chunks) or failed (no valid items)';
+  `);
+};
+
+exports.down = (pgm) => {
+  pgm.sql(`
+    DROP TABLE IF EXISTS practice_pool_section_attempts CASCADE;
+  `);
+};
@@ -52,6 +52,21 @@ Requirements:
 Output valid JSON now:"""
 
 
+def validate_flashcard_item(card: Any, idx: int) -> Dict[str, Any]:
+    """Validate one card; used for whole decks and for items as they stream."""
+    if not isinstance(card, dict):
+        raise ValueError(f"Card[{idx}] invalid")
+    if not isinstance(card.get("id"), str) or not card["id"].strip():
+        raise ValueError(f"Card[{idx}].id invalid")
+    if not isinstance(card.get("front"), str) or not card["front"].strip():
+        raise ValueError(f"Card[{idx}].front invalid")
+    if not isinstance(card.get("back"), str) or not card["back"].strip():
+        raise ValueError(f"Card[{idx}].back invalid")
+    if not isinstance(card.get("hint"), str):
+        raise ValueError(f"Card[{idx}].hint must be a string (can be empty)")
+    return card
+
+
 def validate_flashcard_shape(obj: Dict[str, Any], num_cards: int) -> Dict[str, Any]:
     if not isinstance(obj, dict):
         raise ValueError("Invalid root JSON")
@@ -61,14 +76,5 @@ def validate_flashcard_shape(obj: Dict[str, Any], num_cards: int) -> Dict[str, A
     if not isinstance(cards, list) or len(cards) != num_cards:
         raise ValueError(f"cards must have exactly {num_cards} items")
     for idx, card in enumerate(cards):
-        if not isinstance(card, dict):
-            raise ValueError(f"Card[{idx}] invalid")
-        if not isinstance(card.get("id"), str) or not card["id"].strip():
-            raise ValueError(f"Card[{idx}].id invalid")
-        if not isinstance(card.get("front"), str) or not card["front"].strip():
-            raise ValueError(f"Card[{idx}].front invalid")
-        if not isinstance(card.get("back"), str) or not card["back"].strip():
-            raise ValueError(f"Card[{idx}].back invalid")
-        if not isinstance(card.get("hint"), str):
-            raise ValueError(f"Card[{idx}].hint must be a string (can be empty)")
+        validate_flashcard_item(card, idx)
     return obj
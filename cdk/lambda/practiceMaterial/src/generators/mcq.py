@@ -52,6 +52,33 @@ Output JSON:"""
 
 
 
+def validate_mcq_item(q: Any, idx: int, num_options: int) -> Dict[str, Any]:
+    """Validate one question; used for whole quizzes and for items as they stream."""
+    valid_ids = {chr(97 + i) for i in range(num_options)}
+    if not isinstance(q, dict):
+        raise ValueError(f"Question[{idx}] invalid")
+    if not isinstance(q.get("id"), str) or not q["id"].strip():
+        raise ValueError(f"Question[{idx}].id invalid")
+    if not isinstance(q.get("questionText"), str) or not q["questionText"].strip():
+        raise ValueError(f"Question[{idx}].questionText invalid")
+    opts = q.get("options")
+    if not isinstance(opts, list) or len(opts) != num_options:
+        raise ValueError(f"Question[{idx}].options must have exactly {num_options} items")
+    for oi, opt in enumerate(opts):
+        if not isinstance(opt, dict):
+            raise ValueError(f"Question[{idx}].options[{oi}] invalid")
+        if opt.get("id") not in valid_ids:
+            raise ValueError(f"Question[{idx}].options[{oi}].id invalid")
+        if not isinstance(opt.get("text"), str) or not opt["text"].strip():
+            raise ValueError(f"Question[{idx}].options[{oi}].text invalid")
+        # Explanation is required to be a string, but can be empty for incorrect answers
+        if not isinstance(opt.get("explanation"), str):
+            raise ValueError(f"Question[{idx}].options[{oi}].explanation must be a string")
+    if q.get("correctAnswer") not in valid_ids:
+        raise ValueError(f"Question[{idx}].correctAnswer invalid")
+    return q
+
+
 def validate_mcq_shape(obj: Dict[str, Any], num_questions: int, num_options: int) -> Dict[str, Any]:
     if not isinstance(obj, dict):
         raise ValueError("Invalid root JSON")
@@ -60,27 +87,6 @@ def validate_mcq_shape(obj: Dict[str, Any], num_questions: int, num_options: int
     qs = obj.get("questions")
     if not isinstance(qs, list) or len(qs) != num_questions:
         raise ValueError(f"questions must have exactly {num_questions} items")
-    valid_ids = {chr(97 + i) for i in range(num_options)}
     for idx, q in enumerate(qs):
-        if not isinstance(q, dict):
-            raise ValueError(f"Question[{idx}] invalid")
-        if not isinstance(q.get("id"), str) or not q["id"].strip():
-            raise ValueError(f"Question[{idx}].id invalid")
-        if not isinstance(q.get("questionText"), str) or not q["questionText"].strip():
-            raise ValueError(f"Question[{idx}].questionText invalid")
-        opts = q.get("options")
-        if not isinstance(opts, list) or len(opts) != num_options:
-            raise ValueError(f"Question[{idx}].options must have exactly {num_options} items")
-        for oi, opt in enumerate(opts):
-            if not isinstance(opt, dict):
-                raise ValueError(f"Question[{idx}].options[{oi}] invalid")
-            if opt.get("id") not in valid_ids:
-                raise ValueError(f"Question[{idx}].options[{oi}].id invalid")
-            if not isinstance(opt.get("text"), str) or not opt["text"].strip():
-                raise ValueError(f"Question[{idx}].options[{oi}].text invalid")
-            # Explanation is required to be a string, but can be empty for incorrect answers
-            if not isinstance(opt.get("explanation"), str):
-                raise ValueError(f"Question[{idx}].options[{oi}].explanation must be a string")
-        if q.get("correctAnswer") not in valid_ids:
-            raise ValueError(f"Question[{idx}].correctAnswer invalid")
+        validate_mcq_item(q, idx, num_options)
     return obj
@@ -0,0 +1,125 @@
+import logging
+from typing import Any, Callable, Dict, List, Tuple
+
+from .sharding import build_item_prompt, is_duplicate, item_key, item_text, validate_item, validate_shape
+
+logger = logging.getLogger(__name__)
+
+
+def empty_usage() -> Dict[str, int]:
+    """Token counters for repair calls."""
+    return {"calls": 0, "input_tokens": 0, "output_tokens": 0}
+
+
+def add_usage(usage: Dict[str, int], response) -> None:
+    """Add the token usage of an LLM response (langchain usage_metadata) to usage."""
+    metadata = getattr(response, "usage_metadata", None) or {}
+    usage["calls"] += 1
+    usage["input_tokens"] += int(metadata.get("input_tokens", 0) or 0)
+    usage["output_tokens"] += int(metadata.get("output_tokens", 0) or 0)
+
+
+def salvage_items(
+    obj: Any,
+    material_type: str,
+    num_items: int,
+    num_options: int,
+    existing: List[Dict[str, Any]] | None = None
+) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    Keep the valid, non-duplicate items of a (possibly invalid) generated set.
+
+    Returns:
+        (valid items, up to num_items in total with existing; validation errors)
+    """
+    kept = list(existing or [])
+    errors = []
+    raw_items = obj.get(item_key(material_type)) if isinstance(obj, dict) else None
+    if not isinstance(raw_items, list):
+        return kept, [f"{item_key(material_type)} missing"]
+
+    for idx, item in enumerate(raw_items):
+        if len(kept) >= num_items:
+            break
+        try:
+            validate_item(material_type, item, idx, num_options)
+        except ValueError as e:
+            errors.append(str(e))
+            continue
+        if is_duplicate(item, kept):
+            errors.append(f"Item[{idx}] duplicates an earlier item")
+            continue
+        kept.append(item)
+    return kept, errors
+
+
+def repair_generation(
+    llm,
+    parse_json: Callable[[str], Dict[str, Any]],
+    output_text: str,
+    material_type: str,
+    topic: str,
+    difficulty: str,
+    num_items: int,
+    snippets: List[str],
+    num_options: int = 4,
+    card_type: str = "definition",
+    usage: Dict[str, int] | None = None
+) -> Dict[str, Any]:
+    """
+    Recover a set that failed validation without regenerating all of it.
+
+    The output is parsed tolerantly, valid items are kept and a single
+    targeted call generates only the missing or invalid items.
+
+    Args:
+        llm: Chat model
+        parse_json: Tolerant JSON extractor
+        output_text: The response that failed validation
+        material_type: 'mcq', 'flashcard' or 'short_answer'
+        topic: Topic of the set
+        difficulty: Difficulty level
+        num_items: Total number of questions/cards
+        snippets: Retrieved context snippets
+        num_options: Options per MCQ
+        card_type: Flashcard type
+        usage: Token counters updated with the repair call (see empty_usage)
+
+    Returns:
+        The validated set
+
+    Raises:
+        ValueError: If the set still fails validation after the repair call
+    """
+    key = item_key(material_type)
+    try:
+        obj = parse_json(output_text)
+    except ValueError as e:
+        logger.warning(f"Nothing salvageable in response: {e}")
+        obj = {}
+
+    items, errors = salvage_items(obj, material_type, num_items, num_options)
+    title = obj.get("title") if isinstance(obj.get("title"), str) and obj["title"].strip() else None
+    logger.info(f"Salvaged {len(items)}/{num_items} {key}; errors: {errors[:5]}")
+
+    missing = num_items - len(items)
+    if missing > 0:
+        prompt = build_item_prompt(material_type, topic, difficulty, missing, snippets, num_options, card_type,
+                                   [item_text(item) for item in items])
+        logger.info(f"Requesting {missing} replacement {key}")
+        response = llm.invoke(prompt)
+        if usage is not None:
+            add_usage(usage, response)
+        try:
+            repaired = parse_json(response.content)
+        except ValueError as e:
+            raise ValueError(f"Repair response was not valid JSON: {e}")
+        items, errors = salvage_items(repaired, material_type, num_items, num_options, existing=items)
+        title = title or repaired.get("title")
+        if len(items) < num_items:
+            raise ValueError(f"{key} must have exactly {num_items} items (repair produced {len(items)}): {errors[:5]}")
+
+    prefix = "card" if material_type == "flashcard" else "q"
+    for index, item in enumerate(items):
+        item["id"] = f"{prefix}{index + 1}"
+    return validate_shape(material_type, {"title": title, key: items}, num_items, num_options)
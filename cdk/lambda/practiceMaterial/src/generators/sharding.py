@@ -0,0 +1,306 @@
+import logging
+import os
+import queue
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from helpers.incremental_json import IncrementalItemParser
+from .mcq import build_mcq_prompt, validate_mcq_item, validate_mcq_shape
+from .flashcard import build_flashcard_prompt, validate_flashcard_item, validate_flashcard_shape
+from .short_answer import build_short_answer_prompt, validate_short_answer_item, validate_short_answer_shape
+
+logger = logging.getLogger(__name__)
+
+# Sets larger than SHARD_SIZE items are generated as several smaller sets in
+# parallel. Output tokens dominate generation time, so wall-clock time follows
+# the shard size rather than the total.
+SHARD_SIZE = int(os.environ.get("PRACTICE_SHARD_SIZE", "5"))
+MAX_SHARD_WORKERS = int(os.environ.get("PRACTICE_MAX_SHARD_WORKERS", "4"))
+# Items whose question/front text overlap at least this much (word Jaccard) are duplicates
+DUPLICATE_SIMILARITY = 0.8
+# How long the merge loop waits for a streamed item before checking on the shards
+_POLL_SECONDS = 0.05
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def should_shard(num_items: int, shard_size: int = SHARD_SIZE) -> bool:
+    """True if a set of num_items should be generated in parallel shards."""
+    return shard_size > 0 and num_items > shard_size
+
+
+def plan_shards(num_items: int, shard_size: int = SHARD_SIZE) -> List[int]:
+    """Split num_items into balanced shard sizes of at most shard_size (e.g. 13, 5 -> [5, 4, 4])."""
+    num_shards = max(1, -(-num_items // max(shard_size, 1)))
+    base, extra = divmod(num_items, num_shards)
+    return [base + 1 if i < extra else base for i in range(num_shards)]
+
+
+def split_snippets(snippets: List[str], num_shards: int) -> List[List[str]]:
+    """
+    Deal context snippets round-robin so each shard works from different
+    passages. With fewer snippets than shards, shards share them.
+    """
+    if not snippets:
+        return [[] for _ in range(num_shards)]
+    if len(snippets) < num_shards:
+        return [[snippets[i % len(snippets)]] for i in range(num_shards)]
+    return [snippets[i::num_shards] for i in range(num_shards)]
+
+
+def item_key(material_type: str) -> str:
+    """Key of the item array for a material type."""
+    return "cards" if material_type == "flashcard" else "questions"
+
+
+def item_text(item: Dict[str, Any]) -> str:
+    """Question text (or flashcard front) used to compare items."""
+    return item.get("questionText") or item.get("front") or ""
+
+
+def _words(text: str) -> set:
+    return set(_WORD_RE.findall(text.lower()))
+
+
+def is_duplicate(item: Dict[str, Any], existing: List[Dict[str, Any]]) -> bool:
+    """True if item asks (nearly) the same thing as one of existing."""
+    words = _words(item_text(item))
+    if not words:
+        return False
+    for other in existing:
+        other_words = _words(item_text(other))
+        if other_words and len(words & other_words) / len(words | other_words) >= DUPLICATE_SIMILARITY:
+            return True
+    return False
+
+
+def build_item_prompt(material_type: str, topic: str, difficulty: str, count: int, snippets: List[str],
+                      num_options: int, card_type: str, avoid: List[str]) -> str:
+    """Build the generation prompt for count items, asking the model not to repeat avoid."""
+    if material_type == "mcq":
+        prompt = build_mcq_prompt(topic, difficulty, count, num_options, snippets)
+    elif material_type == "flashcard":
+        prompt = build_flashcard_prompt(topic, difficulty, count, card_type, snippets)
+    else:  # short_answer
+        prompt = build_short_answer_prompt(topic, difficulty, count, snippets)
+    if avoid:
+        prompt += "\n\nDo NOT repeat these already-generated items:\n" + "\n".join(f"- {text}" for text in avoid)
+    return prompt
+
+
+def validate_item(material_type: str, item: Any, idx: int, num_options: int) -> Dict[str, Any]:
+    """Validate one question/card with its generator's item validator."""
+    if material_type == "mcq":
+        return validate_mcq_item(item, idx, num_options)
+    if material_type == "flashcard":
+        return validate_flashcard_item(item, idx)
+    return validate_short_answer_item(item, idx)
+
+
+def validate_shape(material_type: str, obj: Dict[str, Any], count: int, num_options: int) -> Dict[str, Any]:
+    """Validate a whole set with its generator's shape validator."""
+    if material_type == "mcq":
+        return validate_mcq_shape(obj, count, num_options)
+    if material_type == "flashcard":
+        return validate_flashcard_shape(obj, count)
+    return validate_short_answer_shape(obj, count)
+
+
+def _stream_items(llm, parse_json: Callable[[str], Dict[str, Any]], material_type: str, prompt: str,
+                  count: int, num_options: int, emit: Callable[[Dict[str, Any]], None],
+                  stop: threading.Event) -> Tuple[Optional[str], int]:
+    """
+    Stream one prompt and pass each valid item to emit as soon as it parses.
+    Stops reading the stream once stop is set.
+
+    Returns:
+        (title of the set or None, number of items emitted)
+    """
+    parser = IncrementalItemParser(item_key(material_type))
+    chunks = []
+    emitted = 0
+    for chunk in llm.stream(prompt):
+        if stop.is_set():
+            break
+        text = chunk.content if isinstance(chunk.content, str) else ""
+        chunks.append(text)
+        for item in parser.feed(text):
+            if emitted >= count:
+                continue
+            try:
+                validate_item(material_type, item, emitted, num_options)
+            except ValueError as e:
+                logger.warning(f"Skipping invalid streamed shard item: {e}")
+                continue
+            emit(item)
+            emitted += 1
+
+    title = None
+    if stop.is_set():
+        return title, emitted
+    try:
+        obj = parse_json("".join(chunks))
+        if isinstance(obj, dict) and isinstance(obj.get("title"), str) and obj["title"].strip():
+            title = obj["title"]
+    except Exception as e:
+        logger.warning(f"Could not read shard title: {e}")
+    return title, emitted
+
+
+def _generate_shard(llm, parse_json: Callable[[str], Dict[str, Any]], material_type: str,
+                    build_prompt: Callable[[int, List[str]], str], count: int, num_options: int,
+                    emit: Callable[[Dict[str, Any]], None], stop: threading.Event) -> Optional[str]:
+    """
+    Stream one shard, retrying once for the items it failed to produce.
+
+    Args:
+        build_prompt: Builds the prompt for a number of items, given texts to avoid
+        emit: Receives each valid item (called on the worker thread)
+        stop: Set by the caller to abandon the shard
+
+    Returns:
+        Title generated for the shard, or None
+    """
+    produced: List[Dict[str, Any]] = []
+
+    def keep(item: Dict[str, Any]) -> None:
+        produced.append(item)
+        emit(item)
+
+    title, emitted = _stream_items(llm, parse_json, material_type, build_prompt(count, []), count, num_options, keep, stop)
+    if emitted < count and not stop.is_set():
+        missing = count - emitted
+        logger.warning(f"Shard of {count} produced {emitted} valid items, retrying for {missing}")
+        retry_prompt = build_prompt(missing, [item_text(item) for item in produced]) + "\n\nIMPORTANT: Your previous response was invalid. You MUST return valid JSON only, exactly matching the schema and lengths. No extra commentary."
+        retry_title, _ = _stream_items(llm, parse_json, material_type, retry_prompt, missing, num_options, keep, stop)
+        title = title or retry_title
+    return title
+
+
+def generate_sharded(
+    llm,
+    parse_json: Callable[[str], Dict[str, Any]],
+    material_type: str,
+    topic: str,
+    difficulty: str,
+    num_items: int,
+    snippets: List[str],
+    num_options: int = 4,
+    card_type: str = "definition",
+    on_items: Optional[Callable[[List[Dict[str, Any]]], bool]] = None,
+    shard_size: int = SHARD_SIZE,
+) -> Dict[str, Any]:
+    """
+    Generate a practice set as parallel shards and merge them.
+
+    Each shard gets its own slice of the context snippets and streams on a
+    thread pool against the shared ChatBedrock. Items are merged on the
+    calling thread as soon as they parse, so the first item arrives after
+    about one item's generation time, as with a single streamed prompt. A
+    shard that comes back short is retried for its missing items. Near-identical
+    items across shards are dropped, and one extra shard tops the set up if
+    duplicates or failed shards left it short.
+
+    Args:
+        llm: Shared chat model
+        parse_json: Extracts the JSON object from model output
+        material_type: 'mcq', 'flashcard' or 'short_answer'
+        topic: Topic of the set
+        difficulty: Difficulty level
+        num_items: Total number of questions/cards
+        snippets: Retrieved context snippets
+        num_options: Options per MCQ
+        card_type: Flashcard type
+        on_items: Called (on the calling thread) with each batch of new,
+            de-duplicated items as they stream in; items that arrive while
+            it runs are passed together in the next batch. Returning False
+            (e.g. after a guardrail block) stops generation: running shards
+            stop reading their streams and no top-up runs
+        shard_size: Maximum items per shard
+
+    Returns:
+        The merged set in the same shape as a single-prompt generation
+
+    Raises:
+        ValueError: If the merged set cannot be filled to num_items, or
+            on_items stopped generation
+    """
+    key = item_key(material_type)
+    shard_sizes = plan_shards(num_items, shard_size)
+    shard_snippets = split_snippets(snippets, len(shard_sizes))
+    logger.info(f"Generating {num_items} {material_type} items in {len(shard_sizes)} shards: {shard_sizes}")
+
+    prefix = "card" if material_type == "flashcard" else "q"
+    title = None
+    items: List[Dict[str, Any]] = []
+    stop = threading.Event()
+
+    def merge(batch: List[Dict[str, Any]]) -> None:
+        if stop.is_set():
+            return
+        new_items = []
+        for item in batch:
+            if len(items) >= num_items:
+                break
+            if is_duplicate(item, items):
+                logger.info(f"Dropping duplicate item: {item_text(item)[:80]}")
+                continue
+            # Shards each number from 1, so ids are reassigned in merge order
+            item["id"] = f"{prefix}{len(items) + 1}"
+            items.append(item)
+            new_items.append(item)
+        if new_items and on_items and on_items(new_items) is False:
+            logger.info("Sharded generation stopped by on_items")
+            stop.set()
+
+    def run(jobs: List[Tuple[int, List[str], List[str]]]) -> None:
+        # jobs: (count, snippets, texts to avoid); workers stream items into
+        # a queue that this thread drains and merges until every job is done
+        nonlocal title
+        streamed: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+        with ThreadPoolExecutor(max_workers=min(MAX_SHARD_WORKERS, len(jobs))) as executor:
+            futures = {
+                executor.submit(
+                    _generate_shard, llm, parse_json, material_type,
+                    lambda n, avoid, job_snippets=job_snippets, job_avoid=job_avoid: build_item_prompt(
+                        material_type, topic, difficulty, n, job_snippets, num_options, card_type, job_avoid + avoid
+                    ),
+                    count, num_options, streamed.put, stop
+                ): count
+                for count, job_snippets, job_avoid in jobs
+            }
+            running = set(futures)
+            while running or not streamed.empty():
+                batch = []
+                try:
+                    batch.append(streamed.get(timeout=_POLL_SECONDS))
+                    while True:
+                        batch.append(streamed.get_nowait())
+                except queue.Empty:
+                    pass
+                if batch:
+                    merge(batch)
+                for future in [f for f in running if f.done()]:
+                    running.discard(future)
+                    try:
+                        title = title or future.result()
+                    except Exception as e:
+                        logger.error(f"Shard of {futures[future]} failed: {e}")
+
+    run([(count, shard_snippets[i], []) for i, count in enumerate(shard_sizes)])
+    if stop.is_set():
+        raise ValueError("Sharded generation stopped by on_items")
+
+    # Refill what duplicates or failed shards removed, asking for new items only
+    missing = num_items - len(items)
+    if missing > 0:
+        logger.info(f"Topping up {missing} item(s) after merge")
+        run([(missing, snippets, [item_text(item) for item in items])])
+
+    if len(items) < num_items:
+        raise ValueError(f"{key} must have exactly {num_items} items (sharded generation produced {len(items)})")
+
+    # Every shard's title is normally valid; keep the set usable if none parsed
+    return {"title": title or f"Practice: {topic}", key: items}
@@ -1,3 +1,4 @@
+import json
 from typing import Any, Dict
 
 def build_short_answer_prompt(
@@ -54,6 +55,49 @@ Requirements:
 Output valid JSON now:"""
 
 
+def validate_short_answer_item(q: Any, idx: int) -> Dict[str, Any]:
+    """
+    Validate one short answer question; used for whole sets and for items as they stream.
+    """
+    if not isinstance(q, dict):
+        raise ValueError(f"Question[{idx}] invalid")
+    
+    # Validate id
+    if not isinstance(q.get("id"), str) or not q["id"].strip():
+        raise ValueError(f"Question[{idx}].id invalid")
+    
+    # Validate questionText
+    if not isinstance(q.get("questionText"), str) or not q["questionText"].strip():
+        raise ValueError(f"Question[{idx}].questionText invalid")
+    
+    # Validate context (optional, can be empty string)
+    if not isinstance(q.get("context"), str):
+        raise ValueError(f"Question[{idx}].context must be a string (can be empty)")
+    
+    # Validate sampleAnswer
+    if not isinstance(q.get("sampleAnswer"), str) or not q["sampleAnswer"].strip():
+        raise ValueError(f"Question[{idx}].sampleAnswer invalid")
+    
+    # Validate keyPoints (array of strings)
+    key_points = q.get("keyPoints")
+    if not isinstance(key_points, list) or len(key_points) < 3:
+        raise ValueError(f"Question[{idx}].keyPoints must be an array with at least 3 items")
+    for kp_idx, kp in enumerate(key_points):
+        if not isinstance(kp, str) or not kp.strip():
+            raise ValueError(f"Question[{idx}].keyPoints[{kp_idx}] must be a non-empty string")
+    
+    # Validate rubric
+    if not isinstance(q.get("rubric"), str) or not q["rubric"].strip():
+        raise ValueError(f"Question[{idx}].rubric invalid")
+    
+    # Validate expectedLength (optional number)
+    expected_length = q.get("expectedLength")
+    if expected_length is not None and not isinstance(expected_length, (int, float)):
+        raise ValueError(f"Question[{idx}].expectedLength must be a number")
+    
+    return q
+
+
 def validate_short_answer_shape(obj: Dict[str, Any], num_questions: int) -> Dict[str, Any]:
     """
     Validate the shape of a short answer JSON object.
@@ -68,41 +112,7 @@ def validate_short_answer_shape(obj: Dict[str, Any], num_questions: int) -> Dict
         raise ValueError(f"questions must have exactly {num_questions} items")
     
     for idx, q in enumerate(questions):
-        if not isinstance(q, dict):
-            raise ValueError(f"Question[{idx}] invalid")
-        
-        # Validate id
-        if not isinstance(q.get("id"), str) or not q["id"].strip():
-            raise ValueError(f"Question[{idx}].id invalid")
-        
-        # Validate questionText
-        if not isinstance(q.get("questionText"), str) or not q["questionText"].strip():
-            raise ValueError(f"Question[{idx}].questionText invalid")
-        
-        # Validate context (optional, can be empty string)
-        if not isinstance(q.get("context"), str):
-            raise ValueError(f"Question[{idx}].context must be a string (can be empty)")
-        
-        # Validate sampleAnswer
-        if not isinstance(q.get("sampleAnswer"), str) or not q["sampleAnswer"].strip():
-            raise ValueError(f"Question[{idx}].sampleAnswer invalid")
-        
-        # Validate keyPoints (array of strings)
-        key_points = q.get("keyPoints")
-        if not isinstance(key_points, list) or len(key_points) < 3:
-            raise ValueError(f"Question[{idx}].keyPoints must be an array with at least 3 items")
-        for kp_idx, kp in enumerate(key_points):
-            if not isinstance(kp, str) or not kp.strip():
-                raise ValueError(f"Question[{idx}].keyPoints[{kp_idx}] must be a non-empty string")
-        
-        # Validate rubric
-        if not isinstance(q.get("rubric"), str) or not q["rubric"].strip():
-            raise ValueError(f"Question[{idx}].rubric invalid")
-        
-        # Validate expectedLength (optional number)
-        expected_length = q.get("expectedLength")
-        if expected_length is not None and not isinstance(expected_length, (int, float)):
-            raise ValueError(f"Question[{idx}].expectedLength must be a number")
+        validate_short_answer_item(q, idx)
     
     return obj
 
@@ -151,3 +161,34 @@ Requirements:
 - Arrays can be empty if no items apply
 
 Output valid JSON now:"""
+
+
+# Fields of a grading result and their expected types
+GRADING_FIELDS = {
+    "feedback": str,
+    "strengths": list,
+    "improvements": list,
+    "keyPointsCovered": list,
+    "keyPointsMissed": list,
+}
+
+
+def invalid_grading_fields(result: Any) -> list[str]:
+    """Return the grading fields that are missing or have the wrong type."""
+    if not isinstance(result, dict):
+        return list(GRADING_FIELDS)
+    return [field for field, expected in GRADING_FIELDS.items() if not isinstance(result.get(field), expected)]
+
+
+def build_grading_repair_prompt(grading_prompt: str, partial: Dict[str, Any], fields: list[str]) -> str:
+    """
+    Ask only for the grading fields that were missing or invalid, given the
+    fields that were already produced.
+    """
+    valid = {k: v for k, v in partial.items() if k in GRADING_FIELDS and k not in fields}
+    return f"""{grading_prompt}
+
+Your previous response was incomplete. These fields are already done:
+{json.dumps(valid, ensure_ascii=False)}
+
+Return valid JSON only, containing ONLY these fields: {", ".join(fields)}"""
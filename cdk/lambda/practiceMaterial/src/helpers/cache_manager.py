@@ -14,9 +14,10 @@ import json
 from typing import Any, Dict
 from decimal import Decimal
 
-import boto3
 from botocore.exceptions import ClientError
 
+from .aws_clients import get_resource
+
 logger = logging.getLogger(__name__)
 
 # Cache configuration
@@ -37,7 +38,7 @@ def _get_cache_table():
             logger.warning("CACHE_TABLE_NAME not set, caching disabled")
             return None
         
-        dynamodb = boto3.resource("dynamodb")
+        dynamodb = get_resource("dynamodb")
         _dynamodb_table = dynamodb.Table(table_name)
         logger.info(f"Initialized DynamoDB cache table: {table_name}")
     
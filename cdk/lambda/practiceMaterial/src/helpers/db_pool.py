@@ -0,0 +1,243 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+
+# Set up logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Connections idle for longer than this are pinged (SELECT 1) on checkout.
+# RDS Proxy drops client connections after its idle timeout, and a frozen
+# Lambda container can hold connections well past it.
+VALIDATE_AFTER_IDLE_SECONDS = float(os.environ.get("DB_POOL_VALIDATE_AFTER_IDLE_SECONDS", "30"))
+# How long a checkout waits for a free connection when the pool is saturated
+CHECKOUT_TIMEOUT_SECONDS = float(os.environ.get("DB_POOL_CHECKOUT_TIMEOUT_SECONDS", "10"))
+
+_BROKEN_CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+
+class PoolTimeoutError(psycopg2.pool.PoolError):
+    """No connection became available within the checkout timeout."""
+
+
+class ConnectionPool:
+    """
+    ThreadedConnectionPool with liveness checks and checkout accounting.
+
+    getconn() waits (up to checkout_timeout) for a free connection instead of
+    failing when the pool is exhausted, and pings connections that have been
+    idle longer than VALIDATE_AFTER_IDLE_SECONDS. Closed or broken connections
+    are discarded and replaced transparently. putconn() rolls back any open
+    transaction before the connection is reused.
+
+    Checkout latency and saturation are counted for the container lifetime and
+    per request (see begin_request/request_stats).
+    """
+
+    def __init__(self, minconn: int, maxconn: int, checkout_timeout: float = CHECKOUT_TIMEOUT_SECONDS, **connect_kwargs):
+        """
+        Args:
+            minconn: Connections opened up front
+            maxconn: Maximum number of connections
+            checkout_timeout: Seconds getconn waits for a free connection
+            connect_kwargs: Passed to psycopg2.connect (host, dbname, user, ...)
+        """
+        self._pool = psycopg2.pool.ThreadedConnectionPool(minconn, maxconn, **connect_kwargs)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._checkout_timeout = checkout_timeout
+        self._lock = threading.Lock()
+        self._returned_at: Dict[int, float] = {}
+        self._checked_out: Dict[int, float] = {}
+        self.maxconn = maxconn
+
+        self._stats = self._empty_stats()
+        self._request_stats = self._empty_stats()
+
+    @staticmethod
+    def _empty_stats() -> Dict[str, Any]:
+        return {
+            "checkouts": 0,
+            "waited": 0,  # Checkouts that found the pool saturated
+            "timeouts": 0,
+            "wait_ms_total": 0.0,
+            "wait_ms_max": 0.0,
+            "replaced": 0,  # Broken/stale connections discarded on checkout
+            "max_in_use": 0,
+        }
+
+    @property
+    def in_use(self) -> int:
+        """Number of connections currently checked out."""
+        return len(self._checked_out)
+
+    def getconn(self):
+        """
+        Check out a live connection, waiting if the pool is saturated.
+
+        Raises:
+            PoolTimeoutError: If no connection was free within the checkout timeout
+        """
+        start = time.time()
+        waited = not self._slots.acquire(blocking=False)
+        if waited and not self._slots.acquire(timeout=self._checkout_timeout):
+            self._record(timeouts=1)
+            raise PoolTimeoutError(f"No database connection available after {self._checkout_timeout}s")
+
+        try:
+            connection = self._checkout_live_connection()
+        except Exception:
+            self._slots.release()
+            raise
+
+        wait_ms = (time.time() - start) * 1000
+        with self._lock:
+            self._checked_out[id(connection)] = time.time()
+            self._returned_at.pop(id(connection), None)
+            in_use = len(self._checked_out)
+        self._record(checkouts=1, waited=1 if waited else 0, wait_ms=wait_ms, in_use=in_use)
+        return connection
+
+    def putconn(self, connection, close: bool = False) -> None:
+        """
+        Return a connection. Open transactions are rolled back; broken
+        connections are closed instead of being reused.
+        """
+        with self._lock:
+            if self._checked_out.pop(id(connection), None) is None:
+                logger.warning("Returned a connection that was not checked out from this pool")
+                return
+
+        try:
+            if not close and not connection.closed:
+                status = connection.get_transaction_status()
+                if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                    close = True
+                elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    connection.rollback()
+        except _BROKEN_CONNECTION_ERRORS:
+            close = True
+
+        try:
+            self._pool.putconn(connection, close=close or bool(connection.closed))
+            if not (close or connection.closed):
+                with self._lock:
+                    self._returned_at[id(connection)] = time.time()
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection for the duration of a with block."""
+        connection = self.getconn()
+        try:
+            yield connection
+        finally:
+            self.putconn(connection)
+
+    def begin_request(self) -> None:
+        """Start per-request checkout accounting (call at the start of the handler)."""
+        with self._lock:
+            self._request_stats = self._empty_stats()
+
+    def request_stats(self) -> Dict[str, Any]:
+        """Checkout counters since begin_request."""
+        with self._lock:
+            return self._format(self._request_stats)
+
+    def stats(self) -> Dict[str, Any]:
+        """Container-lifetime checkout counters plus current utilisation."""
+        with self._lock:
+            stats = self._format(self._stats)
+            stats["in_use"] = len(self._checked_out)
+        stats["max_size"] = self.maxconn
+        return stats
+
+    def closeall(self) -> None:
+        self._pool.closeall()
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _checkout_live_connection(self):
+        # Every pooled connection may be stale (e.g. after a long freeze), so
+        # allow replacing all of them before giving up
+        for _ in range(self.maxconn + 1):
+            connection = self._pool.getconn()
+            if self._is_alive(connection):
+                return connection
+            self._record(replaced=1)
+            logger.warning("Discarding broken database connection")
+            with self._lock:
+                self._returned_at.pop(id(connection), None)
+            self._pool.putconn(connection, close=True)
+        raise psycopg2.OperationalError("Could not obtain a working database connection")
+
+    def _is_alive(self, connection) -> bool:
+        if connection.closed:
+            return False
+        returned_at = self._returned_at.get(id(connection))
+        if returned_at is not None and time.time() - returned_at < VALIDATE_AFTER_IDLE_SECONDS:
+            return True
+        try:
+            with connection.cursor() as cur:
+                cur.execute("SELECT 1")
+            connection.rollback()
+            return True
+        except _BROKEN_CONNECTION_ERRORS:
+            return False
+
+    def _record(self, checkouts: int = 0, waited: int = 0, timeouts: int = 0, wait_ms: float = 0.0,
+                replaced: int = 0, in_use: int = 0) -> None:
+        with self._lock:
+            for stats in (self._stats, self._request_stats):
+                stats["checkouts"] += checkouts
+                stats["waited"] += waited
+                stats["timeouts"] += timeouts
+                stats["wait_ms_total"] += wait_ms
+                stats["wait_ms_max"] = max(stats["wait_ms_max"], wait_ms)
+                stats["replaced"] += replaced
+                stats["max_in_use"] = max(stats["max_in_use"], in_use)
+
+    @staticmethod
+    def _format(stats: Dict[str, Any]) -> Dict[str, Any]:
+        formatted = dict(stats)
+        formatted["wait_ms_total"] = round(stats["wait_ms_total"], 1)
+        formatted["wait_ms_max"] = round(stats["wait_ms_max"], 1)
+        formatted["wait_ms_avg"] = round(stats["wait_ms_total"] / stats["checkouts"], 1) if stats["checkouts"] else 0.0
+        return formatted
+
+
+def pool_metrics(pool: Optional[ConnectionPool]) -> Dict[str, Any]:
+    """
+    EMF metric definitions and values for the current request's checkouts.
+
+    Returns:
+        {"definitions": [...], "values": {...}}; empty if there is no pool yet
+    """
+    if pool is None:
+        return {"definitions": [], "values": {}}
+
+    request = pool.request_stats()
+    return {
+        "definitions": [
+            {"Name": "DbCheckouts", "Unit": "Count"},
+            {"Name": "DbCheckoutWaitMs", "Unit": "Milliseconds"},
+            {"Name": "DbPoolSaturated", "Unit": "Count"},
+            {"Name": "DbConnectionsReplaced", "Unit": "Count"},
+        ],
+        "values": {
+            "DbCheckouts": request["checkouts"],
+            "DbCheckoutWaitMs": request["wait_ms_max"],
+            # Checkouts that had to wait (or timed out) because every connection was in use
+            "DbPoolSaturated": request["waited"] + request["timeouts"],
+            "DbConnectionsReplaced": request["replaced"],
+        },
+    }
@@ -0,0 +1,117 @@
+"""
+Incremental JSON item parser for streamed LLM output.
+
+Practice material is generated as one JSON object with an array of items
+("questions" or "cards"). The parser is fed the output as it streams and
+returns each array item as soon as its closing brace arrives, so items can
+be shown before the whole object has been generated.
+"""
+
+import json
+import logging
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class IncrementalItemParser:
+    """
+    Extract completed objects from the top-level array under array_key.
+
+    Only tracks string/escape state and bracket depth, so each character of
+    the stream is scanned once. Text before the root object (e.g. a model
+    preamble or ```json fence) is ignored. The full document is still parsed
+    and validated by the caller once the stream ends.
+    """
+
+    def __init__(self, array_key: str):
+        """
+        Args:
+            array_key: Key of the item array in the root object ("questions" or "cards")
+        """
+        self.array_key = array_key
+        self.items_emitted = 0
+        self._text = ""
+        self._pos = 0
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start: Optional[int] = None
+        self._last_string: Optional[str] = None
+        self._awaiting_value_for: Optional[str] = None
+        self._array_depth: Optional[int] = None
+        self._item_start: Optional[int] = None
+        self._done = False
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """
+        Add streamed text and return the items completed by it.
+
+        Items that are not valid JSON on their own are skipped (the caller's
+        full-document validation decides what happens to the response).
+        """
+        if not chunk or self._done:
+            return []
+
+        self._text += chunk
+        items = []
+        text = self._text
+        for pos in range(self._pos, len(text)):
+            char = text[pos]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._last_string = text[self._string_start + 1:pos]
+                continue
+
+            if char == '"':
+                if self._stack:
+                    self._in_string = True
+                    self._string_start = pos
+            elif char == ":":
+                # A string followed by ':' directly in the root object is a root key
+                self._awaiting_value_for = self._last_string if len(self._stack) == 1 else None
+            elif char in "{[":
+                if (
+                    char == "["
+                    and self._array_depth is None
+                    and len(self._stack) == 1
+                    and self._awaiting_value_for == self.array_key
+                ):
+                    self._array_depth = len(self._stack) + 1
+                elif char == "{" and self._array_depth is not None and len(self._stack) == self._array_depth:
+                    self._item_start = pos
+                self._stack.append(char)
+                self._awaiting_value_for = None
+            elif char in "}]":
+                if not self._stack:
+                    continue
+                self._stack.pop()
+                if char == "}" and self._item_start is not None and len(self._stack) == self._array_depth:
+                    item = self._parse_item(text[self._item_start:pos + 1])
+                    self._item_start = None
+                    if item is not None:
+                        items.append(item)
+                elif char == "]" and self._array_depth is not None and len(self._stack) == self._array_depth - 1:
+                    # Item array closed; nothing more to emit
+                    self._done = True
+                    break
+            elif char == "," and len(self._stack) == 1:
+                self._awaiting_value_for = None
+
+        self._pos = len(text)
+        self.items_emitted += len(items)
+        return items
+
+    def _parse_item(self, raw: str) -> Optional[Dict[str, Any]]:
+        try:
+            item = json.loads(raw)
+        except json.JSONDecodeError as e:
+            logger.warning(f"Skipping streamed item that is not valid JSON: {e}")
+            return None
+        return item if isinstance(item, dict) else None
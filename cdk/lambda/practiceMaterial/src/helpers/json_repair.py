@@ -0,0 +1,124 @@
+"""
+Tolerant JSON extraction for LLM output.
+
+Models occasionally wrap the object in a ```json fence, leave trailing commas
+or stop mid-object when they hit the token limit. These are repaired locally
+so a (partial) result can be recovered without another model call.
+"""
+
+import json
+import logging
+import re
+from typing import Any, Dict
+
+logger = logging.getLogger(__name__)
+
+_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)(?:```|$)", re.DOTALL | re.IGNORECASE)
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def _strip_fences(text: str) -> str:
+    match = _FENCE_RE.search(text)
+    return match.group(1) if match and "{" in match.group(1) else text
+
+
+def _remove_trailing_commas(text: str) -> str:
+    """Drop commas that directly precede a closing bracket (outside strings)."""
+    out = []
+    in_string = escape = False
+    for char in text:
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "}]":
+            # Remove a pending comma (and the whitespace after it)
+            i = len(out) - 1
+            while i >= 0 and out[i].isspace():
+                i -= 1
+            if i >= 0 and out[i] == ",":
+                del out[i]
+        out.append(char)
+    return "".join(out)
+
+
+def repair_json_text(text: str) -> str:
+    """
+    Best-effort repair of the JSON object in text.
+
+    Trims everything outside the root object, removes trailing commas and, if
+    the object was cut off, drops the incomplete trailing value and closes the
+    open brackets.
+
+    Raises:
+        ValueError: If text contains no JSON object
+    """
+    text = _strip_fences(text)
+    start = text.find("{")
+    if start == -1:
+        raise ValueError("Model response did not contain JSON object")
+
+    stack = []
+    in_string = escape = False
+    # Last position where the document can be cut and closed, with the open
+    # brackets at that point
+    safe_end, safe_stack = start + 1, ["{"]
+    for pos in range(start, len(text)):
+        char = text[pos]
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+            continue
+
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append(char)
+            safe_end, safe_stack = pos + 1, list(stack)
+        elif char in "}]":
+            if stack:
+                stack.pop()
+            if not stack:
+                return _remove_trailing_commas(text[start:pos + 1])
+            safe_end, safe_stack = pos + 1, list(stack)
+        elif char == ",":
+            safe_end, safe_stack = pos, list(stack)
+
+    # Truncated: cut after the last complete value and close what is open
+    logger.warning(f"Repairing truncated JSON ({len(text) - start} chars, cut at {safe_end - start})")
+    closing = "".join(_CLOSERS[b] for b in reversed(safe_stack))
+    return _remove_trailing_commas(text[start:safe_end] + closing)
+
+
+def extract_json_tolerant(text: str) -> Dict[str, Any]:
+    """
+    Parse the JSON object in an LLM response, repairing it if needed.
+
+    Raises:
+        ValueError: If no JSON object can be recovered
+    """
+    start, end = text.find("{"), text.rfind("}")
+    if start != -1 and end > start:
+        try:
+            obj = json.loads(text[start:end + 1])
+            if isinstance(obj, dict):
+                return obj
+        except json.JSONDecodeError:
+            pass
+
+    try:
+        obj = json.loads(repair_json_text(text))
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Could not repair JSON in model response: {e}")
+    if not isinstance(obj, dict):
+        raise ValueError("Model response did not contain JSON object")
+    return obj
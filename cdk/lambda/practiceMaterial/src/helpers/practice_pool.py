@@ -0,0 +1,167 @@
+"""
+Pre-generated practice material pool.
+
+The practice_pool_generation Glue job stores validated items per section in
+practice_material_pool. A request is served from the pool when enough items
+of the requested type, difficulty and parameters are close to the topic;
+otherwise the handler generates live.
+
+Lookups fail open: any error is logged and treated as a miss.
+"""
+
+import os
+import json
+import random
+import logging
+import threading
+from typing import Any, Dict, List
+
+from .semantic_cache import supports_iterative_scan
+
+logger = logging.getLogger(__name__)
+
+# Minimum cosine similarity between the topic (search query) and a pool item
+# (section title + question, search document). Lower than the semantic
+# cache threshold because a topic is compared with questions, not topics.
+SIMILARITY_THRESHOLD = float(os.environ.get("PRACTICE_POOL_THRESHOLD", "0.5"))
+# Matching items are sampled from the nearest num_items * CANDIDATE_FACTOR,
+# so repeated requests for a topic get varied sets
+CANDIDATE_FACTOR = 2
+HNSW_EF_SEARCH = 80
+
+_TITLES = {
+    "mcq": "Practice Quiz: {topic}",
+    "flashcard": "Flashcards: {topic}",
+    "short_answer": "Short Answer: {topic}",
+}
+
+# Container-lifetime lookup statistics
+_stats_lock = threading.Lock()
+_stats = {"lookups": 0, "hits": 0}
+
+
+def _item_key(material_type: str) -> str:
+    return "cards" if material_type == "flashcard" else "questions"
+
+
+def _record_lookup(hit: bool) -> Dict[str, Any]:
+    with _stats_lock:
+        _stats["lookups"] += 1
+        _stats["hits"] += 1 if hit else 0
+        return {
+            "lookups": _stats["lookups"],
+            "hits": _stats["hits"],
+            "hit_rate": round(_stats["hits"] / _stats["lookups"], 3),
+        }
+
+
+def sample_pool_items(
+    connection,
+    topic_embedding: str,
+    topic: str,
+    textbook_id: str,
+    material_type: str,
+    difficulty: str,
+    num_items: int,
+    extra_params: str = "",
+    similarity_threshold: float = SIMILARITY_THRESHOLD
+) -> Dict[str, Any] | None:
+    """
+    Build a practice set from pool items close to the topic.
+
+    Args:
+        connection: Database connection
+        topic_embedding: Topic embedding in pgvector format
+        topic: Requested topic (used for the set title)
+        textbook_id: UUID of the textbook
+        material_type: Type of material ('mcq', 'flashcard', 'short_answer')
+        difficulty: Difficulty level
+        num_items: Number of questions/cards requested
+        extra_params: Type-specific parameters (num_options, card_type)
+        similarity_threshold: Minimum cosine similarity of every served item
+
+    Returns:
+        Dict with result (same shape as live generation), sources and
+        similarity (lowest among the served items); None on a miss or error
+    """
+    search_settings = "SELECT set_config('hnsw.ef_search', %(ef_search)s, true);"
+    if supports_iterative_scan(connection):
+        # Keep walking the graph until enough items in scope are found
+        search_settings += "SELECT set_config('hnsw.iterative_scan', 'strict_order', true);"
+    
+    try:
+        with connection.cursor() as cur:
+            # Nearest items first; the threshold is applied afterwards so the
+            # ORDER BY/LIMIT can use the HNSW index
+            cur.execute(
+                search_settings + """
+                SELECT
+                    id,
+                    item,
+                    item_text,
+                    source_url,
+                    item_embedding <=> %(embedding)s::vector AS distance
+                FROM practice_material_pool
+                WHERE textbook_id = %(textbook_id)s
+                    AND material_type = %(material_type)s
+                    AND difficulty = %(difficulty)s
+                    AND extra_params = %(extra_params)s
+                ORDER BY distance
+                LIMIT %(limit)s
+                """,
+                {
+                    "ef_search": str(max(HNSW_EF_SEARCH, num_items * CANDIDATE_FACTOR)),
+                    "embedding": topic_embedding,
+                    "textbook_id": textbook_id,
+                    "material_type": material_type,
+                    "difficulty": difficulty,
+                    "extra_params": extra_params,
+                    "limit": num_items * CANDIDATE_FACTOR,
+                }
+            )
+            candidates = []
+            seen = set()
+            for pool_id, item, text, source_url, distance in cur.fetchall():
+                similarity = 1 - float(distance)
+                key = " ".join(text.lower().split())
+                if similarity >= similarity_threshold and key not in seen:
+                    seen.add(key)
+                    candidates.append((pool_id, item, source_url, similarity))
+
+            if len(candidates) < num_items:
+                connection.commit()
+                stats = _record_lookup(False)
+                logger.info(
+                    f"Practice pool MISS: {len(candidates)}/{num_items} items above {similarity_threshold}; "
+                    f"stats: {json.dumps(stats)}"
+                )
+                return None
+
+            # Sample for variety, then serve the closest items first
+            chosen = sorted(random.sample(candidates, num_items), key=lambda c: c[3], reverse=True)
+            cur.execute(
+                "UPDATE practice_material_pool SET serve_count = serve_count + 1 WHERE id = ANY(%s::uuid[])",
+                ([str(c[0]) for c in chosen],)
+            )
+        connection.commit()
+    except Exception as e:
+        logger.error(f"Error sampling practice material pool: {e}")
+        connection.rollback()
+        return None
+
+    prefix = "card" if material_type == "flashcard" else "q"
+    items: List[Dict[str, Any]] = []
+    sources: List[str] = []
+    for index, (_, item, source_url, _) in enumerate(chosen):
+        items.append({**item, "id": f"{prefix}{index + 1}"})
+        if source_url and source_url not in sources:
+            sources.append(source_url)
+
+    similarity = chosen[-1][3]
+    stats = _record_lookup(True)
+    logger.info(f"Practice pool HIT: {num_items} items (lowest similarity {similarity:.4f}); stats: {json.dumps(stats)}")
+    return {
+        "result": {"title": _TITLES[material_type].format(topic=topic), _item_key(material_type): items},
+        "sources": sources,
+        "similarity": similarity,
+    }
@@ -0,0 +1,267 @@
+"""
+Semantic cache tier for practice material generation.
+
+The DynamoDB cache (cache_manager) only matches an identical normalized
+topic. This tier stores every generated set in PostgreSQL with its topic
+embedding and serves the set whose topic is closest to the requested one,
+within the same textbook, material type, difficulty and type-specific
+parameters. A cached set with more items than requested is served as a
+subset.
+
+Lookups fail open: any error is logged and treated as a miss.
+"""
+
+import os
+import json
+import logging
+import threading
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Minimum cosine similarity between topic embeddings to serve a cached set
+SIMILARITY_THRESHOLD = float(os.environ.get("PRACTICE_SEMANTIC_CACHE_THRESHOLD", "0.9"))
+CACHE_TTL_DAYS = int(os.environ.get("PRACTICE_SEMANTIC_CACHE_TTL_DAYS", "7"))
+CANDIDATES = 5  # Nearest topics fetched before applying the threshold
+HNSW_EF_SEARCH = 40
+
+# Upper bounds of the similarity histogram buckets logged with each lookup
+_SIMILARITY_BUCKETS = (0.7, 0.8, 0.85, 0.9, 0.95, 1.0)
+
+# pgvector >= 0.8 supports iterative index scans (checked once per container)
+_iterative_scan_supported = None
+
+# Container-lifetime lookup statistics
+_stats_lock = threading.Lock()
+_stats: Dict[str, Any] = {
+    "lookups": 0,
+    "hits": 0,
+    "similarity_histogram": {f"<={bound}": 0 for bound in _SIMILARITY_BUCKETS},
+}
+
+
+def embedding_to_pgvector(embedding: List[float]) -> str:
+    """Format an embedding in PostgreSQL vector format."""
+    return "[" + ",".join(map(str, embedding)) + "]"
+
+
+def supports_iterative_scan(connection) -> bool:
+    """
+    Check whether pgvector can keep scanning the HNSW graph until the scope
+    filter is satisfied (hnsw.iterative_scan, pgvector 0.8+).
+    """
+    global _iterative_scan_supported
+    
+    if _iterative_scan_supported is None:
+        try:
+            with connection.cursor() as cur:
+                cur.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+                row = cur.fetchone()
+            connection.commit()
+            version = tuple(int(part) for part in row[0].split(".")[:2]) if row else (0, 0)
+            _iterative_scan_supported = version >= (0, 8)
+            logger.info(f"pgvector version {row[0] if row else 'unknown'}, iterative scan: {_iterative_scan_supported}")
+        except Exception as e:
+            logger.warning(f"Could not determine pgvector version: {e}")
+            connection.rollback()
+            _iterative_scan_supported = False
+    
+    return _iterative_scan_supported
+
+
+def _item_key(material_type: str) -> str:
+    return "cards" if material_type == "flashcard" else "questions"
+
+
+def _snapshot() -> Dict[str, Any]:
+    return {
+        "lookups": _stats["lookups"],
+        "hits": _stats["hits"],
+        "hit_rate": round(_stats["hits"] / _stats["lookups"], 3) if _stats["lookups"] else 0.0,
+        "similarity_histogram": dict(_stats["similarity_histogram"]),
+    }
+
+
+def _record_lookup(hit: bool, similarity: float | None) -> Dict[str, Any]:
+    with _stats_lock:
+        _stats["lookups"] += 1
+        _stats["hits"] += 1 if hit else 0
+        if similarity is not None:
+            for bound in _SIMILARITY_BUCKETS:
+                if similarity <= bound:
+                    _stats["similarity_histogram"][f"<={bound}"] += 1
+                    break
+        return _snapshot()
+
+
+def get_semantic_cache_stats() -> Dict[str, Any]:
+    """
+    Hit rate and closest-topic similarity distribution for this container.
+
+    Returns:
+        Dict with lookups, hits, hit_rate and similarity_histogram
+    """
+    with _stats_lock:
+        return _snapshot()
+
+
+def subset_result(result: Dict[str, Any], material_type: str, num_items: int) -> Dict[str, Any]:
+    """Return result with only its first num_items questions/cards."""
+    key = _item_key(material_type)
+    return {**result, key: result[key][:num_items]}
+
+
+def get_semantic_cached_response(
+    connection,
+    topic_embedding: str,
+    textbook_id: str,
+    material_type: str,
+    difficulty: str,
+    num_items: int,
+    extra_params: str = "",
+    similarity_threshold: float = SIMILARITY_THRESHOLD
+) -> Dict[str, Any] | None:
+    """
+    Find a cached set for the closest topic with at least num_items items.
+
+    Args:
+        connection: Database connection
+        topic_embedding: Topic embedding in pgvector format (embedding_to_pgvector)
+        textbook_id: UUID of the textbook
+        material_type: Type of material ('mcq', 'flashcard', 'short_answer')
+        difficulty: Difficulty level
+        num_items: Number of questions/cards requested
+        extra_params: Type-specific parameters (num_options, card_type)
+        similarity_threshold: Minimum cosine similarity to serve a cached set
+
+    Returns:
+        Dict with result (reduced to num_items), sources, topic and
+        similarity; None on a miss or error
+    """
+    similarity = None
+    cached = None
+    search_settings = "SELECT set_config('hnsw.ef_search', %(ef_search)s, true);"
+    if supports_iterative_scan(connection):
+        # The scope filter is applied to the index scan's output; keep walking
+        # the graph until CANDIDATES in-scope rows are found
+        search_settings += "SELECT set_config('hnsw.iterative_scan', 'strict_order', true);"
+    
+    try:
+        with connection.cursor() as cur:
+            # Nearest topics first; the threshold is applied afterwards so the
+            # ORDER BY/LIMIT can use the HNSW index
+            cur.execute(
+                search_settings + """
+                SELECT
+                    id,
+                    topic,
+                    num_items,
+                    result,
+                    sources,
+                    topic_embedding <=> %(embedding)s::vector AS distance
+                FROM practice_material_cache
+                WHERE textbook_id = %(textbook_id)s
+                    AND material_type = %(material_type)s
+                    AND difficulty = %(difficulty)s
+                    AND extra_params = %(extra_params)s
+                    AND num_items >= %(num_items)s
+                    AND expires_at > now()
+                ORDER BY distance
+                LIMIT %(limit)s
+                """,
+                {
+                    "ef_search": str(HNSW_EF_SEARCH),
+                    "embedding": topic_embedding,
+                    "textbook_id": textbook_id,
+                    "material_type": material_type,
+                    "difficulty": difficulty,
+                    "extra_params": extra_params,
+                    "num_items": num_items,
+                    "limit": CANDIDATES,
+                }
+            )
+            candidates = cur.fetchall()
+
+            if candidates:
+                cache_id, topic, cached_items, result, sources, distance = candidates[0]
+                similarity = 1 - float(distance)
+                if similarity >= similarity_threshold:
+                    cur.execute(
+                        "UPDATE practice_material_cache SET hit_count = hit_count + 1 WHERE id = %s",
+                        (cache_id,)
+                    )
+                    cached = {
+                        "result": subset_result(result, material_type, num_items),
+                        "sources": sources or [],
+                        "topic": topic,
+                        "similarity": similarity,
+                        "cached_items": cached_items,
+                    }
+        connection.commit()
+    except Exception as e:
+        logger.error(f"Error checking semantic practice material cache: {e}")
+        connection.rollback()
+        return None
+
+    stats = _record_lookup(cached is not None, similarity)
+    if cached is not None:
+        logger.info(
+            f"Semantic cache HIT: topic '{cached['topic']}' (similarity {similarity:.4f}, "
+            f"{num_items}/{cached['cached_items']} items); stats: {json.dumps(stats)}"
+        )
+    elif similarity is not None:
+        logger.info(f"Semantic cache MISS: closest similarity {similarity:.4f} below {similarity_threshold}; stats: {json.dumps(stats)}")
+    else:
+        logger.info(f"Semantic cache MISS: no cached sets in scope; stats: {json.dumps(stats)}")
+    return cached
+
+
+def set_semantic_cached_response(
+    connection,
+    topic: str,
+    topic_embedding: str,
+    textbook_id: str,
+    material_type: str,
+    difficulty: str,
+    result: Dict[str, Any],
+    sources: list[str],
+    extra_params: str = ""
+) -> None:
+    """
+    Store a generated set with its topic embedding. Expired sets in the same
+    scope are removed at the same time.
+    """
+    try:
+        with connection.cursor() as cur:
+            cur.execute(
+                """
+                DELETE FROM practice_material_cache
+                WHERE textbook_id = %s AND material_type = %s AND expires_at <= now()
+                """,
+                (textbook_id, material_type)
+            )
+            cur.execute(
+                """
+                INSERT INTO practice_material_cache
+                    (textbook_id, material_type, difficulty, extra_params, topic, topic_embedding,
+                     num_items, result, sources, expires_at)
+                VALUES (%s, %s, %s, %s, %s, %s::vector, %s, %s, %s, now() + make_interval(days => %s))
+                """,
+                (
+                    textbook_id,
+                    material_type,
+                    difficulty,
+                    extra_params,
+                    topic,
+                    topic_embedding,
+                    len(result.get(_item_key(material_type), [])),
+                    json.dumps(result),
+                    json.dumps(sources),
+                    CACHE_TTL_DAYS,
+                )
+            )
+        connection.commit()
+        logger.info(f"Semantic cache SET for topic '{topic}' ({material_type}, {difficulty})")
+    except Exception as e:
+        logger.error(f"Error storing semantic practice material cache entry: {e}")
+        connection.rollback()
@@ -80,13 +80,13 @@ def get_textbook_retriever(llm, textbook_id: str, vectorstore_config_dict: Dict[
                     logger.warning(f"No embeddings found for textbook {textbook_id}")
                     return None
         finally:
-            if conn and not conn.closed:
-                # Return connection to pool if using pool, otherwise close it
-                if connection_pool:
-                    logger.debug("Returning connection to pool")
-                    connection_pool.putconn(conn)
-                else:
-                    conn.close()
+            # Return connection to pool if using pool (the pool discards it if
+            # it broke), otherwise close it
+            if conn and connection_pool:
+                logger.debug("Returning connection to pool")
+                connection_pool.putconn(conn)
+            elif conn and not conn.closed:
+                conn.close()
 
         vectorstore_config_dict['collection_name'] = textbook_id
         retriever = get_vectorstore_retriever(
@@ -2,18 +2,24 @@ import os
 import json
 import time
 import logging
-import boto3
-import psycopg2
-import psycopg2.pool
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict
 # import helpers
 from helpers.vectorstore import get_textbook_retriever
 from helpers.cache_manager import generate_cache_key, get_cached_response, set_cached_response
-from langchain_aws import BedrockEmbeddings, ChatBedrock
+from helpers.aws_clients import get_client, get_chat_bedrock
+from helpers.db_pool import ConnectionPool, pool_metrics
+from helpers.incremental_json import IncrementalItemParser
+from helpers.json_repair import extract_json_tolerant
+from helpers.semantic_cache import embedding_to_pgvector, get_semantic_cached_response, set_semantic_cached_response
+from helpers.practice_pool import sample_pool_items
+from langchain_aws import BedrockEmbeddings
 # practice material grading handler
-from generators.mcq import build_mcq_prompt, validate_mcq_shape
-from generators.flashcard import build_flashcard_prompt, validate_flashcard_shape
-from generators.short_answer import build_short_answer_prompt, validate_short_answer_shape, build_grading_prompt
+from generators.mcq import build_mcq_prompt, validate_mcq_shape, validate_mcq_item
+from generators.flashcard import build_flashcard_prompt, validate_flashcard_shape, validate_flashcard_item
+from generators.short_answer import build_short_answer_prompt, validate_short_answer_shape, validate_short_answer_item, build_grading_prompt, build_grading_repair_prompt, invalid_grading_fields
+from generators.sharding import should_shard, generate_sharded
+from generators.repair import empty_usage, add_usage, repair_generation
 # Set up logging - Lambda pre-configures root logger, so we need to set level explicitly
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -29,9 +35,9 @@ GUARDRAIL_ID_PARAM = os.environ.get("GUARDRAIL_ID_PARAM")
 COLD_START_METRIC = os.environ.get("COLD_START_METRIC", "false").lower() == "true"
 
 # AWS Clients
-secrets_manager = boto3.client("secretsmanager", region_name=REGION)
-ssm_client = boto3.client("ssm", region_name=REGION)
-bedrock_runtime = boto3.client("bedrock-runtime", region_name='us-east-1')  # For embeddings (Cohere is in us-east-1)
+secrets_manager = get_client("secretsmanager", region_name=REGION)
+ssm_client = get_client("ssm", region_name=REGION)
+bedrock_runtime = get_client("bedrock-runtime", region_name='us-east-1')  # For embeddings (Cohere is in us-east-1)
 
 # Cache for secrets and connections
 _db_secret: Dict[str, Any] | None = None
@@ -39,6 +45,8 @@ _connection_pool = None
 _embeddings = None
 _llm = None
 _is_cold_start = True
+# Tokens spent on repair calls during the current request
+_repair_usage: Dict[str, int] = empty_usage()
 
 # Pre-loaded configuration - loaded at container startup (outside handler)
 PRACTICE_MATERIAL_MODEL_ID: str | None = None
@@ -102,6 +110,34 @@ def emit_cold_start_metrics(function_name: str, execution_ms: int, cold_start_ms
         "ExecutionTimeMs": execution_ms,
     }
 
+    # Connection checkouts made during this request
+    db_metrics = pool_metrics(_connection_pool)
+    if db_metrics["definitions"]:
+        payload.update(db_metrics["values"])
+        payload["_aws"]["CloudWatchMetrics"].append({
+            "Namespace": "Lambda/Database",
+            "Dimensions": [["FunctionName"]],
+            "Metrics": db_metrics["definitions"],
+        })
+        payload["DbPool"] = _connection_pool.stats()
+
+    # Calls made to repair invalid LLM output during this request
+    if _repair_usage["calls"]:
+        payload.update({
+            "RepairCalls": _repair_usage["calls"],
+            "RepairInputTokens": _repair_usage["input_tokens"],
+            "RepairOutputTokens": _repair_usage["output_tokens"],
+        })
+        payload["_aws"]["CloudWatchMetrics"].append({
+            "Namespace": "Lambda/PracticeMaterial",
+            "Dimensions": [["FunctionName"]],
+            "Metrics": [
+                {"Name": "RepairCalls", "Unit": "Count"},
+                {"Name": "RepairInputTokens", "Unit": "Count"},
+                {"Name": "RepairOutputTokens", "Unit": "Count"},
+            ],
+        })
+
     print(json.dumps(payload))
 
 
@@ -132,10 +168,10 @@ def send_websocket_progress(
     
     try:
         endpoint_url = f"https://{domain_name}/{stage}"
-        apigw_management = boto3.client(
+        apigw_management = get_client(
             "apigatewaymanagementapi",
-            endpoint_url=endpoint_url,
-            region_name=REGION
+            region_name=REGION,
+            endpoint_url=endpoint_url
         )
         
         message = {
@@ -159,6 +195,78 @@ def send_websocket_progress(
         # Don't fail the request if WebSocket update fails
 
 
+def send_websocket_item(
+    connection_id: str | None,
+    domain_name: str | None,
+    stage: str | None,
+    material_type: str,
+    index: int,
+    total: int,
+    item: Dict[str, Any]
+) -> None:
+    """
+    Send one generated question/card to the client as soon as it is complete.
+    
+    The final "complete" progress message still carries the full, validated
+    result, which replaces the streamed items on the client.
+    """
+    if not connection_id or not domain_name or not stage:
+        return
+    
+    try:
+        apigw_management = get_client(
+            "apigatewaymanagementapi",
+            region_name=REGION,
+            endpoint_url=f"https://{domain_name}/{stage}"
+        )
+        apigw_management.post_to_connection(
+            ConnectionId=connection_id,
+            Data=json.dumps({
+                "type": "practice_material_item",
+                "material_type": material_type,
+                "index": index,
+                "total": total,
+                "item": item,
+            }).encode("utf-8")
+        )
+        logger.info(f"Sent {material_type} item {index + 1}/{total}")
+    except Exception as e:
+        logger.warning(f"Failed to send WebSocket item: {e}")
+
+
+def send_websocket_items_reset(
+    connection_id: str | None,
+    domain_name: str | None,
+    stage: str | None,
+    material_type: str
+) -> None:
+    """
+    Tell the client to discard the items streamed so far.
+    
+    Sent before a generation attempt that restarts item indices at 0, so its
+    items don't mix with the ones an earlier attempt already sent.
+    """
+    if not connection_id or not domain_name or not stage:
+        return
+    
+    try:
+        apigw_management = get_client(
+            "apigatewaymanagementapi",
+            region_name=REGION,
+            endpoint_url=f"https://{domain_name}/{stage}"
+        )
+        apigw_management.post_to_connection(
+            ConnectionId=connection_id,
+            Data=json.dumps({
+                "type": "practice_material_reset",
+                "material_type": material_type,
+            }).encode("utf-8")
+        )
+        logger.info(f"Sent {material_type} items reset")
+    except Exception as e:
+        logger.warning(f"Failed to send WebSocket items reset: {e}")
+
+
 def get_secret_dict(name: str) -> Dict[str, Any]:
     global _db_secret
     if _db_secret is None:
@@ -171,6 +279,7 @@ def get_connection_pool():
     """
     Get or create a connection pool for database operations.
     Connection pool is reused across Lambda invocations for better performance.
+    Connections are validated on checkout and broken ones replaced.
     """
     global _connection_pool
     
@@ -179,7 +288,7 @@ def get_connection_pool():
         db = get_secret_dict(SM_DB_CREDENTIALS)
         
         try:
-            _connection_pool = psycopg2.pool.ThreadedConnectionPool(
+            _connection_pool = ConnectionPool(
                 minconn=1,
                 maxconn=5,
                 dbname=db["dbname"],
@@ -227,21 +336,15 @@ def initialize_constants():
     
     # Initialize LLM if not already done
     if _llm is None:
-        # Create bedrock client for LLM in the appropriate region
-        llm_client = boto3.client("bedrock-runtime", region_name=BEDROCK_REGION)
         model_kwargs = {
             "temperature": 0.6,
             "max_tokens": 4096,
             "top_p": 0.9,
         }
-        logger.info(f"Creating ChatBedrock instance for model: {PRACTICE_MATERIAL_MODEL_ID}")
         logger.info(f"Model parameters: {json.dumps(model_kwargs)}")
         
-        _llm = ChatBedrock(
-            model_id=PRACTICE_MATERIAL_MODEL_ID,
-            model_kwargs=model_kwargs,
-            client=llm_client
-        )
+        # Shared bedrock-runtime client for the LLM region (reused across invocations)
+        _llm = get_chat_bedrock(PRACTICE_MATERIAL_MODEL_ID, model_kwargs, BEDROCK_REGION)
         logger.info("ChatBedrock LLM initialized successfully")
 
 
@@ -263,8 +366,8 @@ def apply_guardrails(text: str, source: str = "INPUT") -> dict:
         return {'blocked': False, 'action': 'NONE', 'assessments': []}
     
     try:
-        # Create bedrock client in the correct region for guardrails
-        bedrock_client = boto3.client("bedrock-runtime", region_name=BEDROCK_REGION)
+        # Shared bedrock client in the correct region for guardrails
+        bedrock_client = get_client("bedrock-runtime", region_name=BEDROCK_REGION)
         response = bedrock_client.apply_guardrail(
             guardrailIdentifier=GUARDRAIL_ID,
             guardrailVersion="DRAFT",
@@ -295,6 +398,90 @@ def apply_guardrails(text: str, source: str = "INPUT") -> dict:
 
 
 
+def generate_streaming(
+    prompt: str,
+    material_type: str,
+    num_items: int,
+    num_options: int,
+    send_item,
+    send_progress
+) -> Dict[str, Any]:
+    """
+    Stream the LLM output and send each completed item as soon as it parses.
+    
+    Each item is validated with its generator's item validator and checked by
+    the output guardrail (in parallel with the rest of the generation) before
+    it is sent. Items are sent in order; after a blocked item nothing more is
+    sent. The full output is returned for the usual whole-document
+    validation.
+    
+    Returns:
+        Dict with "output_text", "items_sent", "items_checked" (items that
+        passed the output guardrail) and "blocked" (guardrail result dict of
+        the first blocked item, or None)
+    """
+    if material_type == "mcq":
+        parser = IncrementalItemParser("questions")
+        validate_item = lambda item, idx: validate_mcq_item(item, idx, num_options)
+    elif material_type == "flashcard":
+        parser = IncrementalItemParser("cards")
+        validate_item = validate_flashcard_item
+    else:  # short_answer
+        parser = IncrementalItemParser("questions")
+        validate_item = validate_short_answer_item
+    
+    chunks = []
+    pending = []  # (index, item, guardrail future), in item order
+    state = {"items_sent": 0, "items_checked": 0, "blocked": None}
+    first_item_ms = None
+    start = time.time()
+    
+    def release(wait: bool) -> None:
+        while pending and state["blocked"] is None and (wait or pending[0][2].done()):
+            index, item, future = pending.pop(0)
+            guardrail_result = future.result()
+            if guardrail_result.get("blocked", False):
+                state["blocked"] = guardrail_result
+                return
+            state["items_checked"] += 1
+            send_item(index, item)
+            state["items_sent"] += 1
+            # Generation progress follows the items actually produced (40-85%)
+            send_progress("generating", 40 + int(45 * state["items_sent"] / num_items))
+    
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        for chunk in _llm.stream(prompt):
+            text = chunk.content if isinstance(chunk.content, str) else ""
+            chunks.append(text)
+            for item in parser.feed(text):
+                index = len(pending) + state["items_sent"]
+                if index >= num_items or state["blocked"] is not None:
+                    continue
+                try:
+                    validate_item(item, index)
+                except ValueError as e:
+                    # Left to the whole-document validation (and its retry)
+                    logger.warning(f"Streamed item failed validation: {e}")
+                    continue
+                if first_item_ms is None:
+                    first_item_ms = int((time.time() - start) * 1000)
+                    logger.info(f"First {material_type} item parsed after {first_item_ms}ms")
+                pending.append((index, item, executor.submit(apply_guardrails, json.dumps(item), "OUTPUT")))
+            release(wait=False)
+            if state["blocked"] is not None:
+                # Nothing more will be sent; stop paying for output tokens
+                break
+        release(wait=True)
+    
+    return {
+        "output_text": "".join(chunks),
+        "items_sent": state["items_sent"],
+        "items_checked": state["items_checked"],
+        "blocked": state["blocked"],
+        "first_item_ms": first_item_ms,
+    }
+
+
 def clamp(value: int, lo: int, hi: int) -> int:
     return max(lo, min(hi, value))
 
@@ -342,41 +529,26 @@ def track_practice_material_analytics(
         user_session_id: Optional user session UUID
     """
     try:
-        # Get database credentials
-        db = get_secret_dict(SM_DB_CREDENTIALS)
-        
-        # Connect to database
-        conn = psycopg2.connect(
-            dbname=db["dbname"],
-            user=db["username"],
-            password=db["password"],
-            host=RDS_PROXY_ENDPOINT,
-            port=db["port"]
-        )
-        
-        cursor = conn.cursor()
-        
-        # Insert analytics record
-        cursor.execute(
-            """
-            INSERT INTO practice_material_analytics 
-            (textbook_id, user_session_id, material_type, topic, num_items, difficulty, metadata)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """,
-            (
-                textbook_id,
-                user_session_id,
-                material_type,
-                topic,
-                num_items,
-                difficulty,
-                json.dumps(metadata)
-            )
-        )
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
+        # Insert analytics record on a pooled connection
+        with get_connection_pool().connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                    INSERT INTO practice_material_analytics 
+                    (textbook_id, user_session_id, material_type, topic, num_items, difficulty, metadata)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    """,
+                    (
+                        textbook_id,
+                        user_session_id,
+                        material_type,
+                        topic,
+                        num_items,
+                        difficulty,
+                        json.dumps(metadata)
+                    )
+                )
+            conn.commit()
         
         logger.info(f"Analytics tracked: {material_type} for textbook {textbook_id}")
         
@@ -396,23 +568,23 @@ def parse_body(body: str | None) -> Dict[str, Any]:
 
 
 def extract_json(text: str) -> Dict[str, Any]:
-    s = text.find("{")
-    e = text.rfind("}")
-    if s == -1 or e == -1 or e <= s:
-        raise ValueError("Model response did not contain JSON object")
-    return json.loads(text[s : e + 1])
+    # Repairs code fences, trailing commas and truncated output locally
+    return extract_json_tolerant(text)
 
 
 
 
 
 def handler(event, context):
-    global _is_cold_start
+    global _is_cold_start, _repair_usage
     start_time = time.time()
     cold_start_duration_ms = None
     if _is_cold_start:
         cold_start_duration_ms = int((time.time() - start_time) * 1000)
         _is_cold_start = False
+    if _connection_pool is not None:
+        _connection_pool.begin_request()
+    _repair_usage = empty_usage()
 
     def finalize(resp):
         execution_ms = int((time.time() - start_time) * 1000)
@@ -592,6 +764,82 @@ def handler(event, context):
             "port": db["port"],
         }
 
+        def respond_without_generation(response_data):
+            if is_websocket:
+                send_progress("complete", 100, data=response_data)
+                return finalize({"statusCode": 200})
+            return finalize({
+                "statusCode": 200,
+                "headers": {
+                    "Content-Type": "application/json",
+                    "Access-Control-Allow-Headers": "*",
+                    "Access-Control-Allow-Origin": "*",
+                    "Access-Control-Allow-Methods": "*",
+                },
+                "body": json.dumps(response_data)
+            })
+
+        # Semantic cache: serve the set cached for the closest topic (e.g.
+        # "cell respiration" for "cellular respiration"). With force_fresh the
+        # topic is only embedded when the generated set is stored.
+        topic_embedding = None
+        if not force_fresh:
+            try:
+                topic_embedding = embedding_to_pgvector(_embeddings.embed_query(topic))
+            except Exception as e:
+                logger.warning(f"Could not embed topic for the semantic cache: {e}")
+        if topic_embedding is not None:
+            semantic_hit = None
+            try:
+                with get_connection_pool().connection() as conn:
+                    semantic_hit = get_semantic_cached_response(
+                        conn, topic_embedding, textbook_id, material_type, difficulty, num_items, extra_params
+                    )
+            except Exception as e:
+                logger.warning(f"Semantic cache lookup failed, treating as a miss: {e}")
+            if semantic_hit is not None:
+                # Later requests for this exact topic hit the DynamoDB tier
+                set_cached_response(cache_key, semantic_hit["result"], semantic_hit["sources"])
+                return respond_without_generation({
+                    **semantic_hit["result"],
+                    "sources_used": semantic_hit["sources"],
+                    "cached": True,
+                    "cache_similarity": round(semantic_hit["similarity"], 4)
+                })
+
+            # Pre-generated pool: items from the sections closest to the topic
+            pool_hit = None
+            try:
+                with get_connection_pool().connection() as conn:
+                    pool_hit = sample_pool_items(
+                        conn, topic_embedding, topic, textbook_id, material_type, difficulty, num_items, extra_params
+                    )
+            except Exception as e:
+                logger.warning(f"Practice pool lookup failed, treating as a miss: {e}")
+            if pool_hit is not None:
+                try:
+                    if material_type == "mcq":
+                        validate_mcq_shape(pool_hit["result"], num_questions, num_options)
+                    elif material_type == "flashcard":
+                        validate_flashcard_shape(pool_hit["result"], num_cards)
+                    else:  # short_answer
+                        validate_short_answer_shape(pool_hit["result"], num_questions)
+                    pool_guardrail_result = apply_guardrails(json.dumps(pool_hit["result"]), source="OUTPUT")
+                except ValueError as e:
+                    logger.warning(f"Pool items failed validation: {e}")
+                    pool_guardrail_result = {"blocked": True}
+                if pool_guardrail_result.get("blocked", False):
+                    # Fall back to live generation
+                    logger.warning("Pool set rejected, generating live")
+                else:
+                    return respond_without_generation({
+                        **pool_hit["result"],
+                        "sources_used": pool_hit["sources"],
+                        "cached": True,
+                        "from_pool": True,
+                        "cache_similarity": round(pool_hit["similarity"], 4)
+                    })
+
         # Stage 3: Build retriever
         send_progress("retrieving", 15)
         logger.info(f"Building retriever for textbook {textbook_id}...")
@@ -642,9 +890,80 @@ def handler(event, context):
 
         # Stage 6: Invoke LLM (the slowest part - ~15 seconds)
         send_progress("generating", 40)
-        logger.info(f"Invoking LLM for {material_type} generation...")
-        response = _llm.invoke(prompt)
-        output_text = response.content
+        streamed = None
+        output_text = None
+        if should_shard(num_items):
+            # Large sets are generated as parallel shards so latency follows the shard size
+            logger.info(f"Generating {num_items} {material_type} items in parallel shards...")
+            sharded = {"items_sent": 0, "items_checked": 0, "blocked": None}
+            shard_start = time.time()
+            
+            def send_shard_items(items):
+                # Check each merged batch before any of its items reach the client.
+                # The set title is checked with the final output check below.
+                # Returning False stops the remaining shards
+                if sharded["blocked"] is not None:
+                    return False
+                guardrail_result = apply_guardrails(json.dumps(items), source="OUTPUT")
+                if guardrail_result.get("blocked", False):
+                    sharded["blocked"] = guardrail_result
+                    return False
+                sharded["items_checked"] += len(items)
+                for item in items:
+                    send_websocket_item(
+                        connection_id, domain_name, stage, material_type, sharded["items_sent"], num_items, item
+                    )
+                    sharded["items_sent"] += 1
+                send_progress("generating", 40 + int(45 * sharded["items_sent"] / num_items))
+                return True
+            
+            try:
+                output_text = json.dumps(generate_sharded(
+                    _llm, extract_json, material_type, topic, difficulty, num_items, snippets,
+                    num_options=num_options, card_type=card_type, on_items=send_shard_items
+                ))
+                streamed = sharded
+                logger.info(f"Sharded generation finished in {int((time.time() - shard_start) * 1000)}ms")
+            except Exception as e:
+                if sharded["blocked"] is not None:
+                    # Stopped by the guardrail; reported below
+                    logger.warning(f"Sharded generation stopped after a blocked batch: {e}")
+                    streamed = sharded
+                else:
+                    # Fall back to a single prompt (validated and retried below)
+                    logger.warning(f"Sharded generation failed, falling back to a single prompt: {e}")
+                    if sharded["items_sent"] > 0:
+                        # The fallback streams its own items from index 0
+                        send_websocket_items_reset(connection_id, domain_name, stage, material_type)
+        if streamed is None and is_websocket:
+            # Stream items to the client as they are generated
+            logger.info(f"Streaming LLM output for {material_type} generation...")
+            streamed = generate_streaming(
+                prompt, material_type, num_items, num_options,
+                send_item=lambda index, item: send_websocket_item(
+                    connection_id, domain_name, stage, material_type, index, num_items, item
+                ),
+                send_progress=send_progress
+            )
+            output_text = streamed["output_text"]
+        elif streamed is None:
+            logger.info(f"Invoking LLM for {material_type} generation...")
+            response = _llm.invoke(prompt)
+            output_text = response.content
+        if streamed is not None:
+            logger.info(f"Streamed {streamed['items_sent']}/{num_items} items")
+            if streamed["blocked"] is not None:
+                if streamed["blocked"].get("error"):
+                    logger.error(f"SECURITY: Output guardrail error: {streamed['blocked'].get('error')}")
+                    error_message = "I apologize, but I'm experiencing technical difficulties. Please try again later."
+                else:
+                    logger.warning("SECURITY: Streamed item blocked by output guardrails")
+                    error_message = "The generated content was filtered by our safety policy. Please try a different topic."
+                send_progress("error", 0, error=error_message)
+                return finalize({"statusCode": 400, "body": json.dumps({
+                    "error": "Generated content blocked by content policy",
+                    "guardrail_blocked": True
+                })})
         logger.info(f"LLM response received, length: {len(output_text)} chars")
         send_progress("validating", 85)
         
@@ -664,28 +983,21 @@ def handler(event, context):
         except Exception as e1:
             logger.warning(f"First parse/validation failed: {e1}")
             logger.warning(f"Raw LLM output (first 2000 chars): {output_text[:2000]}")
-            retry_prompt = prompt + "\n\nIMPORTANT: Your previous response was invalid. You MUST return valid JSON only, exactly matching the schema and lengths. No extra commentary."
-            logger.info("Retrying with enhanced prompt...")
-            
-            response2 = _llm.invoke(retry_prompt)
-            output_text2 = response2.content
-            logger.info(f"Retry response received, length: {len(output_text2)} chars")
-            logger.info(f"Raw retry LLM output: {output_text2}")
-            
+            # Keep the valid items and regenerate only the missing/invalid ones
+            logger.info("Repairing response...")
             try:
-                if material_type == "mcq":
-                    result = validate_mcq_shape(extract_json(output_text2), num_questions, num_options)
-                elif material_type == "flashcard":
-                    result = validate_flashcard_shape(extract_json(output_text2), num_cards)
-                else:  # short_answer
-                    result = validate_short_answer_shape(extract_json(output_text2), num_questions)
-                logger.info("Retry validation successful")
+                result = repair_generation(
+                    _llm, extract_json, output_text, material_type, topic, difficulty, num_items, snippets,
+                    num_options=num_options, card_type=card_type, usage=_repair_usage
+                )
+                logger.info(f"Repair successful, repair token usage: {_repair_usage}")
+                # Repaired items were not checked while streaming
+                streamed = None
             except Exception as e2:
-                logger.error(f"Retry also failed: {e2}")
-                logger.error(f"Raw retry output (first 2000 chars): {output_text2[:2000]}")
+                logger.error(f"Repair also failed: {e2} (repair token usage: {_repair_usage})")
                 # Send error via WebSocket for streaming clients
                 send_progress("error", 0, error=f"Failed to parse LLM response: {str(e2)}")
-                # Return the raw LLM responses to client for debugging
+                # Return the raw LLM response to client for debugging
                 return finalize({
                     "statusCode": 500,
                     "headers": {
@@ -695,18 +1007,22 @@ def handler(event, context):
                         "Access-Control-Allow-Methods": "*",
                     },
                     "body": json.dumps({
-                        "error": f"Failed to parse LLM response after retry: {str(e2)}",
+                        "error": f"Failed to parse LLM response after repair: {str(e2)}",
                         "firstAttemptError": str(e1),
                         "rawFirstResponse": output_text,
-                        "rawRetryResponse": output_text2,
-                        "debug": "Check the raw responses above to see what the LLM generated"
+                        "repairUsage": _repair_usage,
+                        "debug": "Check the raw response above to see what the LLM generated"
                     })
                 })
 
-        # Apply output guardrails on generated content
-        # Convert result to string for guardrail check
-        result_text = json.dumps(result)
-        output_guardrail_result = apply_guardrails(result_text, source="OUTPUT")
+        # Apply output guardrails on generated content. When every item already
+        # passed the per-item check while streaming, only the title is left
+        if streamed is not None and streamed["items_checked"] == num_items:
+            output_guardrail_result = apply_guardrails(json.dumps({"title": result.get("title", "")}), source="OUTPUT")
+        else:
+            # Convert result to string for guardrail check
+            result_text = json.dumps(result)
+            output_guardrail_result = apply_guardrails(result_text, source="OUTPUT")
         if output_guardrail_result.get('blocked', False):
             # Determine error message based on whether it was a technical error or content policy
             if output_guardrail_result.get('error'):
@@ -731,6 +1047,20 @@ def handler(event, context):
         
         # Store in cache for future requests
         set_cached_response(cache_key, result, sources_used)
+        if topic_embedding is None and force_fresh:
+            try:
+                topic_embedding = embedding_to_pgvector(_embeddings.embed_query(topic))
+            except Exception as e:
+                logger.warning(f"Could not embed topic for the semantic cache: {e}")
+        if topic_embedding is not None:
+            try:
+                with get_connection_pool().connection() as conn:
+                    set_semantic_cached_response(
+                        conn, topic, topic_embedding, textbook_id, material_type, difficulty,
+                        result, sources_used, extra_params
+                    )
+            except Exception as e:
+                logger.warning(f"Could not store the set in the semantic cache: {e}")
         logger.info(f"Cached response for {material_type} on topic '{topic}'")
         
         # Track analytics (async, non-blocking)
@@ -780,7 +1110,7 @@ def handler(event, context):
         
         # For WebSocket invocations, return minimal response (data sent via WebSocket)
         if is_websocket:
-            return {"statusCode": 200}
+            return finalize({"statusCode": 200})
         
         # For REST API invocations, return full response
         return finalize({
@@ -841,35 +1171,31 @@ def handle_grading(event, context):
         logger.info(f"Received grading response from LLM, length: {len(output_text)}")
         logger.info(f"Raw grading output: {output_text}")
         
-        # Parse JSON response
+        # Parse JSON response (code fences, trailing commas and truncation are repaired locally)
         try:
             result = extract_json(output_text)
-            
-            # Validate expected fields
-            if not isinstance(result.get("feedback"), str):
-                raise ValueError("feedback must be a string")
-            if not isinstance(result.get("strengths"), list):
-                raise ValueError("strengths must be an array")
-            if not isinstance(result.get("improvements"), list):
-                raise ValueError("improvements must be an array")
-            if not isinstance(result.get("keyPointsCovered"), list):
-                raise ValueError("keyPointsCovered must be an array")
-            if not isinstance(result.get("keyPointsMissed"), list):
-                raise ValueError("keyPointsMissed must be an array")
-                
-        except Exception as e1:
-            logger.warning(f"First grading parse failed: {e1}")
-            # Retry with enhanced prompt
-            retry_prompt = prompt + "\n\nIMPORTANT: Your previous response was invalid. Return valid JSON only."
-            logger.info("Retrying grading with enhanced prompt")
-            response2 = _llm.invoke(retry_prompt)
+        except ValueError as e1:
+            logger.warning(f"Grading response had no recoverable JSON: {e1}")
+            result = {}
+        
+        invalid_fields = invalid_grading_fields(result)
+        if invalid_fields:
+            # Ask only for the missing/invalid fields instead of regrading from scratch
+            logger.warning(f"Grading response missing/invalid fields: {invalid_fields}")
+            response2 = _llm.invoke(build_grading_repair_prompt(prompt, result, invalid_fields))
+            add_usage(_repair_usage, response2)
             output_text2 = response2.content
-            logger.info(f"Retry grading response: {output_text2}")
+            logger.info(f"Grading repair response: {output_text2}")
+            logger.info(f"Grading repair token usage: {_repair_usage}")
             
             try:
-                result = extract_json(output_text2)
+                repaired = extract_json(output_text2)
+                result = {**result, **{field: repaired.get(field) for field in invalid_fields}}
+                still_invalid = invalid_grading_fields(result)
+                if still_invalid:
+                    raise ValueError(f"Fields still missing or invalid: {still_invalid}")
             except Exception as e2:
-                logger.error(f"Retry grading also failed: {e2}")
+                logger.error(f"Grading repair also failed: {e2}")
                 return {
                     "statusCode": 500,
                     "headers": {
@@ -0,0 +1,108 @@
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import boto3
+from botocore.config import Config
+
+# Set up logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Clients and models are built once per container and reused across
+# invocations: constructing a boto3 client costs tens of milliseconds and
+# every new client opens a fresh TLS connection. botocore clients are thread
+# safe, so the pool is sized for the parallel pre-flight checks, guardrail
+# segments and background workers that share them.
+MAX_POOL_CONNECTIONS = int(os.environ.get("AWS_MAX_POOL_CONNECTIONS", "32"))
+
+_CLIENT_CONFIG = Config(
+    max_pool_connections=MAX_POOL_CONNECTIONS,
+    tcp_keepalive=True,
+    connect_timeout=5,
+    retries={"max_attempts": 3, "mode": "standard"},
+)
+
+_clients: Dict[Tuple, Any] = {}
+_resources: Dict[Tuple, Any] = {}
+_models: Dict[Tuple, Any] = {}
+_lock = threading.Lock()
+
+
+def get_client(service_name: str, region_name: Optional[str] = None, endpoint_url: Optional[str] = None):
+    """
+    Return a shared boto3 client for (service, region, endpoint).
+
+    Args:
+        service_name: boto3 service name (e.g. "bedrock-runtime")
+        region_name: AWS region (None uses the Lambda's default region)
+        endpoint_url: Custom endpoint (e.g. API Gateway management endpoint)
+    """
+    key = (service_name, region_name, endpoint_url)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = boto3.client(
+                    service_name,
+                    region_name=region_name,
+                    endpoint_url=endpoint_url,
+                    config=_CLIENT_CONFIG,
+                )
+                _clients[key] = client
+                logger.info(f"Created {service_name} client (region={region_name}, endpoint={endpoint_url})")
+    return client
+
+
+def get_resource(service_name: str, region_name: Optional[str] = None):
+    """Return a shared boto3 resource (e.g. DynamoDB) for (service, region)."""
+    key = (service_name, region_name)
+    resource = _resources.get(key)
+    if resource is None:
+        with _lock:
+            resource = _resources.get(key)
+            if resource is None:
+                resource = boto3.resource(service_name, region_name=region_name, config=_CLIENT_CONFIG)
+                _resources[key] = resource
+    return resource
+
+
+def get_chat_bedrock(model_id: str, model_kwargs: Dict[str, Any], region_name: Optional[str] = None):
+    """
+    Return a shared ChatBedrock for (model, region, model_kwargs).
+
+    Instances hold no per-request state, so they are reused across invocations.
+    """
+    from langchain_aws import ChatBedrock
+
+    key = ("chat", model_id, region_name, json.dumps(model_kwargs, sort_keys=True))
+    llm = _models.get(key)
+    if llm is None:
+        client = get_client("bedrock-runtime", region_name)
+        with _lock:
+            llm = _models.get(key)
+            if llm is None:
+                logger.info(f"Creating ChatBedrock instance for model: {model_id}")
+                llm = ChatBedrock(model_id=model_id, model_kwargs=model_kwargs, client=client)
+                _models[key] = llm
+    return llm
+
+
+def get_bedrock_llm_model(model_id: str, region_name: Optional[str] = None):
+    """Return a shared (text completion) BedrockLLM for (model, region)."""
+    from langchain_aws import BedrockLLM
+
+    key = ("llm", model_id, region_name)
+    llm = _models.get(key)
+    if llm is None:
+        client = get_client("bedrock-runtime", region_name)
+        with _lock:
+            llm = _models.get(key)
+            if llm is None:
+                logger.info(f"Creating BedrockLLM instance for model: {model_id}")
+                llm = BedrockLLM(model_id=model_id, client=client)
+                _models[key] = llm
+    return llm
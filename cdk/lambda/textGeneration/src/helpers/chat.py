@@ -1,18 +1,24 @@
 import re
-import boto3
 import os
 import time
+import threading
+from collections import OrderedDict, deque
 from concurrent.futures import ThreadPoolExecutor
-from langchain_aws import ChatBedrock, BedrockLLM
+from langchain_aws import ChatBedrock
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_classic.chains.combine_documents import create_stuff_documents_chain
 from langchain_classic.chains.retrieval import create_retrieval_chain
-from langchain_classic.chains.history_aware_retriever import create_history_aware_retriever
-from langchain_core.runnables.history import RunnableWithMessageHistory
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnableLambda
 from langchain_community.chat_message_histories import DynamoDBChatMessageHistory
 import logging
 import json
 import traceback
+from .websocket_sender import WebSocketSender
+from .deferred_tasks import defer
+from .chat_history import ChatHistoryWindow
+from .request_context import DEFAULT_SESSION_NAME
+from .aws_clients import get_client, get_chat_bedrock, get_bedrock_llm_model
 
 # Set up logging for this module
 logger = logging.getLogger(__name__)
@@ -21,6 +27,39 @@ logger.setLevel(logging.INFO)
 # Global cache for system prompt to reduce DB calls
 _SYSTEM_PROMPT_CACHE = None
 
+# Streaming output guardrails: answers are checked in segments of complete
+# sentences of at least MIN chars (cut at whitespace once MAX is reached
+# without a sentence boundary), with up to MAX_PARALLEL checks in flight.
+GUARDRAIL_SEGMENT_MIN_CHARS = int(os.environ.get("GUARDRAIL_SEGMENT_MIN_CHARS", "200"))
+GUARDRAIL_SEGMENT_MAX_CHARS = int(os.environ.get("GUARDRAIL_SEGMENT_MAX_CHARS", "1500"))
+GUARDRAIL_MAX_PARALLEL_CHECKS = 4
+
+# Chat sessions known to have a generated name. Once a session is named the
+# title is never regenerated, so this warm-container cache lets later turns
+# skip the naming task without touching DynamoDB or the database.
+_NAMED_SESSIONS = OrderedDict()
+_NAMED_SESSIONS_MAX = 1024
+_named_sessions_lock = threading.Lock()
+
+# Question rewrite fast path: follow-ups are only rewritten into standalone
+# questions (an extra LLM round-trip before retrieval) when they look like
+# they depend on the conversation.
+REWRITE_OVERLAP_THRESHOLD = 0.5
+_ANAPHORA_WORDS = {
+    "it", "its", "itself", "this", "that", "these", "those", "they", "them", "their", "theirs",
+    "he", "him", "his", "she", "her", "hers", "one", "ones", "former", "latter", "above",
+    "previous", "earlier", "same", "such", "there", "another", "else", "more", "again",
+}
+_STOPWORDS = {
+    "a", "an", "the", "and", "or", "but", "of", "to", "in", "on", "for", "with", "by", "at", "from",
+    "is", "are", "was", "were", "be", "been", "do", "does", "did", "can", "could", "would", "should",
+    "what", "why", "how", "when", "where", "which", "who", "whom", "i", "me", "my", "you", "your",
+    "we", "our", "please", "explain", "tell", "about", "give", "example", "mean", "means",
+} | _ANAPHORA_WORDS
+
+OUTPUT_GUARDRAIL_ERROR_MESSAGE = "I apologize, but I'm experiencing technical difficulties. Please try rephrasing your question."
+OUTPUT_GUARDRAIL_BLOCKED_MESSAGE = "I want to keep our conversation focused on learning and education. Let me redirect us back to your studies. What concept from your textbook can I help you understand better?"
+
 # Validate required environment variables
 TABLE_NAME = os.environ.get("TABLE_NAME_PARAM")
 if not TABLE_NAME:
@@ -89,17 +128,9 @@ def get_bedrock_llm(
         
         logger.info(f"Model parameters: {json.dumps(model_kwargs)}")
         
-        # Create Bedrock runtime client for the specified region
-        logger.info(f"Creating Bedrock runtime client for region: {bedrock_region}")
-        bedrock_runtime = boto3.client("bedrock-runtime", region_name=bedrock_region)
-        
-        # Create and return the ChatBedrock instance
-        logger.info(f"Creating ChatBedrock instance for model: {bedrock_llm_id}")
-        return ChatBedrock(
-            model_id=bedrock_llm_id,
-            model_kwargs=model_kwargs,
-            client=bedrock_runtime
-        )
+        # Shared per container: the client and its connections are reused
+        # across invocations instead of being rebuilt for every request
+        return get_chat_bedrock(bedrock_llm_id, model_kwargs, bedrock_region)
     except Exception as e:
         logger.error(f"Error initializing Bedrock LLM: {str(e)}")
         logger.error(traceback.format_exc())
@@ -111,7 +142,7 @@ def apply_guardrails(text: str, guardrail_id: str, source: str = "INPUT") -> dic
     SECURITY: Uses fail-closed model - blocks content when guardrails fail.
     """
     try:
-        bedrock_runtime = boto3.client("bedrock-runtime")
+        bedrock_runtime = get_client("bedrock-runtime")
         
         response = bedrock_runtime.apply_guardrail(
             guardrailIdentifier=guardrail_id,
@@ -284,35 +315,156 @@ def _apply_output_guardrails(response_text: str, guardrail_id: str, guardrail_as
         guardrail_assessments.extend(output_guardrail_response.get('assessments', []))
         
         if output_guardrail_response.get('blocked', False):
-            if output_guardrail_response.get('error'):
-                # Technical error - fail-closed, provide safe fallback
-                logger.error(f"SECURITY: Output guardrail error: {output_guardrail_response.get('error')}")
-                return "I apologize, but I'm experiencing technical difficulties. Please try rephrasing your question.", guardrail_assessments
-            else:
-                # Content policy violation
-                logger.warning("SECURITY: Output blocked by guardrails")
-                return "I want to keep our conversation focused on learning and education. Let me redirect us back to your studies. What concept from your textbook can I help you understand better?", guardrail_assessments
+            return _output_guardrail_message(output_guardrail_response), guardrail_assessments
     
     return response_text, guardrail_assessments
 
 
+def _output_guardrail_message(guardrail_response: dict) -> str:
+    """Return the safe replacement text for a blocked output guardrail check."""
+    if guardrail_response.get('error'):
+        # Technical error - fail-closed, provide safe fallback
+        logger.error(f"SECURITY: Output guardrail error: {guardrail_response.get('error')}")
+        return OUTPUT_GUARDRAIL_ERROR_MESSAGE
+    # Content policy violation
+    logger.warning("SECURITY: Output blocked by guardrails")
+    return OUTPUT_GUARDRAIL_BLOCKED_MESSAGE
+
+
+class _StreamingOutputGuardrail:
+    """
+    Output guardrail stage for streamed answers.
+    
+    Incoming text is cut into segments of complete sentences (via
+    split_into_sentences) and each segment is checked with apply_guardrails on
+    a worker pool while generation continues. Checked segments are released to
+    the client in order; only the unchecked tail is held back. If any segment
+    is blocked, nothing after it is released and the caller should stop
+    generating and replace the answer with safe_message.
+    
+    SECURITY: Fail-closed - a guardrail error blocks like a policy violation.
+    """
+    
+    def __init__(self, guardrail_id: str, emit):
+        """
+        Args:
+            guardrail_id: Bedrock guardrail ID (checks are skipped if empty)
+            emit: Callable receiving text that passed the guardrail
+        """
+        self.enabled = bool(guardrail_id and guardrail_id.strip())
+        self.blocked = False
+        self.safe_message = None
+        self.assessments = []
+        self.checks = 0
+        self._guardrail_id = guardrail_id
+        self._emit = emit
+        self._pending = ""
+        self._segments = deque()
+        self._executor = ThreadPoolExecutor(max_workers=GUARDRAIL_MAX_PARALLEL_CHECKS) if self.enabled else None
+    
+    def feed(self, text: str) -> bool:
+        """
+        Add generated text, submitting a segment for checking once enough
+        complete sentences are buffered.
+        
+        Returns:
+            False once the answer has been blocked
+        """
+        if self.blocked:
+            return False
+        if not self.enabled:
+            self._emit(text)
+            return True
+        
+        self._pending += text
+        segment = self._take_segment()
+        if segment:
+            self._submit(segment)
+        self._release_checked(wait=False)
+        return not self.blocked
+    
+    def finish(self) -> bool:
+        """
+        Check the remaining tail and release everything that passed, in order.
+        
+        Returns:
+            True if the whole answer passed the guardrail
+        """
+        if not self.enabled:
+            return True
+        
+        if not self.blocked and self._pending:
+            if self._pending.strip():
+                self._submit(self._pending)
+            else:
+                self._segments.append((self._pending, None))
+        self._pending = ""
+        
+        self._release_checked(wait=True)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        logger.info(f"Streaming output guardrail: {self.checks} segment checks, blocked={self.blocked}")
+        return not self.blocked
+    
+    def _take_segment(self):
+        """Split off the buffered complete sentences if they form a large enough segment."""
+        if len(self._pending) < GUARDRAIL_SEGMENT_MIN_CHARS:
+            return None
+        
+        # The last element is the (possibly incomplete) trailing sentence
+        tail = split_into_sentences(self._pending)[-1]
+        cut = len(self._pending) - len(tail)
+        
+        if cut < GUARDRAIL_SEGMENT_MIN_CHARS:
+            if len(self._pending) < GUARDRAIL_SEGMENT_MAX_CHARS:
+                return None
+            # No sentence boundary in a long window - cut at the last space
+            cut = self._pending.rfind(" ", 0, GUARDRAIL_SEGMENT_MAX_CHARS) + 1 or GUARDRAIL_SEGMENT_MAX_CHARS
+        
+        segment, self._pending = self._pending[:cut], self._pending[cut:]
+        return segment
+    
+    def _submit(self, segment: str) -> None:
+        self.checks += 1
+        future = self._executor.submit(apply_guardrails, segment, self._guardrail_id, "OUTPUT")
+        self._segments.append((segment, future))
+    
+    def _release_checked(self, wait: bool) -> None:
+        while self._segments and not self.blocked:
+            segment, future = self._segments[0]
+            if future is not None:
+                if not wait and not future.done():
+                    return
+                result = future.result()
+                self.assessments.extend(result.get('assessments', []))
+                if result.get('blocked', False):
+                    self.blocked = True
+                    self.safe_message = _output_guardrail_message(result)
+                    break
+            self._segments.popleft()
+            self._emit(segment)
+        
+        if self.blocked:
+            for _, pending_future in self._segments:
+                if pending_future is not None:
+                    pending_future.cancel()
+            self._segments.clear()
+
+
 def _initialize_chat_history(chat_session_id: str):
-    """Initialize DynamoDB chat history with error handling."""
+    """Load the bounded DynamoDB chat history window (one read) with error handling."""
     if not chat_session_id:
         logger.warning("No chat_session_id provided, chat history will not be maintained")
         chat_session_id = f"default-{int(time.time())}"  # Fallback session ID
         
     try:
-        chat_history = DynamoDBChatMessageHistory(
-            table_name=TABLE_NAME,
-            session_id=chat_session_id,
-            ttl=3600*24*30  # 30 days expiration (matches DynamoDB table TTL configuration)
-        )
+        chat_history = ChatHistoryWindow(TABLE_NAME, chat_session_id).load()
         
-        # Retrieve existing messages for logging
-        messages = chat_history.messages
-        logger.info(f"Current conversation has {len(messages)} messages in history")
-        for i, msg in enumerate(messages[-4:]):  # Log last 4 messages for context
+        logger.info(
+            f"Current conversation has {len(chat_history.messages)} messages in history, "
+            f"passing {len(chat_history.window)} to the chain"
+            f"{' with a summary of earlier turns' if chat_history.summary else ''}"
+        )
+        for i, msg in enumerate(chat_history.messages[-4:]):  # Log last 4 messages for context
             logger.info(f"History[{i}]: {msg.type} - {msg.content[:50]}...")
             
         return chat_history, chat_session_id
@@ -323,12 +475,61 @@ def _initialize_chat_history(chat_session_id: str):
         return None, chat_session_id
 
 
-def _create_rag_chains(llm, retriever, system_message: str):
-    """Create the RAG chains for processing queries."""
+def _tokenize(text: str) -> list[str]:
+    return re.findall(r"[a-z0-9']+", text.lower())
+
+
+def _needs_question_rewrite(query: str, chat_history: list) -> tuple[bool, str]:
+    """
+    Decide whether a question must be rewritten into a standalone question
+    before retrieval.
+    
+    Args:
+        query: The user's question
+        chat_history: Messages passed to the chain as history
+        
+    Returns:
+        Tuple of (needs_rewrite, reason)
+    """
+    if not chat_history:
+        return False, "first_turn"
+    
+    words = _tokenize(query)
+    content_words = {w for w in words if w not in _STOPWORDS and len(w) > 2}
+    
+    # Elliptical follow-ups ("why?", "and the second one?") carry no topic of their own
+    if len(content_words) < 2:
+        return True, "elliptical"
+    
+    if not any(w in _ANAPHORA_WORDS for w in words):
+        return False, "no_anaphora"
+    
+    # References back, but the question already restates the previous topic
+    previous_question = next((m.content for m in reversed(chat_history) if m.type == "human"), "")
+    previous_words = {w for w in _tokenize(previous_question) if w not in _STOPWORDS and len(w) > 2}
+    if previous_words:
+        overlap = len(content_words & previous_words) / len(content_words | previous_words)
+        if overlap >= REWRITE_OVERLAP_THRESHOLD:
+            return False, "lexical_overlap"
+    
+    return True, "anaphora"
+
+
+def _create_rag_chains(llm, retriever, system_message: str, rewrite_llm=None, rewrite_stats: dict = None):
+    """
+    Create the RAG chains for processing queries.
+    
+    Args:
+        llm: Model that answers the question
+        retriever: Retriever for the textbook
+        system_message: System prompt
+        rewrite_llm: Smaller model for standalone-question rewrites (defaults to llm)
+        rewrite_stats: Optional dict filled with the rewrite decision and latency
+    """
     contextualize_q_system_prompt = """Given a chat history and the latest user question \
                                         which might reference context in the chat history, formulate a standalone question \
                                         which can be understood without the chat history. Do NOT answer the question, \
-                                        just reformulate it if needed and otherwise return it as is."""
+                                        just reformulate it if needed and otherwise return it as is.{history_summary}"""
     
     contextualize_q_prompt = ChatPromptTemplate.from_messages([
         ("system", contextualize_q_system_prompt),
@@ -336,16 +537,33 @@ def _create_rag_chains(llm, retriever, system_message: str):
         ("human", "{input}"),
     ])
 
-    # Create history-aware retriever
-    history_aware_retriever_chain = create_history_aware_retriever(
-        llm, retriever, contextualize_q_prompt
-    )
+    # History-aware retriever: rewrite the question only when it depends on
+    # the conversation, otherwise retrieve with the question as asked
+    rewrite_chain = contextualize_q_prompt | (rewrite_llm or llm) | StrOutputParser()
+    if rewrite_stats is None:
+        rewrite_stats = {}
+    
+    def _retrieve(inputs: dict):
+        needs_rewrite, reason = _needs_question_rewrite(inputs["input"], inputs.get("chat_history", []))
+        rewrite_stats["rewrite_skipped"] = not needs_rewrite
+        rewrite_stats["rewrite_reason"] = reason
+        question = inputs["input"]
+        if needs_rewrite:
+            rewrite_start = time.time()
+            question = rewrite_chain.invoke(inputs).strip() or inputs["input"]
+            rewrite_stats["rewrite_ms"] = int((time.time() - rewrite_start) * 1000)
+            logger.info(f"Rewrote question ({reason}) in {rewrite_stats['rewrite_ms']}ms: '{question[:100]}'")
+        else:
+            logger.info(f"Skipped question rewrite ({reason})")
+        return retriever.invoke(question)
+    
+    history_aware_retriever_chain = RunnableLambda(_retrieve).with_config(run_name="chat_retriever_chain")
 
     qa_system_prompt = f"""{system_message}
 
 Use the following retrieved context from the textbook to guide your pedagogical response. Remember to ask questions and engage the student rather than just providing direct answers:
 
-{{context}}"""
+{{context}}{{history_summary}}"""
 
     qa_prompt = ChatPromptTemplate.from_messages([
         ("system", qa_system_prompt),
@@ -377,23 +595,29 @@ def _extract_sources_from_docs(docs) -> list[str]:
     return sources_used
 
 
-def _create_conversational_chain(rag_chain, chat_history, chat_session_id):
-    """Create conversational RAG chain with or without message history."""
-    if chat_history is not None:
-        return RunnableWithMessageHistory(
-            rag_chain,
-            lambda session_id: DynamoDBChatMessageHistory(
-                table_name=TABLE_NAME,
-                session_id=session_id,
-                ttl=3600*24*30  # 30 days expiration
-            ),
-            input_messages_key="input",
-            history_messages_key="chat_history",
-            output_messages_key="answer",
-        ), True
-    else:
+def _create_chain_inputs(query: str, chat_history) -> dict:
+    """Build the RAG chain inputs from the bounded history window and summary."""
+    if chat_history is None:
         logger.info("Using RAG chain without chat history due to DynamoDB error")
-        return rag_chain, False
+        return {"input": query, "chat_history": [], "history_summary": ""}
+    return {
+        "input": query,
+        "chat_history": chat_history.window,
+        "history_summary": chat_history.summary_prompt,
+    }
+
+
+def _save_chat_turn(chat_history, query: str, answer: str, llm) -> None:
+    """Append the turn to the stored history and defer summary compaction if due."""
+    if chat_history is None or not answer:
+        return
+    try:
+        chat_history.append_turn(query, answer)
+    except Exception as e:
+        logger.error(f"Error saving chat history: {e}")
+        return
+    if chat_history.needs_summary:
+        defer("chat_summary", chat_history.summarize, llm)
 
 
 def get_response_streaming(
@@ -407,7 +631,9 @@ def get_response_streaming(
     websocket_endpoint: str = None,
     connection_id: str = None,
     table_name: str = None,
-    bedrock_llm_id: str = None
+    bedrock_llm_id: str = None,
+    rewrite_llm=None,
+    session_name_checked: bool = False
 ) -> dict:
     """
     Generate a streaming response to a query using the provided retriever and LLM with chat history support.
@@ -425,12 +651,14 @@ def get_response_streaming(
         connection_id: WebSocket connection ID for sending messages
         table_name: DynamoDB table name for chat history (for session name generation)
         bedrock_llm_id: Bedrock LLM model ID (for session name generation)
+        rewrite_llm: Smaller model for follow-up question rewrites (defaults to llm)
+        session_name_checked: The caller already knows the session is unnamed
+            (request context), so naming skips its own chat_sessions lookup
         
     Returns:
-        A dictionary containing the response, sources_used, and optionally session_name
+        A dictionary containing the response and sources_used. The session name, if
+        generated, is sent afterwards as a separate "session_name" frame by a deferred task.
     """
-    import boto3
-    
     try:
         logger.info(f"Processing streaming query for textbook ID: {textbook_id}")
         logger.info(f"Query: '{query[:100]}...' (truncated)")
@@ -438,48 +666,34 @@ def get_response_streaming(
         
         start_time = time.time()
         
-        # Initialize WebSocket client
-        apigatewaymanagementapi = boto3.client('apigatewaymanagementapi', endpoint_url=websocket_endpoint)
-        
         # Validate WebSocket first
         if not websocket_endpoint or not connection_id:
              logger.warning("WebSocket parameters missing for streaming response")
              # Could fallback to non-streaming or error, but here we just proceed with limited functionality
         
+        # All frames for this answer go through one background sender that
+        # coalesces streamed chunks, so posting never blocks generation.
+        apigatewaymanagementapi = get_client('apigatewaymanagementapi', endpoint_url=websocket_endpoint)
+        sender = WebSocketSender(apigatewaymanagementapi, connection_id).start()
+        
         # Parallelize independent pre-flight checks
-        # 1. Send start message (IO limited)
-        # 2. Input Guardrails (Network/Bedrock)
-        # 3. Chat History (Network/DynamoDB)
-        # 4. System Prompt (DB/Cache)
+        # 1. Input Guardrails (Network/Bedrock)
+        # 2. Chat History (Network/DynamoDB)
+        # 3. System Prompt (DB/Cache)
+        # The start message is posted by the sender thread meanwhile.
         
         logger.info("Starting parallel pre-flight checks...")
-        
-        # Helper to send start message safely
-        def _send_start_message():
-            try:
-                apigatewaymanagementapi.post_to_connection(
-                    ConnectionId=connection_id,
-                    Data=json.dumps({
-                        "type": "start",
-                        "message": "Processing your question..."
-                    })
-                )
-                return True
-            except Exception as e:
-                logger.error(f"WebSocket start message failed: {e}")
-                return False
+        sender.send({
+            "type": "start",
+            "message": "Processing your question..."
+        })
 
-        with ThreadPoolExecutor(max_workers=4) as executor:
+        with ThreadPoolExecutor(max_workers=3) as executor:
             # Submit tasks
-            future_ws_start = executor.submit(_send_start_message)
             future_guardrails = executor.submit(_apply_input_guardrails, query, guardrail_id)
             future_history = executor.submit(_initialize_chat_history, chat_session_id)
             future_system_prompt = executor.submit(_get_system_prompt, connection)
             
-            # Wait for results
-            # Check WebSocket first - if this failed, we might want to abort or know about it
-            ws_alive = future_ws_start.result()
-            
             # Check Guardrails - blocking if failed
             guardrail_assessments, guardrail_error = future_guardrails.result()
             
@@ -489,17 +703,11 @@ def get_response_streaming(
 
         # Handle Guardrail Failure
         if guardrail_error:
-            if ws_alive:
-                try:
-                    apigatewaymanagementapi.post_to_connection(
-                        ConnectionId=connection_id,
-                        Data=json.dumps({
-                            "type": "error",
-                            "message": guardrail_error
-                        })
-                    )
-                except Exception:
-                    logger.warning("WebSocket connection closed during guardrail error")
+            sender.send({
+                "type": "error",
+                "message": guardrail_error
+            })
+            sender.close()
             
             return {
                 "response": guardrail_error,
@@ -508,8 +716,8 @@ def get_response_streaming(
                 "guardrail_blocked": True
             }
             
-        if not ws_alive:
-             logger.warning("WebSocket start message failed, proceeding but client may be disconnected")
+        if sender.is_gone:
+             logger.warning("WebSocket connection is gone, proceeding but client is disconnected")
 
         # Log completion of pre-flight
         logger.info(f"Pre-flight checks completed in {time.time() - start_time:.2f}s")
@@ -520,44 +728,39 @@ def get_response_streaming(
         
         logger.info("Fetching system prompt... (Done)")
         # Create RAG chains using helper function
-        rag_chain = _create_rag_chains(llm, retriever, system_message)
+        generation_metrics = {}
+        rag_chain = _create_rag_chains(llm, retriever, system_message, rewrite_llm, generation_metrics)
         
         # Stream the response using the RAG chain
         logger.info("Starting to stream response using RAG chain...")
         full_response = ""
         sources_used = []
         token_usage = None  # Will store actual token usage from Bedrock
+        generation_start = time.time()
+        
+        # Text reaches the client only after its segment passes the output guardrail
+        output_guardrail = _StreamingOutputGuardrail(guardrail_id, sender.send_chunk)
         
         try:
-            # Create conversational RAG chain using helper function
-            chain, has_history = _create_conversational_chain(rag_chain, chat_history, chat_session_id)
-            
-            # Stream the response
-            if has_history:
-                stream_iterator = chain.stream(
-                    {"input": query},
-                    config={"configurable": {"session_id": chat_session_id}}
-                )
-            else:
-                stream_iterator = chain.stream({"input": query})
+            # Stream the response over the bounded history window
+            stream_iterator = rag_chain.stream(_create_chain_inputs(query, chat_history))
             
             for chunk in stream_iterator:
                 if "answer" in chunk:
                     content = chunk["answer"]
                     if content:
+                        if not full_response:
+                            # Time to first token includes the rewrite decision and retrieval
+                            generation_metrics["ttft_ms"] = int((time.time() - generation_start) * 1000)
+                            logger.info(f"Time to first token: {generation_metrics['ttft_ms']}ms")
                         full_response += content
-                        # Send chunk via WebSocket
-                        try:
-                            apigatewaymanagementapi.post_to_connection(
-                                ConnectionId=connection_id,
-                                Data=json.dumps({
-                                    "type": "chunk",
-                                    "content": content
-                                })
-                            )
-                        except Exception as chunk_error:
-                            logger.error(f"WebSocket connection closed during streaming:  {chunk_error}")
-                            logger.error(f"Processing time so far: {time.time() - start_time:.2f} seconds")
+                        # Check and queue for coalesced delivery; stop generating if blocked or the client left
+                        if not output_guardrail.feed(content):
+                            logger.warning("SECURITY: Output blocked by guardrails during streaming, stopping generation")
+                            break
+                        if sender.is_gone:
+                            logger.warning("WebSocket connection gone during streaming, stopping generation")
+                            logger.warning(f"Processing time so far: {time.time() - start_time:.2f} seconds")
                             break
                     
                     # Try to extract token usage from the chunk
@@ -590,86 +793,69 @@ def get_response_streaming(
             logger.error(f"Error during streaming: {streaming_error}")
             # Fallback to non-streaming
             try:
-                chain, has_history = _create_conversational_chain(rag_chain, chat_history, chat_session_id)
-                
-                if has_history:
-                    result = chain.invoke(
-                        {"input": query},
-                        config={"configurable": {"session_id": chat_session_id}}
-                    )
-                else:
-                    result = chain.invoke({"input": query})
+                result = rag_chain.invoke(_create_chain_inputs(query, chat_history))
                 
-                full_response = result["answer"]
+                # Text streamed before the error was already fed to the guardrail
+                fed_text = full_response
+                answer = result["answer"]
                 docs = result["context"]
                 sources_used = _extract_sources_from_docs(docs)
                 
-                # Send the complete response as one chunk
-                try:
-                    apigatewaymanagementapi.post_to_connection(
-                        ConnectionId=connection_id,
-                        Data=json.dumps({
-                            "type": "chunk",
-                            "content": full_response
-                        })
-                    )
-                except Exception:
-                    logger.warning("WebSocket connection closed during fallback")
+                if answer.startswith(fed_text):
+                    # Send only the part the client has not received through the guardrail stage
+                    output_guardrail.feed(answer[len(fed_text):])
+                    full_response = answer
+                else:
+                    # The regenerated answer does not continue the streamed
+                    # one; keep the answer as the client received it
+                    logger.warning("Fallback answer does not continue the partial stream, keeping the streamed text")
             except Exception as fallback_error:
                 logger.error(f"Fallback also failed: {fallback_error}")
                 error_msg = "Sorry, I encountered an error processing your question."
                 full_response = error_msg
-                apigatewaymanagementapi.post_to_connection(
-                    ConnectionId=connection_id,
-                    Data=json.dumps({
-                        "type": "error",
-                        "message": error_msg
-                    })
-                )
+                sender.send({
+                    "type": "error",
+                    "message": error_msg
+                })
         
-        # Apply output guardrails using helper function
-        output_blocked = False
-        if full_response:
-            original_response = full_response
-            full_response, guardrail_assessments = _apply_output_guardrails(full_response, guardrail_id, guardrail_assessments)
-            # Check if response was modified by guardrails
-            if full_response != original_response:
-                output_blocked = True
-            # Note: WebSocket correction message would need to be sent here if response was modified
-        
-        # Generate session name if parameters are provided
-        session_name = None
-        if chat_session_id and table_name and bedrock_llm_id and connection:
-            try:
-                session_name = update_session_name(
-                    table_name=table_name,
-                    session_id=chat_session_id,
-                    bedrock_llm_id=bedrock_llm_id,
-                    db_connection=connection
-                )
-                if session_name:
-                    logger.info(f"Generated session name: {session_name}")
-                else:
-                    logger.info("Session name not generated (may already exist or insufficient history)")
-            except Exception as name_error:
-                logger.error(f"Error generating session name: {name_error}")
-                # Don't fail the request if session name generation fails
+        generation_seconds = time.time() - generation_start
+        
+        # Only the unchecked tail is left to verify here; everything else was
+        # checked while the answer was being generated
+        output_blocked = not output_guardrail.finish()
+        guardrail_assessments.extend(output_guardrail.assessments)
+        if output_blocked:
+            full_response = output_guardrail.safe_message
+            sources_used = []
+            # The frontend replaces the partially shown answer with the error text
+            sender.send({
+                "type": "error",
+                "message": full_response
+            })
+        
+        # Persist the turn with a single write (the answer as the user saw it)
+        _save_chat_turn(chat_history, query, full_response, llm)
         
-        # Send completion message with sources and session name
+        # Send completion message with sources; the session name follows in
+        # its own frame so the UI unlocks without waiting on title generation
         completion_data = {
             "type": "complete",
             "sources": sources_used
         }
-        if session_name:
-            completion_data["session_name"] = session_name
-            
-        try:
-            apigatewaymanagementapi.post_to_connection(
-                ConnectionId=connection_id,
-                Data=json.dumps(completion_data)
-            )
-        except Exception:
-            logger.warning("WebSocket connection closed during completion")
+        sender.send(completion_data)
+        stream_stats = sender.close()
+        
+        if chat_session_id and table_name and bedrock_llm_id and connection and not sender.is_gone:
+            if is_session_named(chat_session_id):
+                logger.info("Session already named, skipping session name generation")
+            else:
+                defer(
+                    "session_name",
+                    _name_session_and_notify,
+                    table_name, chat_session_id, bedrock_llm_id, connection,
+                    apigatewaymanagementapi, connection_id,
+                    check_existing=not session_name_checked
+                )
         
         end_time = time.time()
         logger.info(f"Streaming response completed in {end_time - start_time:.2f} seconds")
@@ -678,19 +864,23 @@ def get_response_streaming(
         if token_usage:
             logger.info(f"Token usage: {token_usage}")
         
+        # Per-answer delivery stats: chunks_received is the number of posts the
+        # previous one-post-per-chunk sender would have made
+        output_tokens = (token_usage or {}).get('output_tokens', 0)
+        stream_stats["tokens_per_second"] = round(output_tokens / generation_seconds, 1) if generation_seconds > 0 and output_tokens else None
+        logger.info(f"Stream stats: {json.dumps(stream_stats)}")
+        
         result_dict = {
             "response": full_response,
             "sources_used": sources_used,
+            "stream_stats": stream_stats,
+            "generation_metrics": generation_metrics,
         }
         
         # Include token usage if captured
         if token_usage:
             result_dict["token_usage"] = token_usage
         
-        # Include session name if generated
-        if session_name:
-            result_dict["session_name"] = session_name
-        
         # Include guardrail assessments if they exist
         if guardrail_assessments:
             result_dict["assessments"] = guardrail_assessments
@@ -705,13 +895,11 @@ def get_response_streaming(
         logger.error(f"Error in get_response_streaming: {str(e)}")
         logger.error(traceback.format_exc())
         try:
-            apigatewaymanagementapi.post_to_connection(
-                ConnectionId=connection_id,
-                Data=json.dumps({
-                    "type": "error",
-                    "message": "Sorry, I encountered an error processing your question."
-                })
-            )
+            sender.send({
+                "type": "error",
+                "message": "Sorry, I encountered an error processing your question."
+            })
+            sender.close()
         except:
             pass
         return {
@@ -847,17 +1035,8 @@ def get_response(
         # Create RAG chains using helper function
         rag_chain = _create_rag_chains(llm, retriever, system_message)
         
-        # Create conversational RAG chain using helper function
-        chain, has_history = _create_conversational_chain(rag_chain, chat_history, chat_session_id)
-        
-        # Execute the chain
-        if has_history:
-            result = chain.invoke(
-                {"input": query},
-                config={"configurable": {"session_id": chat_session_id}}
-            )
-        else:
-            result = chain.invoke({"input": query})
+        # Execute the chain over the bounded history window
+        result = rag_chain.invoke(_create_chain_inputs(query, chat_history))
         
         # Log the complete result object structure for debugging
         logger.info(f"RAG chain result type: {type(result)}")
@@ -875,6 +1054,8 @@ def get_response(
         response_text, guardrail_assessments = _apply_output_guardrails(response_text, guardrail_id, guardrail_assessments)
         output_blocked = (response_text != original_response)
         
+        _save_chat_turn(chat_history, query, response_text, llm)
+        
         # Extract sources using helper function
         sources_used = _extract_sources_from_docs(docs)
         
@@ -919,14 +1100,69 @@ def split_into_sentences(paragraph: str) -> list[str]:
     sentences = re.split(sentence_endings, paragraph)
     return sentences
 
-def update_session_name(table_name: str, session_id: str, bedrock_llm_id: str, db_connection=None) -> str:
-    """Generate session name from first exchange and update database."""
+def is_session_named(session_id: str) -> bool:
+    """Return True if this container has already seen a name for the session."""
+    with _named_sessions_lock:
+        if session_id in _NAMED_SESSIONS:
+            _NAMED_SESSIONS.move_to_end(session_id)
+            return True
+        return False
+
+
+def mark_session_named(session_id: str) -> None:
+    """Record that a session has a name so later turns skip naming."""
+    with _named_sessions_lock:
+        _NAMED_SESSIONS[session_id] = True
+        _NAMED_SESSIONS.move_to_end(session_id)
+        while len(_NAMED_SESSIONS) > _NAMED_SESSIONS_MAX:
+            _NAMED_SESSIONS.popitem(last=False)
+
+
+def _name_session_and_notify(table_name: str, session_id: str, bedrock_llm_id: str, db_connection,
+                             apigatewaymanagementapi, connection_id: str, check_existing: bool = True) -> None:
+    """
+    Deferred task: generate the session name and push it to the client as a
+    separate "session_name" WebSocket frame after the "complete" frame.
+    """
+    session_name = update_session_name(
+        table_name=table_name,
+        session_id=session_id,
+        bedrock_llm_id=bedrock_llm_id,
+        db_connection=db_connection,
+        check_existing=check_existing
+    )
+    if not session_name:
+        logger.info("Session name not generated (insufficient history)")
+        return
+    
+    logger.info(f"Generated session name: {session_name}")
+    try:
+        apigatewaymanagementapi.post_to_connection(
+            ConnectionId=connection_id,
+            Data=json.dumps({
+                "type": "session_name",
+                "session_name": session_name,
+                "chat_session_id": session_id
+            })
+        )
+    except Exception as e:
+        # The client may have disconnected; the name is already stored
+        logger.warning(f"Could not send session name to client: {e}")
+
+
+def update_session_name(table_name: str, session_id: str, bedrock_llm_id: str, db_connection=None, check_existing: bool = True) -> str:
+    """
+    Generate session name from first exchange and update database.
+    
+    Pass check_existing=False when the caller has already read the session
+    name (request context) and knows it is unset.
+    """
     
-    dynamodb_client = boto3.client("dynamodb")
+    dynamodb_client = get_client("dynamodb")
     
     try:
         # First check if session name has already been updated
-        if db_connection:
+        if db_connection and check_existing:
             try:
                 with db_connection.cursor() as cur:
                     cur.execute(
@@ -934,8 +1170,9 @@ def update_session_name(table_name: str, session_id: str, bedrock_llm_id: str, d
                         (session_id,)
                     )
                     row = cur.fetchone()
-                    if row and row[0] and row[0] != "New Chat Session":
+                    if row and row[0] and row[0] != DEFAULT_SESSION_NAME:
                         # Session name already customized, don't update
+                        mark_session_named(session_id)
                         return row[0]
             except Exception as db_error:
                 print(f"Error checking existing session name: {db_error}")
@@ -972,7 +1209,7 @@ def update_session_name(table_name: str, session_id: str, bedrock_llm_id: str, d
             
         # Generate simple name
         
-        llm = BedrockLLM(model_id=bedrock_llm_id)
+        llm = get_bedrock_llm_model(bedrock_llm_id)
         title_system_prompt = """
             You are given the first message from an AI and the first message from a student in a conversation. 
             Based on these two messages, come up with a name that describes the conversation. 
@@ -1003,6 +1240,7 @@ def update_session_name(table_name: str, session_id: str, bedrock_llm_id: str, d
                         (session_name, session_id)
                     )
                 db_connection.commit()
+                mark_session_named(session_id)
                 print(f"Successfully updated session name in database: {session_name}")
             except Exception as db_error:
                 db_connection.rollback()
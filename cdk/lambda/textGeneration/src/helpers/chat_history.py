@@ -0,0 +1,154 @@
+import logging
+import os
+import time
+from typing import List, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, messages_from_dict, messages_to_dict
+
+from .aws_clients import get_resource
+
+# Set up logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Number of most recent question/answer turns passed verbatim to the chain.
+# Older turns are represented by a rolling summary.
+HISTORY_WINDOW_TURNS = int(os.environ.get("HISTORY_WINDOW_TURNS", "4"))
+# Summarize once this many turns have fallen out of the window unsummarized,
+# so the summary LLM call runs every few turns rather than on every answer.
+HISTORY_SUMMARY_BATCH_TURNS = int(os.environ.get("HISTORY_SUMMARY_BATCH_TURNS", "2"))
+# Matches the DynamoDB table TTL configuration (30 days)
+HISTORY_TTL_SECONDS = 3600 * 24 * 30
+
+# Item attributes. History/expireAt are the DynamoDBChatMessageHistory layout,
+# which get_chat_history and update_session_name still read.
+HISTORY_KEY = "History"
+TTL_KEY = "expireAt"
+SUMMARY_KEY = "Summary"
+SUMMARIZED_COUNT_KEY = "SummarizedCount"
+
+SUMMARY_PROMPT = """You maintain a running summary of a tutoring conversation between a student and an AI tutor about a textbook.
+Update the summary with the new messages below. Keep the topics, concepts and questions the student has covered, what they
+struggled with, and anything the tutor asked them to do next. Write at most 150 words of plain prose. ONLY OUTPUT THE SUMMARY.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}"""
+
+def _get_table(table_name: str):
+    return get_resource("dynamodb").Table(table_name)
+
+
+class ChatHistoryWindow:
+    """
+    Chat history for one session, read once per request.
+
+    The DynamoDB item is fetched with a single GetItem. The chain only sees
+    the last HISTORY_WINDOW_TURNS turns plus a rolling summary of everything
+    before them, so prompt size stays bounded however long the conversation
+    gets. The new turn is appended with a single UpdateItem (list_append), and
+    the summary is refreshed by summarize() outside the response path.
+    """
+
+    def __init__(self, table_name: str, session_id: str, window_turns: int = HISTORY_WINDOW_TURNS):
+        """
+        Args:
+            table_name: DynamoDB chat history table name
+            session_id: Chat session ID (the table's SessionId key)
+            window_turns: Number of recent turns passed to the chain verbatim
+        """
+        self.table_name = table_name
+        self.session_id = session_id
+        self.window_size = max(window_turns, 0) * 2
+        self.messages: List[BaseMessage] = []
+        self.summary = ""
+        self.summarized_count = 0
+
+    def load(self) -> "ChatHistoryWindow":
+        """Read the session item (one GetItem)."""
+        response = _get_table(self.table_name).get_item(Key={"SessionId": self.session_id})
+        item = response.get("Item") or {}
+        self.messages = messages_from_dict(item.get(HISTORY_KEY, []))
+        self.summary = item.get(SUMMARY_KEY, "") or ""
+        self.summarized_count = int(item.get(SUMMARIZED_COUNT_KEY, 0) or 0)
+        return self
+
+    @property
+    def window(self) -> List[BaseMessage]:
+        """The most recent turns, passed to the chain as chat_history."""
+        if not self.window_size:
+            return []
+        return self.messages[-self.window_size:]
+
+    @property
+    def summary_prompt(self) -> str:
+        """Summary of turns outside the window, formatted for the system prompt."""
+        if not self.summary:
+            return ""
+        return f"\n\nSummary of the earlier conversation with this student:\n{self.summary}"
+
+    @property
+    def needs_summary(self) -> bool:
+        """True once enough turns have left the window without being summarized."""
+        outside_window = len(self.messages) - self.window_size
+        return outside_window - self.summarized_count >= HISTORY_SUMMARY_BATCH_TURNS * 2
+
+    def append_turn(self, question: str, answer: str) -> None:
+        """Append a question/answer turn to the stored history with a single write."""
+        new_messages = [HumanMessage(content=question), AIMessage(content=answer)]
+        _get_table(self.table_name).update_item(
+            Key={"SessionId": self.session_id},
+            UpdateExpression=(
+                f"SET {HISTORY_KEY} = list_append(if_not_exists({HISTORY_KEY}, :empty), :new), {TTL_KEY} = :t"
+            ),
+            ExpressionAttributeValues={
+                ":empty": [],
+                ":new": messages_to_dict(new_messages),
+                ":t": int(time.time()) + HISTORY_TTL_SECONDS,
+            },
+        )
+        self.messages.extend(new_messages)
+
+    def summarize(self, llm) -> Optional[str]:
+        """
+        Fold the turns that have left the window into the rolling summary.
+
+        Args:
+            llm: Chat model used to write the summary
+
+        Returns:
+            The new summary, or None if nothing needed summarizing
+        """
+        if not self.needs_summary:
+            return None
+
+        summarize_until = len(self.messages) - self.window_size
+        new_messages = self.messages[self.summarized_count:summarize_until]
+        transcript = "\n".join(
+            f"{'Student' if msg.type == 'human' else 'Tutor'}: {msg.content}" for msg in new_messages
+        )
+        result = llm.invoke(SUMMARY_PROMPT.format(summary=self.summary or "(none)", messages=transcript))
+        summary = getattr(result, "content", result)
+        if not isinstance(summary, str) or not summary.strip():
+            return None
+
+        try:
+            # Never overwrite a summary that already covers more of the conversation
+            _get_table(self.table_name).update_item(
+                Key={"SessionId": self.session_id},
+                UpdateExpression=f"SET {SUMMARY_KEY} = :s, {SUMMARIZED_COUNT_KEY} = :c",
+                ConditionExpression=f"attribute_not_exists({SUMMARIZED_COUNT_KEY}) OR {SUMMARIZED_COUNT_KEY} < :c",
+                ExpressionAttributeValues={":s": summary.strip(), ":c": summarize_until},
+            )
+        except Exception as e:
+            if getattr(e, "response", {}).get("Error", {}).get("Code") == "ConditionalCheckFailedException":
+                logger.info("Chat summary already up to date")
+                return None
+            raise
+
+        self.summary = summary.strip()
+        self.summarized_count = summarize_until
+        logger.info(f"Updated chat summary for session {self.session_id} through message {summarize_until}")
+        return self.summary
@@ -0,0 +1,56 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, List, Tuple
+
+# Set up logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Work queued during a request that does not affect the answer the user sees
+# (session naming, cache write-back, ...). The handler drains the queue after
+# the response has been delivered and before the connection is returned to
+# the pool, so nothing is left running when the execution environment freezes.
+_tasks: List[Tuple[str, Callable, tuple, dict]] = []
+_tasks_lock = threading.Lock()
+
+
+def defer(name: str, fn: Callable, *args: Any, **kwargs: Any) -> None:
+    """
+    Queue fn(*args, **kwargs) to run after the response has been sent.
+
+    Args:
+        name: Short task name used in logs
+        fn: Callable to run
+    """
+    with _tasks_lock:
+        _tasks.append((name, fn, args, kwargs))
+    logger.debug(f"Deferred task queued: {name}")
+
+
+def pending_count() -> int:
+    """Return the number of queued tasks."""
+    with _tasks_lock:
+        return len(_tasks)
+
+
+def run_deferred_tasks() -> int:
+    """
+    Run all queued tasks in order. Failures are logged and do not stop later tasks.
+
+    Returns:
+        Number of tasks that ran
+    """
+    with _tasks_lock:
+        tasks = list(_tasks)
+        _tasks.clear()
+
+    for name, fn, args, kwargs in tasks:
+        start = time.time()
+        try:
+            fn(*args, **kwargs)
+            logger.info(f"Deferred task {name} finished in {(time.time() - start) * 1000:.0f}ms")
+        except Exception as e:
+            logger.error(f"Deferred task {name} failed: {e}", exc_info=True)
+
+    return len(tasks)
@@ -1,10 +1,18 @@
 import logging
 import json
-import boto3
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
 from typing import Optional, Dict, Any, Tuple
-from datetime import datetime
+from datetime import datetime, timezone
 import psycopg2
+from psycopg2.extras import execute_values
 from langchain_aws import BedrockEmbeddings
+from .aws_clients import get_client, get_resource
+from .websocket_sender import WebSocketSender
 
 # Setup logging
 logger = logging.getLogger(__name__)
@@ -12,6 +20,276 @@ logger = logging.getLogger(__name__)
 # Similarity threshold for considering a question as cached
 SIMILARITY_THRESHOLD = 0.85  # Adjust this value based on testing (0.0 to 1.0)
 MAX_CACHE_SIZE = 100  # Maximum number of FAQs to keep in cache
+FAQ_CANDIDATES = 3  # Nearest neighbours fetched before applying the similarity threshold
+HNSW_EF_SEARCH = 40  # HNSW candidate list size for FAQ lookups
+
+# Eviction is amortized: a textbook's cache is trimmed after every
+# EVICTION_CHECK_EVERY inserts from this container, or on the first insert
+# once EVICTION_CHECK_INTERVAL_SECONDS have passed since its last trim. The
+# cache may exceed MAX_CACHE_SIZE by a few entries in between.
+EVICTION_CHECK_EVERY = int(os.environ.get("FAQ_EVICTION_CHECK_EVERY", "10"))
+EVICTION_CHECK_INTERVAL_SECONDS = int(os.environ.get("FAQ_EVICTION_CHECK_INTERVAL_SECONDS", "900"))
+
+# pgvector >= 0.8 supports iterative index scans (checked once per container)
+_iterative_scan_supported = None
+
+# Exact-match tiers in front of the semantic lookup. A question whose
+# normalized text was answered before (for the same textbook) is served from
+# an in-process LRU, then from DynamoDB, without embedding it or querying
+# pgvector. Only exact misses reach the semantic tier. Every exact hit is
+# confirmed against its faq_cache row by primary key, so admin edits, deletes,
+# reports and evictions take effect immediately.
+EXACT_CACHE_MAX_ENTRIES = int(os.environ.get("FAQ_EXACT_CACHE_MAX_ENTRIES", "512"))
+EXACT_CACHE_TTL_SECONDS = int(os.environ.get("FAQ_EXACT_CACHE_TTL_SECONDS", "900"))
+ANSWER_CACHE_TTL_SECONDS = int(os.environ.get("FAQ_ANSWER_CACHE_TTL_SECONDS", str(24 * 60 * 60)))
+
+CACHE_TIER_LRU = "lru"
+CACHE_TIER_DYNAMODB = "dynamodb"
+CACHE_TIER_SEMANTIC = "semantic"
+
+_exact_cache: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+_exact_cache_lock = threading.Lock()
+_answer_table = None
+_tier_stats_lock = threading.Lock()
+_tier_stats = {"lookups": 0, "lru_hits": 0, "dynamodb_hits": 0, "semantic_hits": 0, "misses": 0}
+
+# FAQ hits not yet written: faq_id -> [hits, last hit timestamp]. Cache hits
+# only touch this dict; flush_faq_usage writes all of it in one UPDATE at the
+# end of the invocation (and before any eviction, which orders by usage).
+_pending_usage: Dict[str, list] = {}
+_pending_usage_lock = threading.Lock()
+
+_FLUSH_USAGE_SQL = """
+    UPDATE faq_cache AS f
+    SET usage_count = f.usage_count + v.hits,
+        last_used_at = GREATEST(f.last_used_at, v.last_used_at)
+    FROM (VALUES %s) AS v(id, hits, last_used_at)
+    WHERE f.id = v.id
+"""
+
+# textbook_id -> [inserts since last trim, time of last trim]
+_eviction_state: Dict[str, list] = {}
+_eviction_lock = threading.Lock()
+
+
+def normalize_question(question: str) -> str:
+    """
+    Normalize a question for exact-match cache keys.
+    
+    Same rules as normalize_topic in practiceMaterial's cache_manager:
+    lowercase, strip, drop punctuation except hyphens, collapse whitespace.
+    """
+    if not question:
+        return ""
+    
+    normalized = question.lower().strip()
+    normalized = re.sub(r'[^\w\s-]', '', normalized)
+    normalized = re.sub(r'\s+', ' ', normalized)
+    
+    return normalized.strip()
+
+
+def exact_cache_key(textbook_id: str, question: str) -> str:
+    """Return the exact-match cache key (MD5 of textbook ID and normalized question)."""
+    cache_string = f"{textbook_id}:{normalize_question(question)}"
+    return hashlib.md5(cache_string.encode()).hexdigest()
+
+
+def _count_tier(key: str) -> None:
+    with _tier_stats_lock:
+        _tier_stats[key] += 1
+
+
+def get_faq_cache_tier_stats() -> Dict[str, Any]:
+    """
+    Return container-lifetime lookup counters and hit ratios per tier.
+    
+    Each tier's hit ratio is relative to the lookups that reached it, so
+    dynamodb_hit_ratio is the share of LRU misses DynamoDB answered.
+    """
+    with _tier_stats_lock:
+        stats = dict(_tier_stats)
+    
+    reached_lru = stats["lookups"]
+    reached_dynamodb = reached_lru - stats["lru_hits"]
+    reached_semantic = reached_dynamodb - stats["dynamodb_hits"]
+    stats["lru_hit_ratio"] = round(stats["lru_hits"] / reached_lru, 4) if reached_lru else 0.0
+    stats["dynamodb_hit_ratio"] = round(stats["dynamodb_hits"] / reached_dynamodb, 4) if reached_dynamodb else 0.0
+    stats["semantic_hit_ratio"] = round(stats["semantic_hits"] / reached_semantic, 4) if reached_semantic else 0.0
+    hits = stats["lru_hits"] + stats["dynamodb_hits"] + stats["semantic_hits"]
+    stats["hit_ratio"] = round(hits / reached_lru, 4) if reached_lru else 0.0
+    stats["lru_entries"] = len(_exact_cache)
+    return stats
+
+
+def _lru_get(cache_key: str) -> Optional[Dict[str, Any]]:
+    with _exact_cache_lock:
+        cached = _exact_cache.get(cache_key)
+        if cached is None:
+            return None
+        expires_at, entry = cached
+        if expires_at <= time.time():
+            del _exact_cache[cache_key]
+            return None
+        _exact_cache.move_to_end(cache_key)
+        return entry
+
+
+def _lru_delete(cache_key: str) -> None:
+    with _exact_cache_lock:
+        _exact_cache.pop(cache_key, None)
+
+
+def _lru_put(cache_key: str, entry: Dict[str, Any]) -> None:
+    with _exact_cache_lock:
+        _exact_cache[cache_key] = (time.time() + EXACT_CACHE_TTL_SECONDS, entry)
+        _exact_cache.move_to_end(cache_key)
+        while len(_exact_cache) > EXACT_CACHE_MAX_ENTRIES:
+            _exact_cache.popitem(last=False)
+
+
+def _get_answer_table():
+    """Get or initialize the DynamoDB answer cache table (None if not configured)."""
+    global _answer_table
+    
+    if _answer_table is None:
+        table_name = os.environ.get("FAQ_ANSWER_CACHE_TABLE")
+        if not table_name:
+            return None
+        _answer_table = get_resource("dynamodb").Table(table_name)
+        logger.info(f"Initialized DynamoDB answer cache table: {table_name}")
+    
+    return _answer_table
+
+
+def _dynamodb_get(cache_key: str) -> Optional[Dict[str, Any]]:
+    table = _get_answer_table()
+    if table is None:
+        return None
+    
+    try:
+        item = table.get_item(Key={"cache_key": cache_key}).get("Item")
+    except Exception as e:
+        logger.warning(f"Error reading answer cache: {e}")
+        return None
+    
+    # TTL deletion is lazy, so expired items can still be returned
+    if not item or int(item.get("expires_at", 0)) <= int(time.time()):
+        return None
+    
+    return {
+        "id": item["faq_id"],
+        "question_text": item.get("question_text", ""),
+        "answer_text": item["answer_text"],
+        "sources_used": json.loads(item.get("sources", "[]")),
+        "cached_at": item.get("cached_at"),
+    }
+
+
+def _dynamodb_put(cache_key: str, entry: Dict[str, Any]) -> None:
+    table = _get_answer_table()
+    if table is None:
+        return
+    
+    try:
+        table.put_item(Item={
+            "cache_key": cache_key,
+            "faq_id": entry["id"],
+            "question_text": entry.get("question_text", ""),
+            "answer_text": entry["answer_text"],
+            # Stored as a JSON string so nested values don't come back as Decimal
+            "sources": json.dumps(entry.get("sources_used", [])),
+            "cached_at": entry.get("cached_at") or datetime.now().isoformat(),
+            "expires_at": int(time.time()) + ANSWER_CACHE_TTL_SECONDS,
+        })
+    except Exception as e:
+        logger.warning(f"Error writing answer cache: {e}")
+
+
+def _dynamodb_delete(cache_key: str) -> None:
+    table = _get_answer_table()
+    if table is None:
+        return
+    
+    try:
+        table.delete_item(Key={"cache_key": cache_key})
+    except Exception as e:
+        logger.warning(f"Error deleting answer cache entry: {e}")
+
+
+def _forget_exact_answer(cache_key: str) -> None:
+    """Remove an answer from both exact-match tiers."""
+    _lru_delete(cache_key)
+    _dynamodb_delete(cache_key)
+
+
+def _confirm_exact_hit(entry: Dict[str, Any], connection) -> Optional[Dict[str, Any]]:
+    """
+    Re-read an exact-tier hit from faq_cache by primary key.
+    
+    Returns the entry with the row's current answer and sources, or None if
+    the FAQ was deleted, evicted or reported since it was cached. Errors are
+    treated as a miss so a stale answer is never served unchecked.
+    """
+    try:
+        with connection.cursor() as cur:
+            cur.execute(
+                """
+                SELECT answer_text, sources
+                FROM faq_cache
+                WHERE id = %s AND reported = false
+                """,
+                (entry["id"],)
+            )
+            row = cur.fetchone()
+        connection.commit()
+    except Exception as e:
+        logger.warning(f"Error confirming exact-match FAQ hit: {e}")
+        connection.rollback()
+        return None
+    
+    if row is None:
+        return None
+    
+    answer_text, sources = row
+    return {**entry, "answer_text": answer_text, "sources_used": sources or []}
+
+
+def _remember_exact_answer(cache_key: str, entry: Dict[str, Any], write_dynamodb: bool = True) -> None:
+    """Store an answer in the exact-match tiers."""
+    entry = {
+        "id": entry["id"],
+        "question_text": entry.get("question_text", ""),
+        "answer_text": entry["answer_text"],
+        "sources_used": entry.get("sources_used", []),
+        "cached_at": entry.get("cached_at"),
+    }
+    _lru_put(cache_key, entry)
+    if write_dynamodb:
+        _dynamodb_put(cache_key, entry)
+
+
+def _supports_iterative_scan(connection) -> bool:
+    """
+    Check whether pgvector can keep scanning the HNSW graph until the
+    textbook filter is satisfied (hnsw.iterative_scan, pgvector 0.8+).
+    """
+    global _iterative_scan_supported
+    
+    if _iterative_scan_supported is None:
+        try:
+            with connection.cursor() as cur:
+                cur.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+                row = cur.fetchone()
+            version = tuple(int(part) for part in row[0].split(".")[:2]) if row else (0, 0)
+            _iterative_scan_supported = version >= (0, 8)
+            logger.info(f"pgvector version {row[0] if row else 'unknown'}, iterative scan: {_iterative_scan_supported}")
+        except Exception as e:
+            logger.warning(f"Could not determine pgvector version: {e}")
+            connection.rollback()
+            _iterative_scan_supported = False
+    
+    return _iterative_scan_supported
 
 
 def check_faq_cache(
@@ -19,7 +297,8 @@ def check_faq_cache(
     textbook_id: str,
     embeddings: BedrockEmbeddings,
     connection,
-    similarity_threshold: float = SIMILARITY_THRESHOLD
+    similarity_threshold: float = SIMILARITY_THRESHOLD,
+    query_context=None
 ) -> Optional[Dict[str, Any]]:
     """
     Check if a similar question exists in the FAQ cache using vector similarity.
@@ -30,24 +309,29 @@ def check_faq_cache(
         embeddings: BedrockEmbeddings instance for generating question embedding
         connection: Database connection
         similarity_threshold: Minimum cosine similarity to consider a match (default: 0.85)
+        query_context: Optional QueryEmbeddingContext holding the request's question embedding
         
     Returns:
         Dict with cached answer, sources, and metadata if found, None otherwise
     """
     try:
-        # Generate embedding for the input question
-        logger.info(f"Generating embedding for question: {question[:100]}...")
-        question_embedding = embeddings.embed_query(question)
+        # Reuse the request's question embedding when available
+        logger.info(f"Looking up FAQ cache for question: {question[:100]}...")
+        embedding_str = _get_embedding_str(question, embeddings, query_context)
         
-        # Convert embedding to PostgreSQL vector format
-        embedding_str = "[" + ",".join(map(str, question_embedding)) + "]"
+        # Fetch the nearest cached questions for this textbook and apply the
+        # threshold afterwards. ORDER BY <distance> LIMIT k can be served by the
+        # HNSW index on faq_cache.embedding (or by the textbook_id btree when the
+        # planner prefers it); a threshold in the WHERE clause could not.
+        # The <=> operator in pgvector computes cosine distance (1 - cosine_similarity).
+        search_settings = "SELECT set_config('hnsw.ef_search', %(ef_search)s, true);"
+        if _supports_iterative_scan(connection):
+            # Keep walking the graph until FAQ_CANDIDATES rows of this textbook are found
+            search_settings += "SELECT set_config('hnsw.iterative_scan', 'strict_order', true);"
         
-        # Query for similar questions using cosine similarity
-        # The <=> operator in pgvector computes cosine distance (1 - cosine_similarity)
-        # So we need to convert it back to similarity
         with connection.cursor() as cur:
             cur.execute(
-                """
+                search_settings + """
                 SELECT 
                     id,
                     question_text,
@@ -57,18 +341,31 @@ def check_faq_cache(
                     last_used_at,
                     cached_at,
                     metadata,
-                    1 - (embedding <=> %s::vector) as similarity
+                    embedding <=> %(embedding)s::vector AS distance
                 FROM faq_cache
-                WHERE textbook_id = %s
+                WHERE textbook_id = %(textbook_id)s
                     AND embedding IS NOT NULL
-                    AND 1 - (embedding <=> %s::vector) >= %s
-                ORDER BY similarity DESC
-                LIMIT 1
+                ORDER BY distance
+                LIMIT %(limit)s
                 """,
-                (embedding_str, textbook_id, embedding_str, similarity_threshold)
+                {
+                    "ef_search": str(max(HNSW_EF_SEARCH, FAQ_CANDIDATES)),
+                    "embedding": embedding_str,
+                    "textbook_id": textbook_id,
+                    "limit": FAQ_CANDIDATES,
+                }
             )
             
-            result = cur.fetchone()
+            candidates = cur.fetchall()
+            
+            # Rows are ordered by distance, so the first one is the best match
+            result = None
+            if candidates:
+                best_similarity = 1 - float(candidates[0][-1])
+                if best_similarity >= similarity_threshold:
+                    result = candidates[0][:-1] + (best_similarity,)
+                else:
+                    logger.info(f"Closest cached FAQ similarity {best_similarity:.4f} below threshold {similarity_threshold}")
             
             if result:
                 faq_id, question_text, answer_text, sources, usage_count, last_used_at, cached_at, metadata, similarity = result
@@ -76,8 +373,8 @@ def check_faq_cache(
                 logger.info(f"Found cached FAQ with similarity {similarity:.4f}")
                 logger.info(f"Cached question: {question_text[:100]}...")
                 
-                # Update usage statistics
-                _update_faq_usage(faq_id, connection)
+                # Update usage statistics (written in bulk by flush_faq_usage)
+                _record_faq_usage(faq_id)
                 
                 # Parse sources from JSON if it exists
                 sources_list = sources if sources else []
@@ -104,31 +401,147 @@ def check_faq_cache(
         return None
 
 
-def _update_faq_usage(faq_id, connection) -> None:
+def lookup_faq_answer(
+    question: str,
+    textbook_id: str,
+    embeddings: BedrockEmbeddings,
+    connection,
+    similarity_threshold: float = SIMILARITY_THRESHOLD,
+    query_context=None
+) -> Optional[Dict[str, Any]]:
     """
-    Update the usage count and last_used_at timestamp for a cached FAQ.
+    Look up a cached answer: in-process LRU, then DynamoDB, then the semantic FAQ cache.
+    
+    Exact tiers match on the normalized question, so they need no embedding
+    and only a primary-key read to confirm the FAQ is still live. A semantic hit is copied into both exact
+    tiers so the next identical question is served without pgvector.
+    
+    Args:
+        question: The user's question
+        textbook_id: The textbook ID
+        embeddings: BedrockEmbeddings instance (semantic tier only)
+        connection: Database connection
+        similarity_threshold: Minimum cosine similarity for a semantic match
+        query_context: Optional QueryEmbeddingContext holding the request's question embedding
+        
+    Returns:
+        Same dict as check_faq_cache plus "cache_tier", or None on a miss
+    """
+    _count_tier("lookups")
+    cache_key = exact_cache_key(textbook_id, question)
+    
+    entry = _lru_get(cache_key)
+    tier = CACHE_TIER_LRU
+    if entry is None:
+        entry = _dynamodb_get(cache_key)
+        tier = CACHE_TIER_DYNAMODB
+        if entry is not None:
+            _remember_exact_answer(cache_key, entry, write_dynamodb=False)
+    
+    if entry is not None:
+        confirmed = _confirm_exact_hit(entry, connection)
+        if confirmed is None:
+            logger.info(f"Exact-match FAQ {entry['id']} no longer servable; removing it from the exact tiers")
+            _forget_exact_answer(cache_key)
+        elif confirmed["answer_text"] != entry["answer_text"] or confirmed["sources_used"] != entry["sources_used"]:
+            # Edited since it was cached
+            _remember_exact_answer(cache_key, confirmed)
+        entry = confirmed
+    
+    if entry is not None:
+        _count_tier(f"{tier}_hits")
+        logger.info(f"Exact-match FAQ cache hit ({tier}) for FAQ {entry['id']}")
+        # Keep usage counts (which drive eviction) accurate for exact hits
+        _record_faq_usage(entry["id"])
+        return {
+            **entry,
+            "last_used_at": datetime.now().isoformat(),
+            "similarity": 1.0,
+            "from_cache": True,
+            "cache_tier": tier,
+        }
+    
+    result = check_faq_cache(
+        question=question,
+        textbook_id=textbook_id,
+        embeddings=embeddings,
+        connection=connection,
+        similarity_threshold=similarity_threshold,
+        query_context=query_context
+    )
+    if result is None:
+        _count_tier("misses")
+        return None
+    
+    _count_tier("semantic_hits")
+    _remember_exact_answer(cache_key, result)
+    result["cache_tier"] = CACHE_TIER_SEMANTIC
+    return result
+
+
+def _get_embedding_str(question: str, embeddings: BedrockEmbeddings, query_context=None) -> str:
+    """
+    Return the question embedding in PostgreSQL vector format.
+    
+    Uses the per-request QueryEmbeddingContext when provided so the question
+    is embedded once and shared with retrieval and write-back.
+    """
+    if query_context is not None:
+        return query_context.to_pgvector(question)
+    
+    question_embedding = embeddings.embed_query(question)
+    return "[" + ",".join(map(str, question_embedding)) + "]"
+
+
+def _record_faq_usage(faq_id) -> None:
+    """
+    Count a cache hit in memory; flush_faq_usage writes it later.
     
     Args:
         faq_id: The FAQ entry ID
+    """
+    with _pending_usage_lock:
+        pending = _pending_usage.setdefault(str(faq_id), [0, None])
+        pending[0] += 1
+        pending[1] = datetime.now(timezone.utc)
+
+
+def flush_faq_usage(connection) -> int:
+    """
+    Write the accumulated FAQ hit counts with a single UPDATE ... FROM (VALUES ...).
+    
+    Called at the end of the invocation, off the response path. On failure the
+    counts are put back so the next flush retries them.
+    
+    Args:
         connection: Database connection
+        
+    Returns:
+        Number of FAQ rows updated
     """
+    with _pending_usage_lock:
+        if not _pending_usage:
+            return 0
+        pending = dict(_pending_usage)
+        _pending_usage.clear()
+    
+    rows = [(faq_id, hits, last_used_at) for faq_id, (hits, last_used_at) in pending.items()]
     try:
         with connection.cursor() as cur:
-            cur.execute(
-                """
-                UPDATE faq_cache
-                SET usage_count = usage_count + 1,
-                    last_used_at = NOW()
-                WHERE id = %s
-                """,
-                (faq_id,)
-            )
+            execute_values(cur, _FLUSH_USAGE_SQL, rows, template="(%s::uuid, %s, %s::timestamptz)")
+            updated = cur.rowcount
         connection.commit()
-        logger.info(f"Updated usage count for FAQ {faq_id}")
+        logger.info(f"Flushed usage for {len(rows)} FAQ(s) ({sum(row[1] for row in rows)} hits)")
+        return updated
     except Exception as e:
-        logger.error(f"Error updating FAQ usage: {e}")
+        logger.error(f"Error flushing FAQ usage: {e}")
         connection.rollback()
-        # Don't fail the request if usage update fails
+        with _pending_usage_lock:
+            for faq_id, (hits, last_used_at) in pending.items():
+                current = _pending_usage.setdefault(faq_id, [0, last_used_at])
+                current[0] += hits
+                current[1] = max(current[1], last_used_at)
+        return 0
 
 
 def cache_faq(
@@ -138,7 +551,8 @@ def cache_faq(
     embeddings: BedrockEmbeddings,
     connection,
     sources: Optional[list] = None,
-    metadata: Optional[Dict] = None
+    metadata: Optional[Dict] = None,
+    query_context=None
 ) -> Optional[str]:
     """
     Cache a new FAQ entry with its embedding and sources.
@@ -151,17 +565,15 @@ def cache_faq(
         connection: Database connection
         sources: Optional list of source documents used
         metadata: Optional metadata to store with the FAQ
+        query_context: Optional QueryEmbeddingContext holding the request's question embedding
         
     Returns:
         The ID of the cached FAQ entry, or None if caching failed
     """
     try:
-        # Generate embedding for the question
+        # Reuse the embedding computed for the cache lookup when available
         logger.info(f"Caching FAQ for question: {question[:100]}...")
-        question_embedding = embeddings.embed_query(question)
-        
-        # Convert embedding to PostgreSQL vector format
-        embedding_str = "[" + ",".join(map(str, question_embedding)) + "]"
+        embedding_str = _get_embedding_str(question, embeddings, query_context)
         
         # Prepare metadata and sources
         metadata_json = json.dumps(metadata or {})
@@ -184,8 +596,18 @@ def cache_faq(
         connection.commit()
         logger.info(f"Successfully cached FAQ with ID: {faq_id}")
         
-        # Maintain cache size limit
-        _maintain_cache_size(textbook_id, connection)
+        # The same question asked again is then an exact-match hit
+        _remember_exact_answer(exact_cache_key(textbook_id, question), {
+            "id": str(faq_id),
+            "question_text": question,
+            "answer_text": answer,
+            "sources_used": sources or [],
+            "cached_at": datetime.now().isoformat(),
+        })
+        
+        # Maintain cache size limit (amortized across inserts)
+        if _eviction_due(textbook_id):
+            _maintain_cache_size(textbook_id, connection)
         
         return str(faq_id)
         
@@ -196,54 +618,68 @@ def cache_faq(
         return None
 
 
+def _eviction_due(textbook_id: str) -> bool:
+    """Count an insert for textbook_id and return True if the cache should be trimmed now."""
+    now = time.time()
+    with _eviction_lock:
+        state = _eviction_state.setdefault(textbook_id, [0, now])
+        state[0] += 1
+        if state[0] >= EVICTION_CHECK_EVERY or now - state[1] >= EVICTION_CHECK_INTERVAL_SECONDS:
+            _eviction_state[textbook_id] = [0, now]
+            return True
+    return False
+
+
 def _maintain_cache_size(textbook_id: str, connection, max_size: int = MAX_CACHE_SIZE) -> None:
     """
     Ensure the FAQ cache doesn't exceed the maximum size by removing least frequently used entries.
     
+    Counting and deleting happen in one statement. Reported FAQs are never
+    deleted but still count towards the size.
+    
     Args:
         textbook_id: The textbook ID
         connection: Database connection
         max_size: Maximum number of FAQs to keep per textbook (default: 100)
     """
+    # Eviction orders by usage_count, so write pending hits first
+    flush_faq_usage(connection)
+    
     try:
         with connection.cursor() as cur:
-            # Count current FAQs for this textbook
+            # Delete the excess, keeping the most frequently used FAQs and
+            # preferring more recently used ones as a tiebreaker
             cur.execute(
                 """
-                SELECT COUNT(*) 
-                FROM faq_cache 
-                WHERE textbook_id = %s
+                DELETE FROM faq_cache
+                WHERE id IN (
+                    SELECT id
+                    FROM faq_cache
+                    WHERE textbook_id = %(textbook_id)s
+                        AND reported = false  -- Don't delete reported FAQs
+                    ORDER BY usage_count ASC, last_used_at ASC
+                    LIMIT GREATEST(
+                        (SELECT COUNT(*) FROM faq_cache WHERE textbook_id = %(textbook_id)s) - %(max_size)s,
+                        0
+                    )
+                )
+                RETURNING question_text
                 """,
-                (textbook_id,)
+                {"textbook_id": textbook_id, "max_size": max_size}
             )
             
-            count = cur.fetchone()[0]
-            
-            if count > max_size:
-                # Delete excess FAQs, keeping the most frequently used ones
-                # Also prioritize more recently used FAQs as a tiebreaker
-                excess = count - max_size
-                
-                cur.execute(
-                    """
-                    DELETE FROM faq_cache
-                    WHERE id IN (
-                        SELECT id
-                        FROM faq_cache
-                        WHERE textbook_id = %s
-                            AND reported = false  -- Don't delete reported FAQs
-                        ORDER BY usage_count ASC, last_used_at ASC
-                        LIMIT %s
-                    )
-                    """,
-                    (textbook_id, excess)
-                )
-                
-                deleted_count = cur.rowcount
-                connection.commit()
-                logger.info(f"Removed {deleted_count} least used FAQs to maintain cache size")
-            else:
-                logger.info(f"Cache size OK: {count}/{max_size} FAQs")
+            evicted_questions = [row[0] for row in cur.fetchall()]
+            deleted_count = len(evicted_questions)
+        connection.commit()
+        
+        # Hits on these are rejected by _confirm_exact_hit anyway; dropping
+        # them here saves the extra read
+        for question_text in evicted_questions:
+            _forget_exact_answer(exact_cache_key(textbook_id, question_text))
+        if deleted_count:
+            logger.info(f"Removed {deleted_count} least used FAQs to maintain cache size")
+        else:
+            logger.info(f"Cache size OK (max {max_size} FAQs)")
                 
     except Exception as e:
         logger.error(f"Error maintaining cache size: {e}")
@@ -314,74 +750,44 @@ def stream_cached_response(
     """
     Stream a cached FAQ response via WebSocket, mimicking the normal streaming behavior.
     
+    The answer is split into frame-safe "chunk" frames (API Gateway rejects
+    frames over 128 KB) posted by a WebSocketSender on the shared management
+    client. The complete frame carries only sources and cache metadata.
+    
     Args:
-        cached_faq: The cached FAQ dictionary from check_faq_cache
+        cached_faq: The cached FAQ dictionary from lookup_faq_answer/check_faq_cache
         websocket_endpoint: WebSocket API endpoint URL
         connection_id: WebSocket connection ID
         
     Returns:
         Dict with response and sources_used
     """
+    answer_text = cached_faq.get("answer_text", "")
+    sources_used = cached_faq.get("sources_used", [])
+    
     try:
         logger.info(f"Streaming cached response via WebSocket (similarity: {cached_faq.get('similarity', 0):.4f})")
         
-        # Initialize WebSocket client
-        apigatewaymanagementapi = boto3.client('apigatewaymanagementapi', endpoint_url=websocket_endpoint)
+        apigatewaymanagementapi = get_client('apigatewaymanagementapi', endpoint_url=websocket_endpoint)
+        with WebSocketSender(apigatewaymanagementapi, connection_id) as sender:
+            sender.send({"type": "start", "message": "Retrieved from cache..."})
+            sender.send_text(answer_text)
+            sender.send({
+                "type": "complete",
+                "sources": sources_used,
+                "from_cache": True,
+                "cache_similarity": cached_faq.get("similarity", 0),
+                "cache_tier": cached_faq.get("cache_tier")
+            })
         
-        # Send start message
-        try:
-            apigatewaymanagementapi.post_to_connection(
-                ConnectionId=connection_id,
-                Data=json.dumps({
-                    "type": "start",
-                    "message": "Retrieved from cache..."
-                })
+        stats = sender.stats()
+        if stats["connection_gone"]:
+            logger.warning("WebSocket connection closed while streaming cached response")
+        else:
+            logger.info(
+                f"Successfully streamed cached response ({len(answer_text)} chars in "
+                f"{stats['chunks_received']} frame(s), {len(sources_used)} sources)"
             )
-        except Exception as ws_error:
-            logger.error(f"WebSocket connection closed during start message: {ws_error}")
-            return {
-                "response": cached_faq["answer_text"],
-                "sources_used": cached_faq.get("sources_used", [])
-            }
-        
-        # Stream the cached answer
-        # For cached responses, we send the full text as one chunk to maintain consistency
-        answer_text = cached_faq["answer_text"]
-        sources_used = cached_faq.get("sources_used", [])
-        
-        try:
-            apigatewaymanagementapi.post_to_connection(
-                ConnectionId=connection_id,
-                Data=json.dumps({
-                    "type": "chunk",
-                    "content": answer_text
-                })
-            )
-        except Exception as chunk_error:
-            logger.error(f"WebSocket connection closed during chunk: {chunk_error}")
-            # Still return the response even if WebSocket fails
-            return {
-                "response": answer_text,
-                "sources_used": sources_used
-            }
-        
-        # Send completion message with sources
-        completion_data = {
-            "type": "complete",
-            "sources": sources_used,
-            "from_cache": True,
-            "cache_similarity": cached_faq.get("similarity", 0)
-        }
-        
-        try:
-            apigatewaymanagementapi.post_to_connection(
-                ConnectionId=connection_id,
-                Data=json.dumps(completion_data)
-            )
-        except Exception:
-            logger.warning("WebSocket connection closed during completion")
-        
-        logger.info(f"Successfully streamed cached response ({len(answer_text)} chars, {len(sources_used)} sources)")
         
         return {
             "response": answer_text,
@@ -395,6 +801,6 @@ def stream_cached_response(
         logger.exception(e)
         # Return the response anyway
         return {
-            "response": cached_faq.get("answer_text", ""),
-            "sources_used": cached_faq.get("sources_used", [])
+            "response": answer_text,
+            "sources_used": sources_used
         }
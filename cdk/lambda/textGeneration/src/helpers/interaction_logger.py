@@ -0,0 +1,170 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from psycopg2.extras import execute_values
+
+# Set up logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Interactions are written by one background worker in batches. A batch is
+# written once INTERACTION_BATCH_SIZE rows are queued or INTERACTION_FLUSH_MS
+# after the first queued row, and always when the handler calls flush() before
+# returning (the execution environment may be frozen right after).
+INTERACTION_BATCH_SIZE = int(os.environ.get("INTERACTION_BATCH_SIZE", "25"))
+INTERACTION_FLUSH_MS = int(os.environ.get("INTERACTION_FLUSH_MS", "500"))
+INTERACTION_QUEUE_SIZE = int(os.environ.get("INTERACTION_QUEUE_SIZE", "256"))
+# How long a producer waits for queue space before dropping the row
+ENQUEUE_TIMEOUT_SECONDS = 0.05
+
+_INSERT_SQL = """
+    INSERT INTO user_interactions
+    (chat_session_id, sender_role, query_text, response_text, source_chunks)
+    VALUES %s
+"""
+
+_queue: "queue.Queue" = queue.Queue(maxsize=INTERACTION_QUEUE_SIZE)
+_worker: Optional[threading.Thread] = None
+_worker_lock = threading.Lock()
+_connect: Optional[Callable] = None
+_release: Optional[Callable] = None
+_stats_lock = threading.Lock()
+_stats = {"enqueued": 0, "written": 0, "batches": 0, "dropped": 0, "backpressure_waits": 0, "failed_rows": 0}
+
+
+def _count(key: str, amount: int = 1) -> None:
+    with _stats_lock:
+        _stats[key] += amount
+
+
+def init_interaction_logger(connect: Callable, release: Callable) -> None:
+    """
+    Start the background worker (once per container).
+
+    Args:
+        connect: Returns a database connection (checked out per batch)
+        release: Returns a connection obtained from connect
+    """
+    global _worker, _connect, _release
+    if _worker is not None and _worker.is_alive():
+        return
+    with _worker_lock:
+        if _worker is not None and _worker.is_alive():
+            return
+        _connect, _release = connect, release
+        _worker = threading.Thread(target=_run, name="interaction-logger", daemon=True)
+        _worker.start()
+        logger.info("Interaction logger worker started")
+
+
+def log_interaction(chat_session_id: str, query_text: str, response_text: str, sources: List[str],
+                    sender_role: str = "User") -> bool:
+    """
+    Queue a user_interactions row for the background worker.
+
+    Returns:
+        False if the row was dropped because the queue stayed full
+    """
+    row = (chat_session_id, sender_role, query_text, response_text, json.dumps(sources))
+    try:
+        _queue.put_nowait(("row", row))
+    except queue.Full:
+        _count("backpressure_waits")
+        try:
+            _queue.put(("row", row), timeout=ENQUEUE_TIMEOUT_SECONDS)
+        except queue.Full:
+            _count("dropped")
+            logger.warning("Interaction log queue full, dropping interaction")
+            return False
+    _count("enqueued")
+    return True
+
+
+def flush(timeout: float = 2.0) -> bool:
+    """
+    Write everything queued so far and wait for it. Call before the handler returns.
+
+    Returns:
+        True if the worker drained the queue within the timeout
+    """
+    if _worker is None or not _worker.is_alive():
+        return True
+    done = threading.Event()
+    try:
+        _queue.put(("flush", done), timeout=timeout)
+    except queue.Full:
+        logger.warning("Interaction log queue full, could not request flush")
+        return False
+    if not done.wait(timeout):
+        logger.warning("Interaction log flush did not finish before timeout")
+        return False
+    return True
+
+
+def get_interaction_logger_stats() -> Dict[str, Any]:
+    """Return container-lifetime counters (enqueued, written, dropped, ...)."""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["queued"] = _queue.qsize()
+    return stats
+
+
+# ----------------------------------------------------------------------
+# Worker thread
+# ----------------------------------------------------------------------
+
+def _run() -> None:
+    batch: list = []
+    deadline = None
+
+    while True:
+        timeout = None if deadline is None else max(0.0, deadline - time.time())
+        try:
+            kind, payload = _queue.get(timeout=timeout)
+        except queue.Empty:
+            # Time window elapsed
+            _write(batch)
+            batch, deadline = [], None
+            continue
+
+        if kind == "row":
+            batch.append(payload)
+            if deadline is None:
+                deadline = time.time() + INTERACTION_FLUSH_MS / 1000.0
+            if len(batch) >= INTERACTION_BATCH_SIZE:
+                _write(batch)
+                batch, deadline = [], None
+        else:
+            _write(batch)
+            batch, deadline = [], None
+            payload.set()
+
+
+def _write(batch: list) -> None:
+    if not batch:
+        return
+    connection = None
+    try:
+        connection = _connect()
+        with connection.cursor() as cur:
+            execute_values(cur, _INSERT_SQL, batch, page_size=INTERACTION_BATCH_SIZE)
+        connection.commit()
+        _count("written", len(batch))
+        _count("batches")
+        logger.info(f"Logged {len(batch)} interaction(s)")
+    except Exception as e:
+        _count("failed_rows", len(batch))
+        logger.error(f"Error logging {len(batch)} interaction(s): {e}")
+        if connection:
+            try:
+                connection.rollback()
+            except Exception as rollback_error:
+                logger.error(f"Error during rollback: {rollback_error}")
+    finally:
+        if connection:
+            _release(connection)
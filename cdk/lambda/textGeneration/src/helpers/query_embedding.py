@@ -0,0 +1,77 @@
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+
+# Set up logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class QueryEmbeddingContext:
+    """
+    Per-request holder for the embedding of the user's question.
+
+    The FAQ cache lookup, the vector retrieval and the FAQ write-back all need
+    the embedding of the same question. The context computes it lazily on
+    first use and hands the same vector to every consumer, so a request pays
+    for at most one Bedrock embedding call per distinct text (the original
+    question, plus a rewritten standalone question when chat history forces
+    one).
+    """
+
+    def __init__(self, embeddings, query: str):
+        """
+        Args:
+            embeddings: BedrockEmbeddings instance used to embed text
+            query: The user's original question
+        """
+        self.embeddings = embeddings
+        self.query = query
+        self.embed_calls = 0
+        self._vectors: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def embed(self, text: Optional[str] = None) -> List[float]:
+        """
+        Return the embedding for text, computing it only on first use.
+
+        Args:
+            text: Text to embed (defaults to the original question)
+
+        Returns:
+            The embedding vector
+        """
+        if text is None:
+            text = self.query
+
+        with self._lock:
+            vector = self._vectors.get(text)
+            if vector is None:
+                start = time.time()
+                vector = self.embeddings.embed_query(text)
+                self._vectors[text] = vector
+                self.embed_calls += 1
+                logger.info(
+                    f"Computed query embedding #{self.embed_calls} in {(time.time() - start) * 1000:.0f}ms"
+                )
+            return vector
+
+    @property
+    def vector(self) -> List[float]:
+        """Embedding of the original question."""
+        return self.embed()
+
+    @property
+    def is_computed(self) -> bool:
+        """Whether the original question has already been embedded."""
+        return self.query in self._vectors
+
+    def to_pgvector(self, text: Optional[str] = None) -> str:
+        """
+        Return the embedding formatted as a pgvector literal ("[x,y,...]").
+
+        Args:
+            text: Text to embed (defaults to the original question)
+        """
+        return "[" + ",".join(map(str, self.embed(text))) + "]"
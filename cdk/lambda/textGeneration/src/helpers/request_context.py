@@ -0,0 +1,110 @@
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+# Set up logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_SESSION_NAME = "New Chat Session"
+
+
+class RequestContext:
+    """
+    Per-request view of the chat session and its owning user session.
+
+    Built once in the handler from a single joined query and passed to token
+    limiting, session naming and interaction logging, so none of them has to
+    resolve chat_session -> user_session (or read the session name) again.
+    """
+
+    def __init__(self, chat_session_id: str):
+        """
+        Args:
+            chat_session_id: The (sanitized) chat session ID from the request
+        """
+        self.chat_session_id = chat_session_id
+        self.loaded = False  # The lookup ran (found is then authoritative)
+        self.found = False
+        self.user_session_id: Optional[str] = None
+        self.session_name: Optional[str] = None
+        self.textbook_id: Optional[str] = None
+        self.tokens_used = 0
+        self.tokens_updated_at: Optional[datetime] = None
+
+    @property
+    def is_named(self) -> bool:
+        """True if the chat session already has a generated or custom name."""
+        return bool(self.session_name) and self.session_name != DEFAULT_SESSION_NAME
+
+    @property
+    def window_tokens_used(self) -> int:
+        """Tokens used in the current 24-hour window as of the request start."""
+        if self.tokens_updated_at is None:
+            return 0
+        if datetime.now(timezone.utc) - self.tokens_updated_at >= timedelta(hours=24):
+            return 0
+        return self.tokens_used
+
+    @property
+    def hours_until_reset(self) -> float:
+        """Hours until the current token window resets (0 if already reset)."""
+        if self.tokens_updated_at is None:
+            return 0
+        remaining = self.tokens_updated_at + timedelta(hours=24) - datetime.now(timezone.utc)
+        return max(0, remaining.total_seconds() / 3600)
+
+    @property
+    def reset_time(self) -> str:
+        """ISO timestamp at which the current token window resets."""
+        if self.tokens_updated_at is None:
+            return ""
+        return (self.tokens_updated_at + timedelta(hours=24)).isoformat()
+
+
+def load_request_context(connection, chat_session_id: str) -> RequestContext:
+    """
+    Resolve the chat session, its user session and token usage in one query.
+
+    Args:
+        connection: Database connection
+        chat_session_id: The chat session ID
+
+    Returns:
+        RequestContext (found is False if the chat session does not exist or
+        the lookup failed)
+    """
+    context = RequestContext(chat_session_id)
+    if not chat_session_id or connection is None:
+        return context
+
+    try:
+        with connection.cursor() as cur:
+            cur.execute(
+                """
+                SELECT cs.user_session_id, cs.name, cs.textbook_id, us.tokens_used, us.updated_at
+                FROM chat_sessions cs
+                LEFT JOIN user_sessions us ON us.id = cs.user_session_id
+                WHERE cs.id = %s
+                """,
+                (chat_session_id,)
+            )
+            row = cur.fetchone()
+    except Exception as e:
+        logger.error(f"Error loading request context for chat_session {chat_session_id}: {e}")
+        connection.rollback()
+        return context
+
+    context.loaded = True
+    if not row:
+        logger.warning(f"No chat_session found for {chat_session_id}")
+        return context
+
+    user_session_id, session_name, textbook_id, tokens_used, updated_at = row
+    context.found = True
+    context.user_session_id = str(user_session_id) if user_session_id else None
+    context.session_name = session_name
+    context.textbook_id = str(textbook_id) if textbook_id else None
+    context.tokens_used = tokens_used or 0
+    context.tokens_updated_at = updated_at
+    return context
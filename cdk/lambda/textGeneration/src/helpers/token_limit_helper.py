@@ -6,12 +6,110 @@ Token limits are enforced based on SSM parameters.
 """
 
 import logging
+import os
+import threading
+import time
 from datetime import datetime, timedelta, timezone
-from typing import Optional, Tuple, Dict
-import boto3
+from typing import Optional, Tuple, Dict, Union
+
+from .aws_clients import get_client
 
 logger = logging.getLogger(__name__)
 
+# The daily limit is an admin setting that rarely changes, so it is cached per
+# container instead of being read from SSM on every request. After the soft
+# TTL the cached value is still served while a background thread refreshes it;
+# after the hard TTL the next caller refreshes synchronously. Admin changes
+# therefore take effect within LIMIT_CACHE_HARD_TTL_SECONDS at most.
+LIMIT_CACHE_SOFT_TTL_SECONDS = int(os.environ.get("TOKEN_LIMIT_CACHE_TTL_SECONDS", "60"))
+LIMIT_CACHE_HARD_TTL_SECONDS = int(os.environ.get("TOKEN_LIMIT_CACHE_MAX_STALENESS_SECONDS", "300"))
+DEFAULT_TOKEN_LIMIT = 100000  # Used when SSM cannot be read and nothing is cached
+
+_limit_cache: Dict[str, Dict] = {}
+_limit_cache_lock = threading.Lock()
+_limit_cache_stats = {"hits": 0, "misses": 0, "background_refreshes": 0, "errors": 0}
+
+
+def _parse_token_limit(value: str) -> Union[int, float]:
+    limit_value = value.strip().upper()
+    if limit_value in ('NONE', 'INFINITY', 'UNLIMITED'):
+        return float('inf')
+    return int(limit_value)
+
+
+def _fetch_token_limit(param_name: str, ssm_client) -> Union[int, float]:
+    """Read the limit from SSM and store it in the cache."""
+    response = ssm_client.get_parameter(Name=param_name, WithDecryption=True)
+    limit = _parse_token_limit(response['Parameter']['Value'])
+    with _limit_cache_lock:
+        _limit_cache[param_name] = {"value": limit, "fetched_at": time.time(), "refreshing": False}
+    return limit
+
+
+def _refresh_token_limit_async(param_name: str, ssm_client) -> None:
+    def refresh():
+        try:
+            _fetch_token_limit(param_name, ssm_client)
+        except Exception as e:
+            logger.warning(f"Background refresh of token limit failed, serving cached value: {e}")
+            with _limit_cache_lock:
+                _limit_cache_stats["errors"] += 1
+                if param_name in _limit_cache:
+                    _limit_cache[param_name]["refreshing"] = False
+
+    threading.Thread(target=refresh, name="token-limit-refresh", daemon=True).start()
+
+
+def get_daily_token_limit(global_limit_param_name: str, ssm_client=None) -> Union[int, float]:
+    """
+    Get the global daily token limit, served from the process-level cache.
+    
+    Args:
+        global_limit_param_name: SSM parameter name for global token limit
+        ssm_client: Optional SSM client
+    
+    Returns:
+        The limit in tokens, or float('inf') when unlimited
+    """
+    now = time.time()
+    with _limit_cache_lock:
+        entry = _limit_cache.get(global_limit_param_name)
+        age = now - entry["fetched_at"] if entry else None
+        if entry and age < LIMIT_CACHE_HARD_TTL_SECONDS:
+            _limit_cache_stats["hits"] += 1
+            start_refresh = age >= LIMIT_CACHE_SOFT_TTL_SECONDS and not entry["refreshing"]
+            if start_refresh:
+                entry["refreshing"] = True
+                _limit_cache_stats["background_refreshes"] += 1
+            cached_limit = entry["value"]
+        else:
+            _limit_cache_stats["misses"] += 1
+            start_refresh = False
+            cached_limit = None
+    
+    if cached_limit is not None:
+        if start_refresh:
+            _refresh_token_limit_async(global_limit_param_name, ssm_client or get_client('ssm'))
+        return cached_limit
+    
+    try:
+        return _fetch_token_limit(global_limit_param_name, ssm_client or get_client('ssm'))
+    except Exception as e:
+        logger.error(f"Error fetching global token limit: {e}")
+        with _limit_cache_lock:
+            _limit_cache_stats["errors"] += 1
+        # Serve an expired value rather than the default if we have one
+        return entry["value"] if entry else DEFAULT_TOKEN_LIMIT
+
+
+def get_limit_cache_stats() -> Dict:
+    """Return hit/miss counters for the token limit cache."""
+    with _limit_cache_lock:
+        stats = dict(_limit_cache_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = round(stats["hits"] / lookups, 3) if lookups else None
+    return stats
+
 def get_user_session_from_chat_session(
     connection,
     chat_session_id: str
@@ -44,130 +142,161 @@ def get_user_session_from_chat_session(
         logger.error(f"Error getting user_session from chat_session {chat_session_id}: {e}")
         return None
 
+# Rolling-window check-and-add in one statement. The CTE locks the row and
+# applies the 24-hour reset; the UPDATE only happens if the limit allows it, so
+# concurrent requests for the same session cannot both pass a stale check.
+# %(limit)s is NULL for unlimited sessions. With %(allow_overshoot)s the check
+# only requires tokens to remain before the add (used for reservations, whose
+# size is an estimate); otherwise the add itself must fit within the limit.
+_CHECK_AND_ADD_SQL = """
+    WITH current_usage AS (
+        SELECT id,
+               (updated_at IS NULL OR updated_at <= now() - interval '24 hours') AS needs_reset,
+               CASE WHEN updated_at IS NULL OR updated_at <= now() - interval '24 hours'
+                    THEN 0 ELSE COALESCE(tokens_used, 0) END AS window_tokens
+        FROM user_sessions
+        WHERE id = %(user_session_id)s
+        FOR UPDATE
+    )
+    UPDATE user_sessions us
+    SET tokens_used = cu.window_tokens + %(tokens)s,
+        updated_at = now()
+    FROM current_usage cu
+    WHERE us.id = cu.id
+      AND (
+          %(limit)s::bigint IS NULL
+          OR (%(allow_overshoot)s AND cu.window_tokens < %(limit)s::bigint)
+          OR cu.window_tokens + %(tokens)s <= %(limit)s::bigint
+      )
+    RETURNING us.tokens_used, us.updated_at, cu.needs_reset
+"""
+
+
 def check_and_update_token_limit(
     connection, 
     user_session_id: str,
     tokens_to_add: int,
     global_limit_param_name: str,
-    ssm_client=None
+    ssm_client=None,
+    allow_overshoot: bool = False
 ) -> Tuple[bool, Dict]:
     """
     Check if user session can use the specified number of tokens and update their count if allowed.
-    Uses 24-hour rolling window stored in user_sessions table.
+    Uses 24-hour rolling window stored in user_sessions table, checked and
+    updated atomically with a single UPDATE ... RETURNING.
     
     Args:
         connection: Database connection
-        user_session_id: User session ID to check
+        user_session_id: User session ID to check (already resolved by the caller)
         tokens_to_add: Number of tokens this request will consume
         global_limit_param_name: SSM parameter name for global token limit
         ssm_client: Optional SSM client
+        allow_overshoot: Add the tokens as long as any remain in the window, even
+            if the add goes past the limit (for pre-generation reservations)
     
     Returns:
         Tuple of (can_proceed: bool, usage_info: Dict)
     """
-    if ssm_client is None:
-        ssm_client = boto3.client('ssm')
+    effective_limit = get_daily_token_limit(global_limit_param_name, ssm_client)
     
     try:
         with connection.cursor() as cursor:
-            # Get user session's current token data
-            cursor.execute("""
-                SELECT 
-                    tokens_used,
-                    updated_at
-                FROM user_sessions 
-                WHERE id = %s
-            """, (user_session_id,))
-            
-            session_data = cursor.fetchone()
-            if not session_data:
-                raise ValueError(f"User session {user_session_id} not found")
-            
-            current_tokens, last_updated = session_data
-            now = datetime.now(timezone.utc)
-            
-            # Initialize if null
-            if current_tokens is None:
-                current_tokens = 0
-            if last_updated is None:
-                last_updated = now
-            
-            # Check if 24 hours have passed since last update
-            hours_since_reset = (now - last_updated).total_seconds() / 3600
-            needs_reset = hours_since_reset >= 24
-            
-            if needs_reset:
-                # Reset the counter for the new 24-hour period
-                current_tokens = 0
-                last_updated = now
-                logger.info(f"Reset daily token count for user_session {user_session_id}")
+            cursor.execute(_CHECK_AND_ADD_SQL, {
+                "user_session_id": user_session_id,
+                "tokens": tokens_to_add,
+                "limit": None if effective_limit == float('inf') else effective_limit,
+                "allow_overshoot": allow_overshoot,
+            })
+            row = cursor.fetchone()
+            connection.commit()
             
-            # Get effective limit from SSM
-            effective_limit = None
-            try:
-                response = ssm_client.get_parameter(
-                    Name=global_limit_param_name,
-                    WithDecryption=True
-                )
-                limit_value = response['Parameter']['Value'].strip().upper()
-                if limit_value in ('NONE', 'INFINITY', 'UNLIMITED'):
-                    effective_limit = float('inf')
+            if row:
+                new_token_count, last_updated, was_reset = row
+                if was_reset:
+                    logger.info(f"Reset daily token count for user_session {user_session_id}")
+                logger.info(f"Updated token count for user_session {user_session_id}: {new_token_count}/{effective_limit}")
+                
+                # Calculate remaining tokens
+                if effective_limit == float('inf'):
+                    remaining = float('inf')
                 else:
-                    effective_limit = int(limit_value)
-            except Exception as e:
-                logger.error(f"Error fetching global token limit: {e}")
-                effective_limit = 100000  # Fallback to 100k tokens
-            
-            # Check if user would exceed their limit
-            new_token_count = current_tokens + tokens_to_add
-            
-            if effective_limit != float('inf') and new_token_count > effective_limit:
-                # User would exceed their limit
-                remaining = max(0, effective_limit - current_tokens)
-                usage_info = {
-                    'can_proceed': False,
-                    'tokens_used': current_tokens,
-                    'tokens_requested': tokens_to_add,
+                    remaining = max(0, effective_limit - new_token_count)
+                
+                return True, {
+                    'can_proceed': True,
+                    'tokens_used': new_token_count,
+                    'tokens_added': tokens_to_add,
                     'daily_limit': effective_limit,
                     'remaining_tokens': remaining,
-                    'hours_until_reset': max(0, 24 - hours_since_reset),
+                    'hours_until_reset': 24,
                     'reset_time': (last_updated + timedelta(hours=24)).isoformat(),
-                    'message': f"Token limit exceeded. You have {remaining} tokens remaining out of {effective_limit}. Limit resets in {max(0, 24 - hours_since_reset):.1f} hours."
+                    'was_reset': was_reset
                 }
-                return False, usage_info
+        
+        # Nothing updated: either the session does not exist or the limit was
+        # reached. Only this (rare) path pays for a second query.
+        status = get_session_token_status(connection, user_session_id, global_limit_param_name, ssm_client)
+        current_tokens = status['tokens_used']
+        hours_until_reset = status['hours_until_reset']
+        remaining = max(0, effective_limit - current_tokens)
+        return False, {
+            'can_proceed': False,
+            'tokens_used': current_tokens,
+            'tokens_requested': tokens_to_add,
+            'daily_limit': effective_limit,
+            'remaining_tokens': remaining,
+            'hours_until_reset': hours_until_reset,
+            'reset_time': status['reset_time'],
+            'message': f"Token limit exceeded. You have {remaining} tokens remaining out of {effective_limit}. Limit resets in {hours_until_reset:.1f} hours."
+        }
             
-            # Update the token count
+    except Exception as e:
+        logger.error(f"Error checking/updating token limit for user_session {user_session_id}: {e}")
+        connection.rollback()
+        raise
+
+def reconcile_token_reservation(
+    connection,
+    user_session_id: str,
+    reserved_tokens: int,
+    actual_tokens: int
+) -> Optional[int]:
+    """
+    Replace a pre-generation reservation with the tokens actually used.
+    
+    Releasing a reservation (actual_tokens 0) leaves updated_at alone, so it
+    does not move the start of the user's 24-hour window.
+    
+    Args:
+        connection: Database connection
+        user_session_id: User session ID the reservation was made for
+        reserved_tokens: Tokens added by the reservation
+        actual_tokens: Tokens the request actually consumed (0 to release)
+    
+    Returns:
+        The session's new token count, or None if nothing changed
+    """
+    delta = actual_tokens - reserved_tokens
+    if delta == 0:
+        return None
+    
+    try:
+        with connection.cursor() as cursor:
             cursor.execute("""
-                UPDATE user_sessions 
-                SET tokens_used = %s,
-                    updated_at = %s
+                UPDATE user_sessions
+                SET tokens_used = GREATEST(0, COALESCE(tokens_used, 0) + %s),
+                    updated_at = CASE WHEN %s > 0 THEN now() ELSE updated_at END
                 WHERE id = %s
-            """, (new_token_count, now, user_session_id))
-            connection.commit()
-            
-            logger.info(f"Updated token count for user_session {user_session_id}: {new_token_count}/{effective_limit}")
-            
-            # Calculate remaining tokens
-            if effective_limit == float('inf'):
-                remaining = float('inf')
-            else:
-                remaining = max(0, effective_limit - new_token_count)
-            
-            usage_info = {
-                'can_proceed': True,
-                'tokens_used': new_token_count,
-                'tokens_added': tokens_to_add,
-                'daily_limit': effective_limit,
-                'remaining_tokens': remaining,
-                'hours_until_reset': max(0, 24 - hours_since_reset) if not needs_reset else 24,
-                'reset_time': (last_updated + timedelta(hours=24)).isoformat(),
-                'was_reset': needs_reset
-            }
-            
-            return True, usage_info
-            
+                RETURNING tokens_used
+            """, (delta, actual_tokens, user_session_id))
+            row = cursor.fetchone()
+        connection.commit()
+        if row:
+            logger.info(f"Reconciled token reservation for user_session {user_session_id}: {reserved_tokens} reserved, {actual_tokens} used, total {row[0]}")
+            return row[0]
+        return None
     except Exception as e:
-        logger.error(f"Error checking/updating token limit for user_session {user_session_id}: {e}")
+        logger.error(f"Error reconciling token reservation for user_session {user_session_id}: {e}")
         connection.rollback()
         raise
 
@@ -189,9 +318,6 @@ def get_session_token_status(
     Returns:
         Dict with usage information
     """
-    if ssm_client is None:
-        ssm_client = boto3.client('ssm')
-    
     try:
         with connection.cursor() as cursor:
             cursor.execute("""
@@ -224,21 +350,8 @@ def get_session_token_status(
             else:
                 next_reset = last_updated + timedelta(hours=24)
             
-            # Get effective limit
-            effective_limit = None
-            try:
-                response = ssm_client.get_parameter(
-                    Name=global_limit_param_name,
-                    WithDecryption=True
-                )
-                limit_value = response['Parameter']['Value'].strip().upper()
-                if limit_value in ('NONE', 'INFINITY', 'UNLIMITED'):
-                    effective_limit = float('inf')
-                else:
-                    effective_limit = int(limit_value)
-            except Exception as e:
-                logger.error(f"Error fetching global token limit: {e}")
-                effective_limit = 100000
+            # Get effective limit (cached SSM parameter)
+            effective_limit = get_daily_token_limit(global_limit_param_name, ssm_client)
             
             if effective_limit == float('inf'):
                 remaining = float('inf')
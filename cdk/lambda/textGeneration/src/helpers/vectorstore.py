@@ -1,7 +1,16 @@
 import logging
-import psycopg2
+import os
+import threading
+import time
 import traceback
-from typing import Dict, Optional
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from pydantic import Field
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import URL
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
 from langchain_postgres import PGVector
 from langchain_aws import BedrockEmbeddings
 from .helper import get_vectorstore
@@ -9,7 +18,92 @@ from .helper import get_vectorstore
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-def get_vectorstore_retriever(llm, vectorstore_config_dict: Dict[str, str], embeddings):
+# Use similarity search with score threshold to ensure relevance.
+# This helps filter out irrelevant content and keeps responses focused on textbook material.
+DEFAULT_SEARCH_KWARGS = {
+    "k": 5,  # Retrieve up to 5 documents
+    "score_threshold": 0.2  # Only return documents with similarity >= 0.2
+}
+
+# HNSW search settings. Large collections have a partial HNSW index on
+# embedding::vector(EMBEDDING_DIMENSIONS) (migration 018 / Glue ingestion job);
+# queries must use the same expression for the planner to pick it up.
+EMBEDDING_DIMENSIONS = int(os.environ.get("EMBEDDING_DIMENSIONS", "1536"))
+HNSW_EF_SEARCH = int(os.environ.get("HNSW_EF_SEARCH", "64"))
+
+# Warm-container registry settings
+REGISTRY_MAX_TEXTBOOKS = int(os.environ.get("VECTORSTORE_REGISTRY_MAX_TEXTBOOKS", "32"))
+COLLECTION_TTL_SECONDS = int(os.environ.get("VECTORSTORE_COLLECTION_TTL_SECONDS", "300"))
+# Missing/empty collections are re-checked sooner so newly ingested textbooks show up quickly
+MISSING_COLLECTION_TTL_SECONDS = int(os.environ.get("VECTORSTORE_MISSING_COLLECTION_TTL_SECONDS", "30"))
+
+# One SQLAlchemy engine per process, shared by every PGVector instance
+_engine = None
+_engine_key = None
+_engine_lock = threading.Lock()
+
+# textbook_id -> {"vectorstore", "collection_uuid", "checked_at"}, least recently used first
+_registry: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_registry_lock = threading.Lock()
+_registry_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+class QueryContextRetriever(BaseRetriever):
+    """
+    Similarity-threshold retriever that embeds through a QueryEmbeddingContext.
+
+    Behaves like PGVector.as_retriever(search_type="similarity_score_threshold")
+    but searches by vector, so the embedding computed for the FAQ cache check
+    is reused instead of calling Bedrock again for the same question.
+    """
+
+    vectorstore: Any
+    embeddings: Any = None
+    query_context: Any = None
+    collection_uuid: Optional[str] = None
+    search_kwargs: Dict[str, Any] = Field(default_factory=dict)
+
+    def _embed(self, query: str) -> List[float]:
+        if self.query_context is not None:
+            return self.query_context.embed(query)
+        return self.embeddings.embed_query(query)
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        embedding = self._embed(query)
+        k = self.search_kwargs.get("k", 4)
+        docs_and_distances = None
+
+        if self.collection_uuid and not self.search_kwargs.get("filter"):
+            try:
+                docs_and_distances = search_collection(
+                    self.collection_uuid,
+                    embedding,
+                    k=k,
+                    ef_search=self.search_kwargs.get("ef_search", HNSW_EF_SEARCH),
+                )
+            except Exception as e:
+                logger.warning(f"Indexed collection search failed, falling back to PGVector search: {e}")
+
+        if docs_and_distances is None:
+            docs_and_distances = self.vectorstore.similarity_search_with_score_by_vector(
+                embedding,
+                k=k,
+                filter=self.search_kwargs.get("filter"),
+            )
+
+        relevance_score_fn = self.vectorstore._select_relevance_score_fn()
+        score_threshold = self.search_kwargs.get("score_threshold")
+
+        docs = []
+        for doc, distance in docs_and_distances:
+            if score_threshold is None or relevance_score_fn(distance) >= score_threshold:
+                docs.append(doc)
+        return docs
+
+
+def get_vectorstore_retriever(llm, vectorstore_config_dict: Dict[str, str], embeddings, query_context=None):
     """Simple vectorstore retriever without complex history awareness."""
     
     try:
@@ -27,15 +121,11 @@ def get_vectorstore_retriever(llm, vectorstore_config_dict: Dict[str, str], embe
             logger.error("Failed to initialize vectorstore")
             return None
             
-        # Use similarity search with score threshold to ensure relevance
-        # Score threshold of 0.7 means we only return documents with similarity >= 0.7
-        # This helps filter out irrelevant content and keeps responses focused on textbook material
-        search_kwargs = {
-            "k": 5,  # Retrieve up to 5 documents
-            "score_threshold": 0.2  # Only return documents with similarity >= 0.3
-        }
-        retriever = vectorstore.as_retriever(
-            search_type="similarity_score_threshold",
+        search_kwargs = dict(DEFAULT_SEARCH_KWARGS)
+        retriever = QueryContextRetriever(
+            vectorstore=vectorstore,
+            embeddings=embeddings,
+            query_context=query_context,
             search_kwargs=search_kwargs
         )
         
@@ -49,85 +139,241 @@ def get_vectorstore_retriever(llm, vectorstore_config_dict: Dict[str, str], embe
         logger.error(traceback.format_exc())
         return None
 
-def get_textbook_retriever(llm, textbook_id: str, vectorstore_config_dict: Dict[str, str], embeddings: BedrockEmbeddings, selected_documents=None) -> Optional[object]:
+def _get_engine(vectorstore_config_dict: Dict[str, str]):
+    """
+    Return the process-wide SQLAlchemy engine, creating it on first use.
+    
+    The engine is rebuilt only if the connection parameters change (e.g. after
+    a credential rotation), so warm containers keep their pooled connections
+    through RDS Proxy instead of handshaking on every chat turn.
+    """
+    global _engine, _engine_key
+    
+    engine_key = (
+        vectorstore_config_dict['host'],
+        int(vectorstore_config_dict['port']),
+        vectorstore_config_dict['dbname'],
+        vectorstore_config_dict['user'],
+        vectorstore_config_dict['password'],
+    )
+    
+    if _engine is None or _engine_key != engine_key:
+        with _engine_lock:
+            # Double-check locking pattern
+            if _engine is None or _engine_key != engine_key:
+                if _engine is not None:
+                    logger.info("Database parameters changed, recreating vectorstore engine")
+                    _engine.dispose()
+                    with _registry_lock:
+                        _registry.clear()
+                
+                url = URL.create(
+                    "postgresql+psycopg",
+                    username=vectorstore_config_dict['user'],
+                    password=vectorstore_config_dict['password'],
+                    host=vectorstore_config_dict['host'],
+                    port=int(vectorstore_config_dict['port']),
+                    database=vectorstore_config_dict['dbname'],
+                )
+                _engine = create_engine(
+                    url,
+                    pool_size=2,
+                    max_overflow=3,
+                    pool_pre_ping=True,
+                    pool_recycle=1800,
+                    # Plan every search with its actual collection_id so the
+                    # planner can match partial per-collection HNSW indexes
+                    # (also avoids prepared statements pinning RDS Proxy connections)
+                    connect_args={"prepare_threshold": None},
+                )
+                _engine_key = engine_key
+                logger.info("Created shared vectorstore engine")
+    
+    return _engine
+
+
+def search_collection(collection_uuid: str, embedding: List[float], k: int = 4, ef_search: int = HNSW_EF_SEARCH) -> List[tuple]:
+    """
+    Cosine-distance search within one collection using the vector indexes.
+    
+    hnsw.ef_search is set per query (transaction-local, so it never leaks to
+    other users of a pooled connection) and is never lower than k. Collections
+    without a partial HNSW index are served through the collection_id btree.
+    
+    Args:
+        collection_uuid: UUID of the textbook's langchain_pg_collection row
+        embedding: Query embedding
+        k: Number of documents to return
+        ef_search: HNSW candidate list size (recall/latency trade-off)
+        
+    Returns:
+        List of (Document, cosine distance) tuples, closest first
+    """
+    if _engine is None:
+        raise RuntimeError("Vectorstore engine not initialized")
+    
+    vector_type = f"vector({EMBEDDING_DIMENSIONS})"
+    distance_expr = f"(embedding::{vector_type}) <=> CAST(:embedding AS {vector_type})"
+    
+    with _engine.begin() as conn:
+        conn.execute(
+            text("SELECT set_config('hnsw.ef_search', :ef_search, true)"),
+            {"ef_search": str(max(ef_search, k))},
+        )
+        rows = conn.execute(
+            text(f"""
+                SELECT id, document, cmetadata, {distance_expr} AS distance
+                FROM langchain_pg_embedding
+                WHERE collection_id = CAST(:collection_id AS uuid)
+                ORDER BY {distance_expr}
+                LIMIT :k
+            """),
+            {
+                "embedding": "[" + ",".join(map(str, embedding)) + "]",
+                "collection_id": collection_uuid,
+                "k": k,
+            },
+        ).fetchall()
+    
+    return [
+        (Document(id=row[0], page_content=row[1] or "", metadata=row[2] or {}), float(row[3]))
+        for row in rows
+    ]
+
+
+def _probe_collection(engine, textbook_id: str) -> Optional[str]:
+    """
+    Return the collection UUID for a textbook if it has embeddings, else None.
+    
+    A single round trip replaces the previous pair of COUNT(*) probes.
+    """
+    with engine.connect() as conn:
+        row = conn.execute(
+            text("""
+                SELECT c.uuid
+                FROM langchain_pg_collection c
+                WHERE c.name = :name
+                    AND EXISTS (
+                        SELECT 1 FROM langchain_pg_embedding e
+                        WHERE e.collection_id = c.uuid
+                    )
+            """),
+            {"name": textbook_id},
+        ).fetchone()
+    return str(row[0]) if row else None
+
+
+def _get_registered_vectorstore(textbook_id: str, vectorstore_config_dict: Dict[str, str], embeddings: BedrockEmbeddings) -> Optional[Dict[str, Any]]:
+    """
+    Return the cached registry entry for the textbook, building it on first use.
+    
+    Collection existence is cached with a TTL (shorter for missing collections)
+    and the least recently used textbooks are evicted once the registry is full.
+    
+    Returns:
+        Dict with "vectorstore" (PGVector) and "collection_uuid", or None if the
+        textbook has no embeddings
+    """
+    now = time.time()
+    
+    with _registry_lock:
+        entry = _registry.get(textbook_id)
+        if entry is not None:
+            ttl = COLLECTION_TTL_SECONDS if entry["vectorstore"] is not None else MISSING_COLLECTION_TTL_SECONDS
+            if now - entry["checked_at"] < ttl:
+                _registry.move_to_end(textbook_id)
+                _registry_stats["hits"] += 1
+                return entry if entry["vectorstore"] is not None else None
+        _registry_stats["misses"] += 1
+    
+    engine = _get_engine(vectorstore_config_dict)
+    collection_uuid = _probe_collection(engine, textbook_id)
+    
+    vectorstore = None
+    if collection_uuid is None:
+        logger.warning(f"No embeddings found for textbook {textbook_id}")
+    elif entry is not None and entry["vectorstore"] is not None and entry["collection_uuid"] == collection_uuid:
+        # Same collection as before, only the TTL expired
+        vectorstore = entry["vectorstore"]
+    else:
+        logger.info(f"Creating vectorstore for collection: {textbook_id}")
+        vectorstore = PGVector(
+            embeddings=embeddings,
+            collection_name=textbook_id,
+            connection=engine,
+            use_jsonb=True,
+            create_extension=False
+        )
+    
+    new_entry = {
+        "vectorstore": vectorstore,
+        "collection_uuid": collection_uuid,
+        "checked_at": now,
+    }
+    
+    with _registry_lock:
+        _registry[textbook_id] = new_entry
+        _registry.move_to_end(textbook_id)
+        while len(_registry) > REGISTRY_MAX_TEXTBOOKS:
+            evicted_id, _ = _registry.popitem(last=False)
+            _registry_stats["evictions"] += 1
+            logger.info(f"Evicted vectorstore for textbook {evicted_id} from registry")
+    
+    return new_entry if vectorstore is not None else None
+
+
+def invalidate_textbook(textbook_id: str) -> None:
+    """Drop a textbook from the registry so the next request re-probes its collection."""
+    with _registry_lock:
+        _registry.pop(textbook_id, None)
+
+
+def get_registry_stats() -> Dict[str, int]:
+    """Return hit/miss/eviction counters and current size of the vectorstore registry."""
+    with _registry_lock:
+        return {**_registry_stats, "size": len(_registry)}
+
+
+def get_textbook_retriever(llm, textbook_id: str, vectorstore_config_dict: Dict[str, str], embeddings: BedrockEmbeddings, selected_documents=None, query_context=None) -> Optional[object]:
     """
     Get a retriever for a specific textbook based on its ID.
     
+    The underlying PGVector instance and its SQLAlchemy engine are reused
+    across requests in a warm container (see _get_registered_vectorstore);
+    only the lightweight retriever wrapper is created per request.
+    
     Args:
         llm: The language model (not used in this simplified version)
         textbook_id: The ID of the textbook (used as collection name)
         vectorstore_config_dict: Dictionary with database connection parameters
         embeddings: The embeddings instance to use for the vectorstore
         selected_documents: Not used in this simplified version
+        query_context: Optional QueryEmbeddingContext so retrieval reuses the request's query embedding
         
     Returns:
         A retriever for the textbook or None if no embeddings found
     """
     logger.info(f"Creating retriever for textbook ID: {textbook_id}")
-    logger.info(f"Embedding model type: {type(embeddings).__name__}")
-    logger.info(f"Embedding model ID: {getattr(embeddings, 'model_id', 'Unknown')}")
     
     try:
-        # Connect to database to check if collection exists
-        logger.info(f"Connecting to database at")
-        
-        conn = None
-        try:
-            conn = psycopg2.connect(
-                dbname=vectorstore_config_dict['dbname'],
-                user=vectorstore_config_dict['user'],
-                password=vectorstore_config_dict['password'],
-                host=vectorstore_config_dict['host'],
-                port=int(vectorstore_config_dict['port'])
-            )
-            logger.info("Database connection established successfully")
-            
-            # Check if collection exists with embeddings
-            with conn.cursor() as cur:
-                # Check if collection exists
-                cur.execute("SELECT COUNT(*) FROM langchain_pg_collection WHERE name = %s", (textbook_id,))
-                collection_exists = cur.fetchone()[0] > 0
-                
-                if not collection_exists:
-                    logger.warning(f"Collection for textbook {textbook_id} does not exist")
-                    return None
-                
-                # Check if it has embeddings
-                cur.execute("""
-                    SELECT COUNT(*) FROM langchain_pg_embedding 
-                    WHERE collection_id = (SELECT uuid FROM langchain_pg_collection WHERE name = %s)
-                """, (textbook_id,))
-                embedding_count = cur.fetchone()[0]
-                logger.info(f"Collection {textbook_id} has {embedding_count} embeddings")
-                
-                if embedding_count == 0:
-                    logger.warning(f"No embeddings found for textbook {textbook_id}")
-                    return None
-        
-        finally:
-            if conn and not conn.closed:
-                conn.close()
-        
-        # Add collection_name to config for vectorstore creation
-        vectorstore_config_dict['collection_name'] = textbook_id
+        entry = _get_registered_vectorstore(textbook_id, vectorstore_config_dict, embeddings)
+        if entry is None:
+            return None
         
-        # Create vectorstore and retriever
-        logger.info(f"Creating vectorstore retriever for collection: {textbook_id}")
-        retriever = get_vectorstore_retriever(
-            llm=llm,
-            vectorstore_config_dict=vectorstore_config_dict,
-            embeddings=embeddings
+        retriever = QueryContextRetriever(
+            vectorstore=entry["vectorstore"],
+            embeddings=embeddings,
+            query_context=query_context,
+            collection_uuid=entry["collection_uuid"],
+            search_kwargs=dict(DEFAULT_SEARCH_KWARGS)
         )
         
-        if retriever is None:
-            logger.error(f"Failed to create retriever for textbook: {textbook_id}")
-            return None
-        
-        logger.info(f"Successfully created retriever for textbook: {textbook_id}")
+        logger.info(f"Successfully created retriever for textbook: {textbook_id} (registry: {get_registry_stats()})")
         return retriever
         
     except Exception as e:
         logger.error(f"Error in get_textbook_retriever: {str(e)}")
         logger.error(traceback.format_exc())
         logger.error(f"Textbook ID: {textbook_id}")
+        invalidate_textbook(textbook_id)
         return None
@@ -0,0 +1,257 @@
+import json
+import logging
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+# Set up logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Coalescing defaults: a frame is posted once this many bytes are buffered or
+# this long after the first buffered chunk, whichever comes first.
+DEFAULT_MAX_FRAME_BYTES = 256
+DEFAULT_MAX_DELAY_MS = 50
+DEFAULT_QUEUE_SIZE = 512
+
+# Consecutive non-Gone post failures after which the client is treated as gone
+MAX_CONSECUTIVE_FAILURES = 3
+
+# API Gateway rejects WebSocket frames over 128 KB. json.dumps escapes a
+# character to at most 12 bytes (an escaped surrogate pair), so text split into
+# segments of MAX_SEGMENT_CHARS always fits in one frame.
+MAX_SEGMENT_CHARS = 8000
+DEFAULT_SEGMENT_CHARS = 2000
+
+_STOP = object()
+
+
+def split_segments(text: str, segment_chars: int = DEFAULT_SEGMENT_CHARS) -> List[str]:
+    """
+    Split text into frame-safe segments, preferring to cut at whitespace.
+
+    Args:
+        text: Text to split
+        segment_chars: Target segment length (capped at MAX_SEGMENT_CHARS)
+
+    Returns:
+        Segments that join back to the original text
+    """
+    segment_chars = max(1, min(segment_chars, MAX_SEGMENT_CHARS))
+    segments = []
+    start = 0
+    while len(text) - start > segment_chars:
+        end = start + segment_chars
+        # Cut after the last whitespace in the second half of the window
+        cut = max(text.rfind(" ", start + segment_chars // 2, end), text.rfind("\n", start + segment_chars // 2, end))
+        if cut != -1:
+            end = cut + 1
+        segments.append(text[start:end])
+        start = end
+    if start < len(text):
+        segments.append(text[start:])
+    return segments
+
+
+def _is_gone_error(error: Exception) -> bool:
+    """Return True if a post_to_connection error means the client disconnected."""
+    code = getattr(error, "response", {}).get("Error", {}).get("Code", "")
+    return code == "GoneException" or type(error).__name__ == "GoneException"
+
+
+class WebSocketSender:
+    """
+    Background sender for one WebSocket connection.
+
+    Chunks are queued by the generation thread and posted by a single worker
+    thread, which coalesces consecutive chunks into one "chunk" frame by size
+    and time window. Control frames (start/complete/error) flush any pending
+    text first, so frame order is preserved. The queue is bounded, so a slow
+    connection applies backpressure instead of buffering without limit.
+
+    If API Gateway reports the connection as gone, is_gone becomes True and
+    further frames are dropped; callers should stop generating.
+    """
+
+    def __init__(
+        self,
+        apigateway_client,
+        connection_id: str,
+        max_frame_bytes: int = DEFAULT_MAX_FRAME_BYTES,
+        max_delay_ms: int = DEFAULT_MAX_DELAY_MS,
+        queue_size: int = DEFAULT_QUEUE_SIZE
+    ):
+        """
+        Args:
+            apigateway_client: boto3 apigatewaymanagementapi client for the endpoint
+            connection_id: WebSocket connection ID
+            max_frame_bytes: Flush coalesced text once this many bytes are buffered
+            max_delay_ms: Flush coalesced text this long after the first buffered chunk
+            queue_size: Maximum number of queued chunks/frames before producers block
+        """
+        self._client = apigateway_client
+        self._connection_id = connection_id
+        self._max_frame_bytes = max_frame_bytes
+        self._max_delay = max_delay_ms / 1000.0
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._gone = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._consecutive_failures = 0
+        self._started_at = time.time()
+
+        self.chunks_received = 0
+        self.posts = 0
+        self.bytes_sent = 0
+        self.failed_posts = 0
+
+    def start(self) -> "WebSocketSender":
+        """Start the background worker thread."""
+        if self._thread is None:
+            self._started_at = time.time()
+            self._thread = threading.Thread(target=self._run, name="websocket-sender", daemon=True)
+            self._thread.start()
+        return self
+
+    @property
+    def is_gone(self) -> bool:
+        """True once the client connection is known to be closed."""
+        return self._gone.is_set()
+
+    def send_chunk(self, content: str) -> bool:
+        """
+        Queue streamed text for coalesced delivery.
+
+        Returns:
+            False if the connection is gone (the caller should stop generating)
+        """
+        if self.is_gone:
+            return False
+        if content:
+            self.chunks_received += 1
+            self._queue.put(("chunk", content))
+        return not self.is_gone
+
+    def send_text(self, text: str, segment_chars: int = DEFAULT_SEGMENT_CHARS) -> bool:
+        """
+        Queue complete text (e.g. a cached answer) as frame-safe "chunk" frames.
+
+        Unlike send_chunk, segments are not coalesced: each is posted as its own
+        frame while later segments are still being queued.
+
+        Returns:
+            False if the connection is gone
+        """
+        for segment in split_segments(text, segment_chars):
+            if self.is_gone:
+                return False
+            self.chunks_received += 1
+            self._queue.put(("message", {"type": "chunk", "content": segment}))
+        return not self.is_gone
+
+    def send(self, message: Dict[str, Any]) -> bool:
+        """
+        Queue a control frame (start/complete/error/...). Pending text is flushed first.
+
+        Returns:
+            False if the connection is gone
+        """
+        if self.is_gone:
+            return False
+        self._queue.put(("message", message))
+        return True
+
+    def close(self, timeout: float = 5.0) -> Dict[str, Any]:
+        """
+        Flush everything queued, stop the worker and return delivery stats.
+
+        Must be called before the Lambda handler returns, otherwise queued
+        frames may be frozen with the execution environment.
+        """
+        if self._thread is not None:
+            self._queue.put(("stop", _STOP))
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                logger.warning("WebSocket sender did not drain before timeout")
+            self._thread = None
+        return self.stats()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return per-answer delivery counters."""
+        return {
+            "chunks_received": self.chunks_received,
+            "posts": self.posts,
+            "bytes_sent": self.bytes_sent,
+            "failed_posts": self.failed_posts,
+            "connection_gone": self.is_gone,
+            "elapsed_ms": int((time.time() - self._started_at) * 1000),
+        }
+
+    def __enter__(self) -> "WebSocketSender":
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    # ------------------------------------------------------------------
+    # Worker thread
+    # ------------------------------------------------------------------
+
+    def _run(self) -> None:
+        buffer = []
+        buffered_bytes = 0
+        deadline = None
+
+        def flush():
+            nonlocal buffer, buffered_bytes, deadline
+            if buffer:
+                self._post({"type": "chunk", "content": "".join(buffer)})
+            buffer = []
+            buffered_bytes = 0
+            deadline = None
+
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.time())
+            try:
+                kind, payload = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                # Time window elapsed
+                flush()
+                continue
+
+            if kind == "chunk":
+                buffer.append(payload)
+                buffered_bytes += len(payload.encode("utf-8"))
+                if deadline is None:
+                    deadline = time.time() + self._max_delay
+                if buffered_bytes >= self._max_frame_bytes:
+                    flush()
+            elif kind == "message":
+                flush()
+                self._post(payload)
+            else:
+                flush()
+                return
+
+    def _post(self, message: Dict[str, Any]) -> None:
+        if self.is_gone:
+            return
+
+        data = json.dumps(message)
+        try:
+            self._client.post_to_connection(ConnectionId=self._connection_id, Data=data)
+            self.posts += 1
+            self.bytes_sent += len(data)
+            self._consecutive_failures = 0
+        except Exception as e:
+            self.failed_posts += 1
+            if _is_gone_error(e):
+                logger.warning(f"WebSocket connection {self._connection_id} is gone, dropping remaining frames")
+                self._gone.set()
+                return
+
+            self._consecutive_failures += 1
+            logger.error(f"WebSocket post failed ({message.get('type')}): {e}")
+            if self._consecutive_failures >= MAX_CONSECUTIVE_FAILURES:
+                logger.warning("Repeated WebSocket post failures, treating connection as gone")
+                self._gone.set()
@@ -30,8 +30,14 @@ Docker Lambda cold starts can take 2-5 seconds. We optimize this by:
 - main.py: Request handling, orchestration
 - helpers/chat.py: LLM interaction, RAG chain, streaming
 - helpers/vectorstore.py: Vector similarity search
-- helpers/faq_cache.py: Semantic caching for frequent questions
+- helpers/faq_cache.py: Tiered FAQ caching (exact-match LRU/DynamoDB, then semantic)
+- helpers/query_embedding.py: Per-request query embedding shared by cache and retrieval
+- helpers/chat_history.py: Bounded chat history window with rolling summary
+- helpers/deferred_tasks.py: Post-response work (session naming, history summary) run before the handler returns
+- helpers/request_context.py: Chat/user session context loaded once per request
+- helpers/interaction_logger.py: Batched background writes to user_interactions
 - helpers/token_limit_helper.py: Daily usage limits
+- helpers/db_pool.py: Connection pool with liveness checks and checkout metrics
 - helpers/session_security.py: Input validation and sanitization
 
 # helpers/session_security.py: Input validation and sanitization
@@ -80,6 +86,7 @@ DB_SECRET_NAME = os.environ["SM_DB_CREDENTIALS"]
 REGION = os.environ["REGION"]
 RDS_PROXY_ENDPOINT = os.environ["RDS_PROXY_ENDPOINT"]
 BEDROCK_LLM_PARAM = os.environ.get("BEDROCK_LLM_PARAM")
+REWRITE_LLM_PARAM = os.environ.get("REWRITE_LLM_PARAM")
 EMBEDDING_MODEL_PARAM = os.environ.get("EMBEDDING_MODEL_PARAM")
 BEDROCK_REGION_PARAM = os.environ.get("BEDROCK_REGION_PARAM")
 GUARDRAIL_ID_PARAM = os.environ.get("GUARDRAIL_ID_PARAM")
@@ -88,6 +95,8 @@ WEBSOCKET_API_ENDPOINT = os.environ.get("WEBSOCKET_API_ENDPOINT", "")
 TABLE_NAME_PARAM = os.environ.get("TABLE_NAME_PARAM")
 DAILY_TOKEN_LIMIT_PARAM = os.environ.get("DAILY_TOKEN_LIMIT_PARAM")
 COLD_START_METRIC = os.environ.get("COLD_START_METRIC", "false").lower() == "true"
+# Output tokens reserved against the daily limit before generation, reconciled with actual usage afterwards
+TOKEN_RESERVATION_OUTPUT_TOKENS = int(os.environ.get("TOKEN_RESERVATION_OUTPUT_TOKENS", "1024"))
 FORCE_COLD_START_TEST = os.environ.get("FORCE_COLD_START_TEST", "false").lower() == "true"
 # =============================================================================
 # GLOBAL STATE - Pre-loaded at container startup for cold start optimization
@@ -109,6 +118,7 @@ _startup_ts = time.time()
 
 # Pre-loaded configuration - loaded at container startup
 BEDROCK_LLM_ID = None
+REWRITE_LLM_ID = None
 EMBEDDING_MODEL_ID = None
 BEDROCK_REGION = None
 EMBEDDING_REGION = None
@@ -117,16 +127,20 @@ GUARDRAIL_ID = None
 # Pre-load critical configuration during container startup (outside handler)
 try:
     logger.info("Pre-loading critical configuration...")
-    import boto3
     
-    _ssm_client = boto3.client("ssm", region_name=REGION)
-    _secrets_manager = boto3.client("secretsmanager", region_name=REGION)
+    from helpers.aws_clients import get_client
+    _ssm_client = get_client("ssm", region_name=REGION)
+    _secrets_manager = get_client("secretsmanager", region_name=REGION)
     
     # Pre-fetch SSM parameters
     if BEDROCK_LLM_PARAM:
         BEDROCK_LLM_ID = _ssm_client.get_parameter(Name=BEDROCK_LLM_PARAM, WithDecryption=True)["Parameter"]["Value"]
         logger.info(f"Pre-loaded BEDROCK_LLM_ID: {BEDROCK_LLM_ID}")
     
+    if REWRITE_LLM_PARAM:
+        REWRITE_LLM_ID = _ssm_client.get_parameter(Name=REWRITE_LLM_PARAM, WithDecryption=True)["Parameter"]["Value"]
+        logger.info(f"Pre-loaded REWRITE_LLM_ID: {REWRITE_LLM_ID}")
+    
     if EMBEDDING_MODEL_PARAM:
         EMBEDDING_MODEL_ID = _ssm_client.get_parameter(Name=EMBEDDING_MODEL_PARAM, WithDecryption=True)["Parameter"]["Value"]
         logger.info(f"Pre-loaded EMBEDDING_MODEL_ID: {EMBEDDING_MODEL_ID}")
@@ -156,11 +170,11 @@ try:
     # We do this after fetching secrets so we have credentials available.
     try:
         logger.info("Pre-warming database connection pool...")
-        import psycopg2.pool
+        from helpers.db_pool import ConnectionPool
         db_secret_response = _secrets_manager.get_secret_value(SecretId=DB_SECRET_NAME)
         db_creds = json.loads(db_secret_response["SecretString"])
         _db_secret = db_creds  # Cache the secret
-        _db_connection_pool = psycopg2.pool.ThreadedConnectionPool(
+        _db_connection_pool = ConnectionPool(
             minconn=1,
             maxconn=5,
             host=RDS_PROXY_ENDPOINT,
@@ -213,10 +227,10 @@ def get_bedrock_runtime():
     """
     global _bedrock_runtime
     if _bedrock_runtime is None:
-        import boto3
+        from helpers.aws_clients import get_client
         # Use EMBEDDING_REGION from SSM parameter (defaults to us-east-1 for Cohere Embed v4)
         embedding_region = EMBEDDING_REGION or "us-east-1"
-        _bedrock_runtime = boto3.client("bedrock-runtime", region_name=embedding_region)
+        _bedrock_runtime = get_client("bedrock-runtime", region_name=embedding_region)
         logger.info(f"Bedrock runtime client initialized for region: {embedding_region}")
     return _bedrock_runtime
 
@@ -243,8 +257,14 @@ def get_embeddings():
     return _embeddings
 
 
-def emit_cold_start_metrics(function_name: str, execution_ms: int, cold_start_ms: int | None) -> None:
-    """Emit embedded CloudWatch metrics for cold start and execution time."""
+def emit_cold_start_metrics(function_name: str, execution_ms: int, cold_start_ms: int | None, generation_metrics: dict | None = None) -> None:
+    """
+    Emit embedded CloudWatch metrics for cold start and execution time.
+    
+    When generation_metrics from an LLM answer are given, question-rewrite and
+    time-to-first-token metrics are emitted too. The average of RewriteSkipped
+    is the rewrite-skip rate.
+    """
     if not COLD_START_METRIC:
         return
 
@@ -269,6 +289,57 @@ def emit_cold_start_metrics(function_name: str, execution_ms: int, cold_start_ms
         "ExecutionTimeMs": execution_ms,
     }
 
+    if generation_metrics and "rewrite_skipped" in generation_metrics:
+        metrics = [{"Name": "RewriteSkipped", "Unit": "Count"}]
+        metrics_payload["RewriteSkipped"] = 1 if generation_metrics["rewrite_skipped"] else 0
+        if "rewrite_ms" in generation_metrics:
+            metrics.append({"Name": "RewriteLatencyMs", "Unit": "Milliseconds"})
+            metrics_payload["RewriteLatencyMs"] = generation_metrics["rewrite_ms"]
+        if "ttft_ms" in generation_metrics:
+            metrics.append({"Name": "TimeToFirstTokenMs", "Unit": "Milliseconds"})
+            metrics_payload["TimeToFirstTokenMs"] = generation_metrics["ttft_ms"]
+        metrics_payload["_aws"]["CloudWatchMetrics"].append({
+            "Namespace": "Lambda/TextGeneration",
+            "Dimensions": [["FunctionName"]],
+            "Metrics": metrics,
+        })
+
+    if generation_metrics and "faq_cache_tier" in generation_metrics:
+        # One 0/1 metric per tier; the average of each is that tier's share of FAQ lookups
+        tier = generation_metrics["faq_cache_tier"]
+        metrics_payload["FaqLruHit"] = 1 if tier == "lru" else 0
+        metrics_payload["FaqDynamoDbHit"] = 1 if tier == "dynamodb" else 0
+        metrics_payload["FaqSemanticHit"] = 1 if tier == "semantic" else 0
+        metrics_payload["_aws"]["CloudWatchMetrics"].append({
+            "Namespace": "Lambda/TextGeneration",
+            "Dimensions": [["FunctionName"]],
+            "Metrics": [
+                {"Name": "FaqLruHit", "Unit": "Count"},
+                {"Name": "FaqDynamoDbHit", "Unit": "Count"},
+                {"Name": "FaqSemanticHit", "Unit": "Count"},
+            ],
+        })
+
+    # Connection checkouts made during this request
+    from helpers.db_pool import pool_metrics
+    db_metrics = pool_metrics(_db_connection_pool)
+    if db_metrics["definitions"]:
+        metrics_payload.update(db_metrics["values"])
+        metrics_payload["_aws"]["CloudWatchMetrics"].append({
+            "Namespace": "Lambda/Database",
+            "Dimensions": [["FunctionName"]],
+            "Metrics": db_metrics["definitions"],
+        })
+        metrics_payload["DbPool"] = _db_connection_pool.stats()
+
+    # Container-lifetime counters, logged as properties for Logs Insights
+    from helpers.token_limit_helper import get_limit_cache_stats
+    from helpers.interaction_logger import get_interaction_logger_stats
+    from helpers.faq_cache import get_faq_cache_tier_stats
+    metrics_payload["TokenLimitCache"] = get_limit_cache_stats()
+    metrics_payload["InteractionLogger"] = get_interaction_logger_stats()
+    metrics_payload["FaqCache"] = get_faq_cache_tier_stats()
+
     print(json.dumps(metrics_payload))
 
 
@@ -309,17 +380,22 @@ def initialize_constants():
 
 
 def get_db_connection_pool():
-    """Get or create database connection pool with thread-safe singleton pattern"""
+    """
+    Get or create database connection pool with thread-safe singleton pattern.
+    
+    The pool validates connections on checkout and replaces broken ones
+    (see helpers/db_pool.py).
+    """
     global _db_connection_pool
     
     if _db_connection_pool is None:
         with _pool_lock:
             # Double-check locking pattern
             if _db_connection_pool is None:
-                import psycopg2.pool
+                from helpers.db_pool import ConnectionPool
                 try:
                     secret = get_secret(DB_SECRET_NAME)
-                    _db_connection_pool = psycopg2.pool.ThreadedConnectionPool(
+                    _db_connection_pool = ConnectionPool(
                         minconn=1,
                         maxconn=5,
                         host=RDS_PROXY_ENDPOINT,
@@ -386,7 +462,7 @@ def estimate_token_count(text: str) -> int:
 
 
 # This function is now a wrapper for the helper function in chat.py
-def process_query_streaming(query, textbook_id, retriever, chat_session_id, websocket_endpoint, connection_id, connection=None):
+def process_query_streaming(query, textbook_id, retriever, chat_session_id, websocket_endpoint, connection_id, connection=None, request_context=None):
     """
     Process a query using streaming response via WebSocket
     """
@@ -399,6 +475,10 @@ def process_query_streaming(query, textbook_id, retriever, chat_session_id, webs
         # Initialize LLM
         logger.info(f"Initializing Bedrock LLM with model ID: {BEDROCK_LLM_ID}")
         llm = get_bedrock_llm(BEDROCK_LLM_ID, bedrock_region=BEDROCK_REGION)
+        # Follow-up questions are rewritten by a smaller model when one is configured
+        rewrite_llm = None
+        if REWRITE_LLM_ID and REWRITE_LLM_ID != BEDROCK_LLM_ID:
+            rewrite_llm = get_bedrock_llm(REWRITE_LLM_ID, temperature=0, bedrock_region=BEDROCK_REGION)
         
         # Use the streaming helper function from chat.py
         logger.info(f"Calling get_response_streaming with textbook_id: {textbook_id}")
@@ -413,14 +493,16 @@ def process_query_streaming(query, textbook_id, retriever, chat_session_id, webs
             websocket_endpoint=websocket_endpoint,
             connection_id=connection_id,
             table_name=TABLE_NAME_PARAM,
-            bedrock_llm_id=BEDROCK_LLM_ID
+            bedrock_llm_id=BEDROCK_LLM_ID,
+            rewrite_llm=rewrite_llm,
+            session_name_checked=bool(request_context and request_context.found)
         )
     except Exception as e:
         logger.error(f"Error in process_query_streaming: {str(e)}", exc_info=True)
         # Send error message via WebSocket
         try:
-            import boto3
-            apigatewaymanagementapi = boto3.client('apigatewaymanagementapi', endpoint_url=websocket_endpoint)
+            from helpers.aws_clients import get_client
+            apigatewaymanagementapi = get_client('apigatewaymanagementapi', endpoint_url=websocket_endpoint)
             apigatewaymanagementapi.post_to_connection(
                 ConnectionId=connection_id,
                 Data=json.dumps({
@@ -545,106 +627,172 @@ def parse_and_validate_request(event):
     return question, textbook_id, chat_session_id, is_websocket, connection_id, websocket_endpoint
 
 
-def enforce_token_limits(connection, chat_session_id, ssm_client, is_websocket, connection_id, websocket_endpoint):
+def _raise_token_limit_error(token_status, user_session_id, is_websocket, connection_id, websocket_endpoint):
+    """Notify the client (WebSocket) and raise TokenLimitError for an exhausted token window."""
+    daily_limit = token_status.get('daily_limit')
+    hours_until_reset = token_status.get('hours_until_reset', 0)
+    reset_time = token_status.get('reset_time', '')
+    tokens_used = token_status.get('tokens_used', 0)
+    
+    error_message = f"You have reached your daily token limit of {daily_limit:,} tokens. Your limit will reset in {hours_until_reset:.1f} hours."
+    logger.warning(f"Token limit exceeded for user_session {user_session_id}: {tokens_used}/{daily_limit}")
+    
+    # Send WebSocket error if applicable
+    if is_websocket and connection_id and websocket_endpoint:
+        try:
+            from helpers.aws_clients import get_client
+            apigatewaymanagementapi = get_client('apigatewaymanagementapi', endpoint_url=websocket_endpoint)
+            apigatewaymanagementapi.post_to_connection(
+                ConnectionId=connection_id,
+                Data=json.dumps({
+                    "type": "error",
+                    "message": error_message,
+                    "error_code": "TOKEN_LIMIT_EXCEEDED"
+                })
+            )
+        except Exception as ws_error:
+            logger.error(f"Failed to send token limit error via WebSocket: {ws_error}")
+    
+    # Raise exception to stop processing
+    usage_info = {
+        "tokens_used": tokens_used,
+        "daily_limit": daily_limit,
+        "remaining_tokens": 0,
+        "hours_until_reset": hours_until_reset,
+        "reset_time": reset_time
+    }
+    raise TokenLimitError(error_message, usage_info=usage_info)
+
+
+def check_token_window(request_context, ssm_client, is_websocket, connection_id, websocket_endpoint):
+    """
+    Reject the request if the user's daily token window is already exhausted.
+    
+    Read-only: uses the usage loaded with the request context, so FAQ cache
+    hits never write to user_sessions. Tokens are reserved only when an
+    answer has to be generated (enforce_token_limits).
+    
+    Raises:
+        TokenLimitError: If limit is exceeded
+    """
+    # Lazy import
+    from helpers.token_limit_helper import get_daily_token_limit
+    
+    if not request_context or not DAILY_TOKEN_LIMIT_PARAM or not request_context.user_session_id:
+        return
+    
+    try:
+        daily_limit = get_daily_token_limit(DAILY_TOKEN_LIMIT_PARAM, ssm_client)
+        exhausted = daily_limit != float('inf') and request_context.window_tokens_used >= daily_limit
+    except Exception as e:
+        logger.error(f"Error in token pre-check: {e}", exc_info=True)
+        # Fail open
+        return
+    
+    if exhausted:
+        _raise_token_limit_error({
+            'tokens_used': request_context.window_tokens_used,
+            'daily_limit': daily_limit,
+            'hours_until_reset': request_context.hours_until_reset,
+            'reset_time': request_context.reset_time,
+        }, request_context.user_session_id, is_websocket, connection_id, websocket_endpoint)
+
+
+def enforce_token_limits(connection, request_context, ssm_client, is_websocket, connection_id, websocket_endpoint, question=""):
     """
-    Check if the user has exceeded their daily token limit.
+    Check the user's daily token limit and reserve tokens for this request.
+    
+    Called after an FAQ cache miss, right before generation. The check and the
+    reservation are one atomic UPDATE. The reservation is an estimate
+    (question plus TOKEN_RESERVATION_OUTPUT_TOKENS) and is reconciled with
+    the actual usage once the answer is generated, or released if the
+    request ends without one.
     
     Returns:
-        bool: True if check passed (or unlimited)
+        dict | None: The reservation ({"user_session_id", "reserved_tokens"}),
+        or None if there is nothing to enforce (or the check failed open)
         
     Raises:
         TokenLimitError: If limit is exceeded
     """
     # Lazy import
-    from helpers.token_limit_helper import get_user_session_from_chat_session, get_session_token_status
+    from helpers.token_limit_helper import check_and_update_token_limit
     
-    if not chat_session_id or not DAILY_TOKEN_LIMIT_PARAM:
-        return True
+    if not request_context or not DAILY_TOKEN_LIMIT_PARAM:
+        return None
         
     try:
-        # Get user_session_id
-        user_session_id = get_user_session_from_chat_session(connection, chat_session_id)
+        # user_session_id was resolved with the request context
+        user_session_id = request_context.user_session_id
         
         if not user_session_id:
-            return True
-            
-        # Check status
-        token_status = get_session_token_status(
+            return None
+        
+        reserved_tokens = estimate_token_count(question) + TOKEN_RESERVATION_OUTPUT_TOKENS
+        # Check and reserve in one statement; the request may proceed as
+        # long as any tokens remain in the window
+        can_proceed, token_status = check_and_update_token_limit(
             connection=connection,
             user_session_id=user_session_id,
+            tokens_to_add=reserved_tokens,
             global_limit_param_name=DAILY_TOKEN_LIMIT_PARAM,
-            ssm_client=ssm_client
+            ssm_client=ssm_client,
+            allow_overshoot=True
         )
         
-        daily_limit = token_status.get('daily_limit')
-        remaining_tokens = token_status.get('remaining_tokens', 0)
-        
         # If limit exceeded
-        if daily_limit != float('inf') and remaining_tokens <= 0:
-            hours_until_reset = token_status.get('hours_until_reset', 0)
-            reset_time = token_status.get('reset_time', '')
-            tokens_used = token_status.get('tokens_used', 0)
-            
-            error_message = f"You have reached your daily token limit of {daily_limit:,} tokens. Your limit will reset in {hours_until_reset:.1f} hours."
-            logger.warning(f"Token limit exceeded for user_session {user_session_id}: {tokens_used}/{daily_limit}")
-            
-            # Send WebSocket error if applicable
-            if is_websocket and connection_id and websocket_endpoint:
-                try:
-                    import boto3
-                    apigatewaymanagementapi = boto3.client('apigatewaymanagementapi', endpoint_url=websocket_endpoint)
-                    apigatewaymanagementapi.post_to_connection(
-                        ConnectionId=connection_id,
-                        Data=json.dumps({
-                            "type": "error",
-                            "message": error_message,
-                            "error_code": "TOKEN_LIMIT_EXCEEDED"
-                        })
-                    )
-                except Exception as ws_error:
-                    logger.error(f"Failed to send token limit error via WebSocket: {ws_error}")
-            
-            # Raise exception to stop processing
-            usage_info = {
-                "tokens_used": tokens_used,
-                "daily_limit": daily_limit,
-                "remaining_tokens": 0,
-                "hours_until_reset": hours_until_reset,
-                "reset_time": reset_time
-            }
-            raise TokenLimitError(error_message, usage_info=usage_info)
-            
-        return True
+        if not can_proceed:
+            _raise_token_limit_error(token_status, user_session_id, is_websocket, connection_id, websocket_endpoint)
+        
+        return {"user_session_id": user_session_id, "reserved_tokens": reserved_tokens, "reconciled": False}
         
     except TokenLimitError:
         raise
     except Exception as e:
         logger.error(f"Error in token pre-check: {e}", exc_info=True)
         # Fail open
-        return True
+        return None
 
 
+def release_token_reservation(connection, token_reservation):
+    """Return an unreconciled reservation (e.g. a failed request)."""
+    from helpers.token_limit_helper import reconcile_token_reservation
+    
+    if not token_reservation or token_reservation.get("reconciled"):
+        return
+    try:
+        reconcile_token_reservation(connection, token_reservation["user_session_id"], token_reservation["reserved_tokens"], 0)
+        token_reservation["reconciled"] = True
+    except Exception as e:
+        logger.error(f"Error releasing token reservation: {e}")
 
-def handle_faq_check(question, textbook_id, embeddings, connection, is_websocket, connection_id, websocket_endpoint):
+
+def handle_faq_check(question, textbook_id, embeddings, connection, is_websocket, connection_id, websocket_endpoint, query_context=None):
     """
     Check FAQ cache and stream response if found (WebSocket only).
+    
+    Exact repeats of a question are answered from the exact-match tiers
+    without an embedding. Otherwise the question embedding is taken from
+    query_context so that a cache miss does not embed the question again for
+    retrieval.
     """
     # Lazy import
-    from helpers.faq_cache import check_faq_cache, stream_cached_response
+    from helpers.faq_cache import lookup_faq_answer, stream_cached_response
     
     if not is_websocket:
         return None
         
     logger.info("Checking FAQ cache for similar questions...")
-    cached_response = check_faq_cache(
+    cached_response = lookup_faq_answer(
         question=question,
         textbook_id=textbook_id,
         embeddings=embeddings,
-        connection=connection
+        connection=connection,
+        query_context=query_context
     )
     
     if cached_response:
-        logger.info(f"Found cached response (similarity: {cached_response.get('similarity', 0):.4f})")
+        logger.info(f"Found cached response (tier: {cached_response.get('cache_tier')}, similarity: {cached_response.get('similarity', 0):.4f})")
         stream_cached_response(
             cached_faq=cached_response,
             websocket_endpoint=websocket_endpoint,
@@ -655,12 +803,16 @@ def handle_faq_check(question, textbook_id, embeddings, connection, is_websocket
     return None
 
 
-def generate_and_cache_response(question, textbook_id, retriever, connection, chat_session_id, is_websocket, connection_id, websocket_endpoint, embeddings):
+def generate_and_cache_response(question, textbook_id, retriever, connection, chat_session_id, is_websocket, connection_id, websocket_endpoint, embeddings, query_context=None, request_context=None):
     """
     Generate response using LLM and cache to FAQ if appropriate.
+    
+    The FAQ write-back is deferred until after the complete frame has been
+    sent and reuses the question embedding held by query_context.
     """
-    # Lazy import
+    # Lazy imports
     from helpers.faq_cache import cache_faq
+    from helpers.deferred_tasks import defer
     
     response_data = None
     
@@ -672,7 +824,8 @@ def generate_and_cache_response(question, textbook_id, retriever, connection, ch
             connection=connection,
             chat_session_id=chat_session_id,
             websocket_endpoint=websocket_endpoint,
-            connection_id=connection_id
+            connection_id=connection_id,
+            request_context=request_context
         )
         
         # Cache logic
@@ -684,16 +837,19 @@ def generate_and_cache_response(question, textbook_id, retriever, connection, ch
         )
         
         if should_cache:
-            logger.info("Caching FAQ response for future use...")
+            logger.info("Queueing FAQ response for caching...")
             cache_metadata = {"sources_count": len(response_data.get("sources_used", []))}
-            cache_faq(
+            defer(
+                "faq_write_back",
+                cache_faq,
                 question=question,
                 answer=response_data["response"],
                 textbook_id=textbook_id,
                 embeddings=embeddings,
                 connection=connection,
                 sources=response_data.get("sources_used", []),
-                metadata=cache_metadata
+                metadata=cache_metadata,
+                query_context=query_context
             )
     else:
         logger.warning("Non-WebSocket API call detected - this is deprecated")
@@ -708,92 +864,63 @@ def generate_and_cache_response(question, textbook_id, retriever, connection, ch
     return response_data
 
 
-def track_usage_and_logs(connection, chat_session_id, question, response_data, textbook_id, is_websocket):
+def track_usage_and_logs(connection, chat_session_id, question, response_data, textbook_id, is_websocket, token_reservation=None, request_context=None):
     """
     Handle post-response token usage tracking and async analytics logging.
     """
     # Lazy imports
-    from helpers.token_limit_helper import get_user_session_from_chat_session, check_and_update_token_limit
-    from helpers.chat import update_session_name
+    from helpers.token_limit_helper import reconcile_token_reservation
+    from helpers.chat import update_session_name, is_session_named
+    
+    context_loaded = bool(request_context and request_context.loaded)
     
-    # 1. Token Tracking
-    if chat_session_id and DAILY_TOKEN_LIMIT_PARAM:
+    # 1. Token Tracking: replace the pre-generation reservation with actual usage
+    if token_reservation and not token_reservation.get("reconciled"):
         try:
-            user_session_id = get_user_session_from_chat_session(connection, chat_session_id)
-            if user_session_id:
-                # Calculate tokens
-                token_usage = response_data.get('token_usage')
-                if token_usage:
-                    tokens_used = token_usage.get('total_tokens', 0)
-                else:
-                    input_tokens = estimate_token_count(question)
-                    output_tokens = estimate_token_count(response_data.get('response', ''))
-                    tokens_used = input_tokens + output_tokens
-                
-                # Update DB
-                can_proceed, usage_info = check_and_update_token_limit(
-                    connection=connection,
-                    user_session_id=user_session_id,
-                    tokens_to_add=tokens_used,
-                    global_limit_param_name=DAILY_TOKEN_LIMIT_PARAM,
-                    ssm_client=get_ssm_client()
-                )
-                
-                if can_proceed:
-                     logger.info(f"Token usage tracked. Total: {usage_info.get('tokens_used')}/{usage_info.get('daily_limit')}")
+            # Calculate tokens
+            token_usage = response_data.get('token_usage')
+            if token_usage:
+                tokens_used = token_usage.get('total_tokens', 0)
+            else:
+                input_tokens = estimate_token_count(question)
+                output_tokens = estimate_token_count(response_data.get('response', ''))
+                tokens_used = input_tokens + output_tokens
+            
+            # Update DB
+            total = reconcile_token_reservation(
+                connection=connection,
+                user_session_id=token_reservation["user_session_id"],
+                reserved_tokens=token_reservation["reserved_tokens"],
+                actual_tokens=tokens_used
+            )
+            token_reservation["reconciled"] = True
+            logger.info(f"Token usage tracked: {tokens_used} tokens (session total: {total})")
         except Exception as e:
             logger.error(f"Error tracking token usage: {e}", exc_info=True)
 
     # 2. Session Name Update (Sync)
     session_name = None
-    if chat_session_id and TABLE_NAME_PARAM and not is_websocket:
+    if chat_session_id and TABLE_NAME_PARAM and not is_websocket and not is_session_named(chat_session_id):
         try:
             session_name = update_session_name(
                 table_name=TABLE_NAME_PARAM,
                 session_id=chat_session_id,
                 bedrock_llm_id=BEDROCK_LLM_ID,
-                db_connection=connection
+                db_connection=connection,
+                check_existing=not (context_loaded and request_context.found)
             )
         except Exception as e:
             logger.error(f"Error updating session name: {e}")
 
-    # 3. Async Logging
-    if chat_session_id:
-        def log_interaction_async(session_id, q, resp, sources, tb_id):
-            async_conn = None
-            try:
-                async_conn = connect_to_db()
-                with async_conn.cursor() as cur:
-                    cur.execute(
-                        """
-                        INSERT INTO user_interactions
-                        (chat_session_id, sender_role, query_text, response_text, source_chunks)
-                        VALUES (%s, %s, %s, %s, %s)
-                        """,
-                        (session_id, "User", q, resp, json.dumps(sources))
-                    )
-                async_conn.commit()
-                logger.info(f"[ASYNC] Logged interaction for textbook {tb_id}")
-            except Exception as async_error:
-                logger.error(f"[ASYNC] Error logging interaction: {async_error}")
-                if async_conn:
-                    try:
-                        async_conn.rollback()
-                    except Exception as rollback_error:
-                        logger.error(f"[ASYNC] Error during rollback: {rollback_error}", exc_info=True)
-            finally:
-                if async_conn:
-                    return_db_connection(async_conn)
-                    logger.debug("[ASYNC] Returned connection to pool")
-
-        log_thread = threading.Thread(
-            target=log_interaction_async,
-            args=(chat_session_id, question, response_data["response"], 
-                  response_data["sources_used"], textbook_id),
-            daemon=False
-        )
-        log_thread.start()
-        logger.info("Started async analytics logging thread")
+    # 3. Async Logging (skipped for chat sessions known not to exist)
+    if chat_session_id and context_loaded and not request_context.found:
+        logger.warning(f"Not logging interaction: chat_session {chat_session_id} does not exist")
+    elif chat_session_id:
+        # Batched by the background logger; never holds a connection on the request path
+        from helpers.interaction_logger import init_interaction_logger, log_interaction
+        init_interaction_logger(connect_to_db, return_db_connection)
+        if log_interaction(chat_session_id, question, response_data["response"], response_data["sources_used"]):
+            logger.info(f"Queued interaction log for textbook {textbook_id}")
 
     return session_name
 
@@ -841,12 +968,13 @@ def _handle_get_request(event, finalize):
     })
 
 
-def _setup_resources(textbook_id):
+def _setup_resources(textbook_id, query_context=None):
     """
     Initialize database connection, embeddings, and retriever for a textbook.
     
     Args:
         textbook_id: The textbook to set up resources for
+        query_context: Optional QueryEmbeddingContext the retriever should embed through
         
     Returns:
         tuple: (connection, embeddings, retriever)
@@ -877,7 +1005,8 @@ def _setup_resources(textbook_id):
             llm=None,
             textbook_id=textbook_id,
             vectorstore_config_dict=vectorstore_config,
-            embeddings=embeddings
+            embeddings=embeddings,
+            query_context=query_context
         )
         if retriever is None:
             raise ValidationError(f"No embeddings found for textbook {textbook_id}")
@@ -909,15 +1038,20 @@ def handler(event, context):
     else:
         logger.info("♻️ WARM START")
 
+    generation_metrics = {}
+    if _db_connection_pool is not None:
+        _db_connection_pool.begin_request()
+
     def finalize(resp):
         execution_ms = int((time.time() - start_time) * 1000)
-        emit_cold_start_metrics(context.function_name, execution_ms, cold_start_duration_ms)
+        emit_cold_start_metrics(context.function_name, execution_ms, cold_start_duration_ms, generation_metrics)
         logger.info(f"Total execution time: {execution_ms}ms")
         return resp
 
     logger.info("Starting textbook question answering Lambda")
     
     connection = None
+    token_reservation = None
     
     # Handle warmup request - initialize resources but return immediately
     if event.get("warmup"):
@@ -925,6 +1059,9 @@ def handler(event, context):
         try:
             initialize_constants()
             _ = get_embeddings()  # Pre-load embeddings model
+            if DAILY_TOKEN_LIMIT_PARAM:
+                from helpers.token_limit_helper import get_daily_token_limit
+                get_daily_token_limit(DAILY_TOKEN_LIMIT_PARAM, get_ssm_client())  # Pre-load token limit cache
             connection = connect_to_db()
             return_db_connection(connection)
             warmup_duration_ms = int((time.time() - start_time) * 1000)
@@ -962,37 +1099,57 @@ def handler(event, context):
                 raise ValidationError("Invalid session ID format", {"original_error": str(e)})
 
         # 4. Resource Setup (DB & Retriever)
-        connection, embeddings, retriever = _setup_resources(textbook_id)
+        # The question is embedded at most once per request: the FAQ check,
+        # retrieval and FAQ write-back all read it from this context.
+        from helpers.query_embedding import QueryEmbeddingContext
+        query_context = QueryEmbeddingContext(get_embeddings(), question)
+        connection, embeddings, retriever = _setup_resources(textbook_id, query_context)
         
-        # 5. Token Check
+        # Chat session, user session, token usage and session name in one query,
+        # shared by token limiting, session naming and interaction logging
+        request_context = None
+        if chat_session_id:
+            from helpers.request_context import load_request_context
+            from helpers.chat import mark_session_named
+            request_context = load_request_context(connection, chat_session_id)
+            if request_context.is_named:
+                mark_session_named(chat_session_id)
+        
+        # 5. Token Check (read-only; tokens are reserved only on an FAQ miss)
         ssm_client = get_ssm_client()
-        enforce_token_limits(connection, chat_session_id, ssm_client, is_websocket, connection_id, websocket_endpoint)
+        check_token_window(request_context, ssm_client, is_websocket, connection_id, websocket_endpoint)
 
         # 5. Business Logic: FAQ Check OR Generate Response
         response_data = None
         from_cache = False
         
         # FAQ Check
-        cached_response = handle_faq_check(question, textbook_id, embeddings, connection, is_websocket, connection_id, websocket_endpoint)
+        cached_response = handle_faq_check(question, textbook_id, embeddings, connection, is_websocket, connection_id, websocket_endpoint, query_context)
         
         if cached_response:
-            response_data = {"response": cached_response["answer"], "sources_used": cached_response.get("sources", []), "cache_similarity": cached_response.get("similarity")}
+            response_data = {"response": cached_response["answer_text"], "sources_used": cached_response.get("sources_used", []), "cache_similarity": cached_response.get("similarity")}
+            generation_metrics["faq_cache_tier"] = cached_response.get("cache_tier")
             from_cache = True
         else:
+            generation_metrics["faq_cache_tier"] = None
+            token_reservation = enforce_token_limits(connection, request_context, ssm_client, is_websocket, connection_id, websocket_endpoint, question)
             # Generate Response
             try:
                 response_data = generate_and_cache_response(
                     question, textbook_id, retriever, connection, chat_session_id, 
-                    is_websocket, connection_id, websocket_endpoint, embeddings
+                    is_websocket, connection_id, websocket_endpoint, embeddings, query_context, request_context
                 )
             except Exception as query_error:
                 logger.error(f"Error processing query: {query_error}", exc_info=True)
                 raise UpstreamServiceError(f"Error processing query: {str(query_error)}", "LLM/Bedrock")
 
+        logger.info(f"Query embeddings computed this request: {query_context.embed_calls}")
+        generation_metrics.update(response_data.get("generation_metrics") or {})
+
         # 6. Post-Processing (Usage Tracking & Logging)
         session_name = None
         if not from_cache:
-            session_name = track_usage_and_logs(connection, chat_session_id, question, response_data, textbook_id, is_websocket)
+            session_name = track_usage_and_logs(connection, chat_session_id, question, response_data, textbook_id, is_websocket, token_reservation, request_context)
 
         # 7. Final Response
         response_body = {
@@ -1054,6 +1211,28 @@ def handler(event, context):
         })
         
     finally:
+        # Work deferred until after the response was delivered (e.g. session
+        # naming) still needs the connection, so drain it first
+        from helpers.deferred_tasks import run_deferred_tasks
+        deferred_start = time.time()
+        deferred_count = run_deferred_tasks()
+        if deferred_count:
+            logger.info(f"Ran {deferred_count} deferred task(s) in {int((time.time() - deferred_start) * 1000)}ms")
+        
+        # FAQ cache hits are counted in memory and written in one statement
+        if connection:
+            from helpers.faq_cache import flush_faq_usage
+            flush_faq_usage(connection)
+        
+        # Write queued interaction logs before the environment can be frozen
+        from helpers.interaction_logger import flush as flush_interaction_logs
+        flush_interaction_logs()
+        
+        # Release tokens reserved for a request that produced no generated
+        # answer (FAQ cache hit or failure)
+        if connection and token_reservation:
+            release_token_reservation(connection, token_reservation)
+        
         # Ensure connection returned to pool
         if connection:
             return_db_connection(connection)
\ No newline at end of file
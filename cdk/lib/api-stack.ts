@@ -926,6 +926,17 @@ export class ApiGatewayStack extends cdk.Stack {
       }
     );
 
+    // Smaller model used to rewrite follow-up questions before retrieval
+    const rewriteLLMParameter = new ssm.StringParameter(
+      this,
+      "RewriteLLMParameter",
+      {
+        parameterName: `/${id}/OER/RewriteLLMId`,
+        description: "Parameter containing the Bedrock LLM ID for follow-up question rewrites",
+        stringValue: "meta.llama3-8b-instruct-v1:0",
+      }
+    );
+
     const embeddingModelParameter = new ssm.StringParameter(
       this,
       "EmbeddingModelParameter",
@@ -991,6 +1002,20 @@ export class ApiGatewayStack extends cdk.Stack {
       removalPolicy: cdk.RemovalPolicy.DESTROY, // Use RETAIN for production
     });
 
+    // Exact-match answer cache shared by TextGen containers, in front of the
+    // semantic FAQ cache (keyed on a hash of textbook ID + normalized question)
+    const faqAnswerCacheTable = new dynamodb.Table(
+      this,
+      `${id}-FaqAnswerCache`,
+      {
+        tableName: `${id}-faq-answer-cache`,
+        partitionKey: { name: "cache_key", type: dynamodb.AttributeType.STRING },
+        billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+        removalPolicy: cdk.RemovalPolicy.DESTROY,
+        timeToLiveAttribute: "expires_at",
+      }
+    );
+
     // Create Bedrock Guardrails
     const bedrockGuardrail = new bedrock.CfnGuardrail(
       this,
@@ -1223,10 +1248,12 @@ export class ApiGatewayStack extends cdk.Stack {
           RDS_PROXY_ENDPOINT: db.rdsProxyEndpoint,
           REGION: this.region,
           BEDROCK_LLM_PARAM: bedrockLLMParameter.parameterName,
+          REWRITE_LLM_PARAM: rewriteLLMParameter.parameterName,
           EMBEDDING_MODEL_PARAM: embeddingModelParameter.parameterName,
           BEDROCK_REGION_PARAM: bedrockRegionParameter.parameterName,
           EMBEDDING_REGION_PARAM: embeddingRegionParameter.parameterName,
           TABLE_NAME_PARAM: sessionTable.tableName,
+          FAQ_ANSWER_CACHE_TABLE: faqAnswerCacheTable.tableName,
           GUARDRAIL_ID_PARAM: guardrailParameter.parameterName,
           DAILY_TOKEN_LIMIT_PARAM: dailyTokenLimitParameter.parameterName,
           //MESSAGE_LIMIT_PARAM: messageLimitParameter.parameterName,
@@ -1282,6 +1309,8 @@ export class ApiGatewayStack extends cdk.Stack {
       })
     );
 
+    faqAnswerCacheTable.grantReadWriteData(textGenLambdaDockerFunc);
+
     // Bedrock permissions
     const textGenBedrockPolicyStatement = new iam.PolicyStatement({
       effect: iam.Effect.ALLOW,
@@ -1293,6 +1322,8 @@ export class ApiGatewayStack extends cdk.Stack {
       resources: [
         // LLM model (Llama 3)
         `arn:aws:bedrock:${this.region}::foundation-model/meta.llama3-70b-instruct-v1:0`,
+        // Question rewrite model (Llama 3 8B)
+        `arn:aws:bedrock:${this.region}::foundation-model/meta.llama3-8b-instruct-v1:0`,
         // Cohere Embed v4 (us-east-1 only)
         `arn:aws:bedrock:us-east-1::foundation-model/cohere.embed-v4:0`,
         // Guardrail
@@ -1319,6 +1350,7 @@ export class ApiGatewayStack extends cdk.Stack {
         actions: ["ssm:GetParameter"],
         resources: [
           bedrockLLMParameter.parameterArn,
+          rewriteLLMParameter.parameterArn,
           embeddingModelParameter.parameterArn,
           bedrockRegionParameter.parameterArn,
           embeddingRegionParameter.parameterArn,
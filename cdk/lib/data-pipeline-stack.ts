@@ -221,6 +221,23 @@ export class DataPipelineStack extends cdk.Stack {
       }
     );
 
+    // practiceMaterial prompt builders and item validators, shared with the
+    // practice pool job so pool items follow the same rules as live ones
+    const PRACTICE_GENERATOR_MODULES = ["mcq.py", "flashcard.py", "short_answer.py"];
+    const deployPracticeGenerators = new s3deploy.BucketDeployment(
+      this,
+      "DeployPracticeGenerators",
+      {
+        sources: [
+          s3deploy.Source.asset("./lambda/practiceMaterial/src/generators/"),
+        ],
+        destinationBucket: this.glueBucket,
+        destinationKeyPrefix: "glue/libs/practice_generators",
+        exclude: ["*"],
+        include: PRACTICE_GENERATOR_MODULES,
+      }
+    );
+
     // IAM Role for Glue Jobs
     const glueJobRole = new iam.Role(this, "GlueJobRole", {
       assumedBy: new iam.ServicePrincipal("glue.amazonaws.com"),
@@ -278,6 +295,16 @@ export class DataPipelineStack extends cdk.Stack {
               actions: ["bedrock:InvokeModel"],
               resources: [
                 `arn:aws:bedrock:us-east-1::foundation-model/cohere.embed-v4:0`,
+                // Practice material pool generation (same model as the practiceMaterial Lambda)
+                `arn:aws:bedrock:${this.region}::foundation-model/meta.llama3-70b-instruct-v1:0`,
+              ],
+            }),
+            new iam.PolicyStatement({
+              effect: iam.Effect.ALLOW,
+              // data_processing starts the practice pool job for newly ingested textbooks
+              actions: ["glue:StartJobRun"],
+              resources: [
+                `arn:aws:glue:${this.region}:${this.account}:job/${id}-practice-pool-job`,
               ],
             }),
           ],
@@ -326,6 +353,8 @@ export class DataPipelineStack extends cdk.Stack {
         // Custom modules/wheels from S3
         //"--extra-py-files": `s3://${this.glueBucket.bucketName}/glue/libs/`,
         "--embedding_model_id": `cohere.embed-v4:0`,
+        // Pre-generate practice material for the textbook once it is indexed
+        "--practice_pool_job_name": `${id}-practice-pool-job`,
       },
       connections: {
         connections: [this.glueConnection.ref],
@@ -381,6 +410,115 @@ export class DataPipelineStack extends cdk.Stack {
     // Ensure scripts are uploaded before creating the media job
     mediaProcessingJob.node.addDependency(deployGlueScripts);
 
+    // Glue Job that preloads faq_cache from frequently asked questions
+    const faqWarmupJob = new glue.CfnJob(this, "FaqWarmupJob", {
+      name: `${id}-faq-warmup-job`,
+      role: glueJobRole.roleArn,
+      command: {
+        name: "glueetl",
+        scriptLocation: `s3://${this.glueBucket.bucketName}/glue/scripts/faq_warmup.py`,
+        pythonVersion: PYTHON_VER,
+      },
+      defaultArguments: {
+        "--job-language": "python",
+        "--job-bookmark-option": "job-bookmark-disable",
+        "--enable-metrics": "true",
+        "--enable-continuous-cloudwatch-log": "true",
+        "--library-set": "analytics",
+        "--GLUE_BUCKET": this.glueBucket.bucketName,
+        "--region_name": this.region,
+        "--rds_secret": databaseStack.secretPathAdminName,
+        "--rds_proxy_endpoint": databaseStack.rdsProxyEndpoint,
+        "--TempDir": `s3://${this.glueBucket.bucketName}/temp/faq-warmup/`,
+        "--additional-python-modules": PYTHON_LIBS,
+        "--embedding_model_id": `cohere.embed-v4:0`,
+        // Warm-up configuration
+        "--lookback_days": "30",
+        "--min_cluster_size": "3", // Minimum asks before a question is preloaded
+        "--max_questions_per_textbook": "5000",
+        "--textbook_id": "all",
+        "--dry_run": "false",
+      },
+      connections: {
+        connections: [this.glueConnection.ref],
+      },
+      executionProperty: { maxConcurrentRuns: 1 },
+      maxRetries: MAX_RETRIES,
+      maxCapacity: MAX_CAPACITY,
+      timeout: 120,
+      glueVersion: GLUE_VER,
+    });
+
+    faqWarmupJob.node.addDependency(deployGlueScripts);
+
+    // Run the FAQ warm-up nightly, off peak (10:00 UTC = 02:00/03:00 Pacific)
+    new glue.CfnTrigger(this, "FaqWarmupSchedule", {
+      name: `${id}-faq-warmup-schedule`,
+      type: "SCHEDULED",
+      schedule: "cron(0 10 * * ? *)",
+      startOnCreation: true,
+      actions: [{ jobName: faqWarmupJob.name }],
+    }).addDependency(faqWarmupJob);
+
+    // Glue Job that pre-generates practice material items per section
+    const practicePoolJob = new glue.CfnJob(this, "PracticePoolJob", {
+      name: `${id}-practice-pool-job`,
+      role: glueJobRole.roleArn,
+      command: {
+        name: "glueetl",
+        scriptLocation: `s3://${this.glueBucket.bucketName}/glue/scripts/practice_pool_generation.py`,
+        pythonVersion: PYTHON_VER,
+      },
+      defaultArguments: {
+        "--job-language": "python",
+        "--job-bookmark-option": "job-bookmark-disable",
+        "--enable-metrics": "true",
+        "--enable-continuous-cloudwatch-log": "true",
+        "--library-set": "analytics",
+        "--GLUE_BUCKET": this.glueBucket.bucketName,
+        "--region_name": this.region,
+        "--rds_secret": databaseStack.secretPathAdminName,
+        "--rds_proxy_endpoint": databaseStack.rdsProxyEndpoint,
+        "--TempDir": `s3://${this.glueBucket.bucketName}/temp/practice-pool/`,
+        "--additional-python-modules": PYTHON_LIBS,
+        "--extra-py-files": PRACTICE_GENERATOR_MODULES.map(
+          (module) =>
+            `s3://${this.glueBucket.bucketName}/glue/libs/practice_generators/${module}`
+        ).join(","),
+        "--embedding_model_id": `cohere.embed-v4:0`,
+        "--llm_model_id": "meta.llama3-70b-instruct-v1:0",
+        "--bedrock_region": this.region,
+        // Pool configuration
+        "--textbook_id": "all", // Set per run by data_processing after ingestion
+        "--difficulties": "beginner,intermediate,advanced",
+        "--items_per_type": "5",
+        "--max_sections_per_run": "500",
+        "--refresh": "false", // Only sections without pool items
+        "--dry_run": "false",
+      },
+      connections: {
+        connections: [this.glueConnection.ref],
+      },
+      executionProperty: { maxConcurrentRuns: MAX_CONCURRENT_RUNS },
+      maxRetries: MAX_RETRIES,
+      maxCapacity: MAX_CAPACITY,
+      timeout: 480,
+      glueVersion: GLUE_VER,
+    });
+
+    practicePoolJob.node.addDependency(deployGlueScripts);
+    practicePoolJob.node.addDependency(deployPracticeGenerators);
+
+    // Nightly catch-up for sections that have no pool items yet (11:00 UTC,
+    // after the FAQ warm-up)
+    new glue.CfnTrigger(this, "PracticePoolSchedule", {
+      name: `${id}-practice-pool-schedule`,
+      type: "SCHEDULED",
+      schedule: "cron(0 11 * * ? *)",
+      startOnCreation: true,
+      actions: [{ jobName: practicePoolJob.name }],
+    }).addDependency(practicePoolJob);
+
     // Create Lambda function to process SQS messages and trigger Glue jobs
     const jobProcessorRole = new iam.Role(this, `${id}-JobProcessorRole`, {
       assumedBy: new iam.ServicePrincipal("lambda.amazonaws.com"),
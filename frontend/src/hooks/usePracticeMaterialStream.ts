@@ -9,6 +9,19 @@ interface PracticeMaterialProgress {
     error?: string;
 }
 
+interface PracticeMaterialItem {
+    type: "practice_material_item";
+    material_type: "mcq" | "flashcard" | "short_answer";
+    index: number;
+    total: number;
+    item: any;
+}
+
+interface PracticeMaterialReset {
+    type: "practice_material_reset";
+    material_type: "mcq" | "flashcard" | "short_answer";
+}
+
 export interface PracticeMaterialResult {
     title: string;
     questions?: any[];
@@ -34,6 +47,8 @@ interface UsePracticeMaterialStreamReturn {
     status: PracticeMaterialProgress["status"] | "idle";
     progress: number;
     result: PracticeMaterialResult | null;
+    // Questions/cards received so far, before the complete result arrives
+    items: any[];
     error: string | null;
     isGenerating: boolean;
     isConnected: boolean;
@@ -45,7 +60,8 @@ interface UsePracticeMaterialStreamReturn {
  * Progress stages:
  * - initializing (5-10%): Loading models and credentials
  * - retrieving (15-30%): Fetching relevant content from textbook
- * - generating (35-85%): LLM generating questions/cards
+ * - generating (35-85%): LLM generating questions/cards (each finished item
+ *   arrives as a practice_material_item message and is exposed via `items`)
  * - validating (85-95%): Parsing and validating response
  * - complete (100%): Done!
  */
@@ -55,11 +71,31 @@ export const usePracticeMaterialStream = (
     const [status, setStatus] = useState<PracticeMaterialProgress["status"] | "idle">("idle");
     const [progress, setProgress] = useState(0);
     const [result, setResult] = useState<PracticeMaterialResult | null>(null);
+    const [items, setItems] = useState<any[]>([]);
     const [error, setError] = useState<string | null>(null);
     // Use state instead of ref for reactivity - UI will re-render when this changes
     const [isGenerating, setIsGenerating] = useState(false);
 
     const handleMessage = useCallback((message: any) => {
+        // Items streamed while the set is still being generated
+        if (message.type === "practice_material_item") {
+            const itemMsg = message as PracticeMaterialItem;
+            setItems((prev) => {
+                const next = [...prev];
+                next[itemMsg.index] = itemMsg.item;
+                return next;
+            });
+            return;
+        }
+
+        // Generation restarted (e.g. sharding fell back to a single prompt);
+        // drop the items streamed by the earlier attempt
+        if (message.type === "practice_material_reset") {
+            console.log("[PracticeMaterialStream] Items reset for", (message as PracticeMaterialReset).material_type);
+            setItems([]);
+            return;
+        }
+
         // Only handle practice material progress messages
         if (message.type !== "practice_material_progress") {
             return;
@@ -74,12 +110,14 @@ export const usePracticeMaterialStream = (
         if (progressMsg.status === "complete") {
             console.log("[PracticeMaterialStream] Complete! Data received:", progressMsg.data);
             console.log("[PracticeMaterialStream] Questions count:", progressMsg.data?.questions?.length);
-            // Set result even if data is missing (will be null)
+            // Set result even if data is missing (will be null); it replaces the streamed items
             setResult(progressMsg.data ?? null);
+            setItems([]);
             // Always stop generating on complete, even if data is missing
             setIsGenerating(false);
         } else if (progressMsg.status === "error") {
             setError(progressMsg.error || "Unknown error");
+            setItems([]);
             setIsGenerating(false);
         }
     }, []);
@@ -124,6 +162,7 @@ export const usePracticeMaterialStream = (
         setStatus("initializing");
         setProgress(0);
         setResult(null);
+        setItems([]);
         setError(null);
         setIsGenerating(true);
 
@@ -155,6 +194,7 @@ export const usePracticeMaterialStream = (
         setStatus("idle");
         setProgress(0);
         setResult(null); // Clear result on cancel
+        setItems([]);
         setError(null);
     }, []);
 
@@ -169,6 +209,7 @@ export const usePracticeMaterialStream = (
         status,
         progress,
         result,
+        items,
         error,
         isGenerating,
         isConnected,
@@ -1,10 +1,12 @@
 import { useEffect, useRef, useCallback, useState } from "react";
 
 interface WebSocketMessage {
-  type: "start" | "chunk" | "complete" | "error" | "pong";
+  type: "start" | "chunk" | "complete" | "session_name" | "error" | "pong";
   content?: string;
   message?: string;
   sources?: string[];
+  session_name?: string;
+  chat_session_id?: string;
 }
 
 interface UseWebSocketOptions {
@@ -216,6 +216,16 @@ export default function AIChatPage() {
           }
           break;
 
+        case "session_name":
+          // Sent after "complete" once the session title has been generated
+          if (message.session_name) {
+            const sessionId = message.chat_session_id || activeChatSessionId;
+            if (sessionId) {
+              updateChatSessionName(sessionId, message.session_name);
+            }
+          }
+          break;
+
         case "error":
           setIsStreaming(false);
           setStreamingMessageId(null);
@@ -93,6 +93,7 @@ export default function PracticeMaterialPage() {
     status,
     progress,
     result,
+    items: streamedItems,
     error: streamError,
     isConnected,
   } = usePracticeMaterialStream(wsUrl);
@@ -180,6 +181,16 @@ export default function PracticeMaterialPage() {
                 <p className="text-center text-sm text-muted-foreground">
                   Generating practice materials...
                 </p>
+                {/* Preview of questions/cards generated so far */}
+                {streamedItems.some(Boolean) && (
+                  <ol className="list-decimal list-inside space-y-1 text-sm">
+                    {streamedItems.map((item, index) =>
+                      item ? (
+                        <li key={index}>{item.questionText ?? item.front}</li>
+                      ) : null
+                    )}
+                  </ol>
+                )}
               </div>
             </Card>
           ) : materials.length === 0 ? (